@@ -24,7 +24,7 @@ from   argparse import ArgumentParser
 sys.path.append(os.path.join(
   os.path.dirname(sys.argv[0]),"../lib"))
 
-from webradio import *
+from webradio import WebRadio
 
 # --- helper class for options   --------------------------------------------
 
@@ -59,6 +59,10 @@ def get_parser():
     dest='do_info',
     help='recursively create mp3-info files in root directory')
 
+  parser.add_argument('-C', '--config', metavar='config-file',
+    dest='config', default='/etc/pi-webradio.conf',
+    help="configuration file (default: /etc/pi-webradio.conf)")
+
   parser.add_argument('-d', '--debug', action='store_true',
     dest='debug', default=False,
     help="force debug-mode (overrides config-file)")
@@ -110,6 +114,7 @@ def process_events(app,options,queue):
 def create_mp3info(app,root_dir):
   """ create mp3info files """
 
+  from webradio import MP3Info
   mp3info = MP3Info(app)
   mp3info.write_dirinfo(root_dir)
 
@@ -134,7 +139,7 @@ if __name__ == '__main__':
 
   if options.do_list:
     if not options.quiet:
-      app.msg("pi-webradio version %s" % app.api.get_version(),force=True)
+      app.msg("pi-webradio version %s",app.api.get_version(),force=True)
     channels = app.api.radio_get_channels()
     PRINT_CHANNEL_FMT="{0:2d}: {1}"
     for channel in channels:
@@ -145,7 +150,7 @@ if __name__ == '__main__':
     ev_queue = app.api._add_consumer("main")
     threading.Thread(target=process_events,args=(app,options,ev_queue)).start()
     if options.do_record:
-      app.api.rec_start(nr=int(options.channel),sync=True)
+      app.api._rec_start(nr=int(options.channel),sync=True)
       app.cleanup()
     elif options.do_play:
       try:
@@ -114,7 +114,7 @@ class RadioCli(object):
   def msg(self,text,force=False):
     """ print message """
 
-    self._cli.msg(text,force)
+    self._cli.msg(text,force=force)
 
   # --- dump output of API   -------------------------------------------------
 
@@ -12,6 +12,7 @@
 
 import locale, os, sys, json, traceback
 from webradio_cli import RadioCli
+from webradio import ThumbCache
 
 try:
   from ST7789 import ST7789
@@ -45,6 +46,7 @@ class PirateAudio(RadioCli):
     SPI_SPEED_MHZ = 80
 
     self._last_logo = ""
+    self._thumbs    = ThumbCache(debug=self.debug)
 
     self._screen = ST7789(
       rotation=90,  # Needed to display the right way up on Pirate Audio
@@ -71,10 +73,13 @@ class PirateAudio(RadioCli):
     self.msg("PirateAudio: logo-file: %s" % logo_file)
 
     try:
-      img = None
-      im  = Image.open(logo_file)
-      img = im.resize((240,240))
-      im.close()
+      # the thumbnail-cache returns a pre-scaled 240x240 image
+      thumb = self._thumbs.get(os.path.realpath(logo_file),'lcd')
+      with Image.open(thumb) as im:
+        if im.size == (240,240):
+          img = im.copy()
+        else:
+          img = im.resize((240,240))
       self._screen.display(img)
       self._last_logo = logo
     except:
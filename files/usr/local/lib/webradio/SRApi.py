@@ -12,16 +12,30 @@
 #
 # ----------------------------------------------------------------------------
 
+import sys, time, json, threading, traceback, collections
+
 from webradio import Base
 
 class Api(Base):
   """ The class holds References to all API-functions """
 
+  SLOW_CALLS  = 20                   # keep the last x slow calls
+  STACK_DEPTH = 12                   # sample the innermost x frames
+
   def __init__(self,app):
     """ initialization """
 
     self._app          = app
     self.debug         = app.debug
+    self._active       = {}          # thread-id -> [name,args,start,stack]
+    self._slow_calls   = collections.deque(maxlen=Api.SLOW_CALLS)
+
+    # section [GLOBAL]
+    self._slow_call = int(self.get_value(app.parser,"GLOBAL",
+                                         "slow_call",1000))/1000
+    if self._slow_call > 0:
+      threading.Thread(target=self._sample_stacks,name="Api",
+                       daemon=True).start()
 
   # --- execute API by name   ------------------------------------------------
 
@@ -29,12 +43,63 @@ class Api(Base):
     """ execute an API by name """
 
     if hasattr(self,name):
-      self.msg("executing: %s(%r)" % (name,dict(**args)))
-      return getattr(self,name)(**args)
+      self.msg("executing: %s(%r)",name,dict(**args))
+      tid   = threading.get_ident()
+      call  = [name,args,time.monotonic(),None]
+      self._active[tid] = call
+      try:
+        return getattr(self,name)(**args)
+      finally:
+        del self._active[tid]
+        self._trace(call,time.monotonic()-call[2])
     else:
-      self.msg("unknown API-method %s" % name)
+      self.msg("unknown API-method %s",name)
       raise NotImplementedError("API %s not implemented" % name)
 
+  # --- record timing of a call   --------------------------------------------
+
+  def _trace(self,call,duration):
+    """ record duration of call and log slow calls """
+
+    self._app.metrics.observe('webradio_api_call_seconds',duration,api=call[0])
+    if not self._slow_call or duration < self._slow_call:
+      return
+    entry = {'time':     time.strftime("%Y-%m-%d %H:%M:%S"),
+             'api':      call[0],
+             'args':     call[1],
+             'duration': round(duration,3),
+             'stack':    call[3]}
+    self._slow_calls.append(entry)
+    self.msg("[WARNING] Api: slow call: %s",json.dumps(entry,default=str),
+             force=True)
+
+  # --- sample stacks of slow calls (thread)   ---------------------------------
+
+  def _sample_stacks(self):
+    """ record the stack of every call once it exceeds the threshold """
+
+    interval = max(self._slow_call/2,0.05)
+    while not self._app.stop_event.wait(interval):
+      if not self._active:
+        continue
+      now    = time.monotonic()
+      frames = None
+      for tid,call in list(self._active.items()):
+        if call[3] is not None or now-call[2] < self._slow_call:
+          continue
+        if frames is None:
+          frames = sys._current_frames()
+        if tid in frames:
+          stack   = traceback.format_stack(frames[tid],Api.STACK_DEPTH)
+          call[3] = [line.rstrip() for line in stack]
+
+  # --- return slow calls   ----------------------------------------------------
+
+  def get_slow_calls(self):
+    """ return the last slow calls (newest first) """
+
+    return list(reversed(self._slow_calls))
+
   # --- return list of APIs   ------------------------------------------------
 
   def get_api_list(self):
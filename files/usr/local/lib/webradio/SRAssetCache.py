@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class AssetCache
+#
+# The class AssetCache keeps static web-assets (css, js, webfonts, images)
+# in memory together with a content-hash and pre-compressed variants.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, re, gzip, hashlib, mimetypes, threading, traceback
+
+from webradio import Base
+
+# brotli is optional
+try:
+  import brotli
+  have_brotli = True
+except:
+  have_brotli = False
+
+class AssetCache(Base):
+  """ cache for static web-assets """
+
+  MIN_COMPRESS  = 512                  # don't compress smaller files
+  HASH_LEN      = 16                   # length of version-hash
+  NO_COMPRESS   = ('image/png','image/jpeg','image/gif','font/woff',
+                   'font/woff2','application/font-woff')
+  CSS_URL       = re.compile(r'url\((["\']?)([^"\')?#]+)([^"\')]*)\1\)')
+
+  def __init__(self,app,web_root):
+    """ initialization """
+
+    self._app      = app
+    self.debug     = app.debug
+    self._web_root = os.path.realpath(web_root)
+    self._lock     = threading.Lock()
+    self._assets   = {}
+    self._urls     = set()             # paths referenced with url()
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [WEB]
+    self._max_age = int(self.get_value(self._app.parser,"WEB",
+                                       "cache_max_age",31536000))
+
+  # --- return cache-control header for an asset   ---------------------------
+
+  def cache_control(self,versioned):
+    """ versioned assets never change, all others must be revalidated """
+
+    if versioned:
+      return "public, max-age=%d, immutable" % self._max_age
+    else:
+      return "no-cache"
+
+  # --- return versioned url of asset   ---------------------------------------
+
+  def url(self,path):
+    """ return url with version-tag (used from templates) """
+
+    asset = self.get(path)
+    if asset:
+      self._urls.add(path)
+      return "%s?v=%s" % (path,asset['etag'])
+    else:
+      return path
+
+  # --- return version of referenced assets   --------------------------------
+
+  def version(self):
+    """ return current version-tags of all assets referenced with url().
+        A page rendered with url() is outdated if this value changes.
+    """
+
+    version = []
+    for path in sorted(self._urls):
+      asset = self.get(path)
+      version.append((path,asset['etag'] if asset else None))
+    return tuple(version)
+
+  # --- return asset   --------------------------------------------------------
+
+  def get(self,path):
+    """ return asset for path relative to the web-root (or None) """
+
+    fullpath = os.path.realpath(os.path.join(self._web_root,path))
+    if not os.path.commonpath([self._web_root,fullpath]) == self._web_root:
+      self.msg("[WARNING] AssetCache: %s is not child of web-root",
+               path,force=True)
+      return None
+    try:
+      mtime = os.path.getmtime(fullpath)
+    except OSError:
+      return None
+
+    asset = self._assets.get(fullpath)
+    if asset and asset['mtime'] == mtime:
+      return asset
+
+    try:
+      asset = self._load(fullpath,mtime)
+    except:
+      self.msg("AssetCache: could not load %s",fullpath)
+      if self.debug:
+        traceback.print_exc()
+      return None
+    with self._lock:
+      self._assets[fullpath] = asset
+    return asset
+
+  # --- add in-memory asset (e.g. a pre-rendered page)   ----------------------
+
+  def create(self,data,mimetype):
+    """ create asset from the given data (not cached) """
+
+    return self._create(data,mimetype,0,None)
+
+  # --- load all assets of the given directories   ---------------------------
+
+  def preload(self,*dirs):
+    """ load (and compress) all assets below the given directories """
+
+    for d in dirs:
+      for root,_,files in os.walk(os.path.join(self._web_root,d)):
+        for f in files:
+          if f.endswith(".gz") or f.endswith(".br"):
+            continue
+          self.get(os.path.relpath(os.path.join(root,f),self._web_root))
+    self.msg("AssetCache: preloaded %d assets",len(self._assets))
+
+  # --- load a single asset   -------------------------------------------------
+
+  def _load(self,fullpath,mtime):
+    """ load asset from disk """
+
+    mimetype,_ = mimetypes.guess_type(fullpath)
+    if not mimetype:
+      mimetype = "application/octet-stream"
+    with open(fullpath,"rb") as f:
+      data = f.read()
+    if mimetype == "text/css":
+      data = self._rewrite_css(fullpath,data)
+    self.msg("AssetCache: loading %s (%s, %d bytes)",
+             fullpath,mimetype,len(data))
+    return self._create(data,mimetype,mtime,fullpath)
+
+  # --- create asset-entry (with compressed variants)   -----------------------
+
+  def _create(self,data,mimetype,mtime,fullpath):
+    """ create asset dict with hash and compressed variants """
+
+    asset = {
+      'mtime':    mtime,
+      'mimetype': mimetype,
+      'etag':     hashlib.sha1(data).hexdigest()[:AssetCache.HASH_LEN],
+      'data':     {'identity': data}
+      }
+    if (len(data) < AssetCache.MIN_COMPRESS or
+        mimetype in AssetCache.NO_COMPRESS):
+      return asset
+
+    # use pre-compressed files if available and up to date
+    # (css is rewritten, so precompressed css-files are never valid)
+    if fullpath and not mimetype == "text/css":
+      for enc,ext in [('gzip','.gz'),('br','.br')]:
+        if (os.path.exists(fullpath+ext) and
+            os.path.getmtime(fullpath+ext) >= mtime):
+          with open(fullpath+ext,"rb") as f:
+            asset['data'][enc] = f.read()
+
+    if not 'gzip' in asset['data']:
+      asset['data']['gzip'] = gzip.compress(data,9)
+    if have_brotli and not 'br' in asset['data']:
+      asset['data']['br'] = brotli.compress(data)
+    return asset
+
+  # --- add version-tags to urls within css   ---------------------------------
+
+  def _rewrite_css(self,fullpath,data):
+    """ add version-tags to relative urls (e.g. webfonts) """
+
+    css_dir = os.path.dirname(fullpath)
+
+    def repl(m):
+      quote,path,rest = m.group(1),m.group(2),m.group(3)
+      if path.startswith("/") or ":" in path or rest.startswith("?"):
+        return m.group(0)
+      target = os.path.relpath(os.path.normpath(os.path.join(css_dir,path)),
+                               self._web_root)
+      asset = self.get(target)
+      if not asset:
+        return m.group(0)
+      return "url(%s%s?v=%s%s%s)" % (quote,path,asset['etag'],rest,quote)
+
+    text = data.decode('utf-8')
+    return AssetCache.CSS_URL.sub(repl,text).encode('utf-8')
@@ -12,21 +12,53 @@
 #
 # -----------------------------------------------------------------------------
 
-import sys, time
+import sys, time, logging
+
+# all messages go to this logger. Without a configured Logger-object
+# (see SRLogger.py) messages are written synchronously to stderr
+LOGGER = logging.getLogger("webradio")
+
+class _Formatter(logging.Formatter):
+  """ format records like the original debug-messages """
+
+  def format(self,record):
+    text = record.getMessage()
+    if record.levelno == logging.DEBUG:
+      return "[DEBUG %s] %s" % (time.strftime("%H:%M:%S",
+                                  time.localtime(record.created)),text)
+    return text
+
+if not LOGGER.handlers:
+  _handler = logging.StreamHandler(sys.stderr)
+  _handler.setFormatter(_Formatter())
+  LOGGER.addHandler(_handler)
+  LOGGER.setLevel(logging.DEBUG)
+  LOGGER.propagate = False
 
 class Base:
   """ base class with common methods """
 
   # --- print debug messages   ------------------------------------------------
 
-  def msg(self,text,force=False):
-    """ print debug-message """
+  def msg(self,text,*args,force=False):
+    """ log message. Arguments are only merged into text (%-format) if
+        the message is really logged. Forced messages are logged with
+        level INFO, WARNING or ERROR (depending on the prefix of text),
+        all other messages with level DEBUG (only in debug-mode)
+    """
 
     if force:
-      sys.stderr.write("%s\n" % text)
+      if text.startswith("[WARNING]"):
+        level = logging.WARNING
+      elif text.startswith("[ERROR]"):
+        level = logging.ERROR
+      else:
+        level = logging.INFO
     elif self.debug:
-      sys.stderr.write("[DEBUG %s] %s\n" % (time.strftime("%H:%M:%S"),text))
-    sys.stderr.flush()
+      level = logging.DEBUG
+    else:
+      return
+    LOGGER.log(level,text,*args)
 
   # --- read configuration value   --------------------------------------------
 
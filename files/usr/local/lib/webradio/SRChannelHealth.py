@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class ChannelHealth
+#
+# The class ChannelHealth periodically probes all channels in the
+# background. It measures connect-time and time to the first audio-byte
+# and caches the results.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import time, datetime, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from webradio import Base, IcyStream
+
+class ChannelHealth(Base):
+  """ background prober for channels """
+
+  PROBE_BYTES = 4096                   # read at most x bytes per probe
+  START_DELAY = 30                     # first round x seconds after start
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app        = app
+    self._api        = app.api
+    self.debug       = app.debug
+    self._stop_event = app.stop_event
+    self._lock       = threading.Lock()
+    self._results    = {}              # url -> result
+    self._wakeup     = threading.Event()
+
+    self.read_config()
+    self.register_apis()
+    if self._interval > 0:
+      threading.Thread(target=self._run,name="ChannelHealth",
+                       daemon=True).start()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [RADIO]
+    self._interval = 60*int(self.get_value(self._app.parser,"RADIO",
+                                           "probe_interval",30))
+    self._workers  = int(self.get_value(self._app.parser,"RADIO",
+                                        "probe_workers",2))
+    self._timeout  = int(self.get_value(self._app.parser,"RADIO",
+                                        "probe_timeout",5))
+
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api.radio_channel_health = self.radio_channel_health
+    self._api.radio_probe_channels = self.radio_probe_channels
+    self._api._channel_alive       = self._channel_alive
+
+  # --- return health of channels   ------------------------------------------
+
+  def radio_channel_health(self,nr=None):
+    """ return health of all channels (or of channel nr) """
+
+    if nr:
+      channels = [self._api.radio_get_channel(nr)]
+    else:
+      channels = self._api.radio_get_channels()
+    with self._lock:
+      return [dict(self._results.get(c['url'],{'status': 'unknown'}),
+                   nr=c['nr'],name=c['name']) for c in channels]
+
+  # --- start probing now   ---------------------------------------------------
+
+  def radio_probe_channels(self):
+    """ start a probe-round now (returns False if probing is disabled) """
+
+    if self._interval <= 0:
+      self.msg("ChannelHealth: probing disabled (probe_interval: 0)")
+      return False
+    self._wakeup.set()
+    return True
+
+  # --- stop prober   ---------------------------------------------------------
+
+  def stop(self):
+    """ wake up prober-thread so it can terminate """
+
+    self._wakeup.set()
+
+  # --- check if channel is alive   ------------------------------------------
+
+  def _channel_alive(self,url):
+    """ return False if the last probe of url failed """
+
+    with self._lock:
+      result = self._results.get(url)
+    return not result or result['status'] != 'dead'
+
+  # --- probe a single channel   ---------------------------------------------
+
+  def _probe(self,url):
+    """ open channel and measure connect-time and time to first byte """
+
+    start  = time.monotonic()
+    result = {'checked': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    try:
+      conn,_ = IcyStream.open(url,timeout=self._timeout)
+      with conn:
+        result['connect'] = int(1000*(time.monotonic()-start))
+        if not conn.read1(ChannelHealth.PROBE_BYTES):
+          raise ValueError("no data")
+        result['ttfb']    = int(1000*(time.monotonic()-start))
+        result['status']  = 'ok'
+    except Exception as ex:
+      result['status'] = 'dead'
+      result['error']  = str(ex)
+    self.msg("ChannelHealth: %s: %r",url,result)
+    return result
+
+  # --- probe all channels   -------------------------------------------------
+
+  def _probe_all(self):
+    """ probe all channels with a bounded number of workers """
+
+    urls = list(dict.fromkeys(c['url'] for c in self._api.radio_get_channels()))
+    with ThreadPoolExecutor(max_workers=self._workers) as executor:
+      results = dict(zip(urls,executor.map(self._probe,urls)))
+    with self._lock:
+      self._results = results
+
+    dead = [c['nr'] for c in self._api.radio_get_channels()
+            if not self._channel_alive(c['url'])]
+    ok   = len([r for r in results.values() if r['status'] == 'ok'])
+    self._api._push_event({'type': 'radio_channel_health',
+                           'value': {'ok': ok, 'dead': dead}})
+
+  # --- prober-thread   --------------------------------------------------------
+
+  def _run(self):
+    """ probe channels periodically """
+
+    self.msg("ChannelHealth: starting prober-thread")
+    self._wakeup.wait(ChannelHealth.START_DELAY)
+    while not self._stop_event.is_set():
+      self._wakeup.clear()
+      try:
+        self._probe_all()
+      except:
+        self.msg("[WARNING] ChannelHealth: probing channels failed",force=True)
+        if self.debug:
+          traceback.print_exc()
+      self._wakeup.wait(self._interval)
+    self.msg("ChannelHealth: stopping prober-thread")
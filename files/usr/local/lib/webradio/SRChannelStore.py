@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class ChannelStore
+#
+# The class ChannelStore manages the channel-file. It keeps the parsed
+# channel-list in memory, serializes all modifications and writes the
+# channel-file atomically. If the directory of the channel-file is not
+# writable (e.g. /etc), modifications are written to a copy in the
+# home-directory of the user. The newer of both files is used.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, json, threading, traceback, tempfile
+
+from webradio import Base, ThumbCache
+
+class ChannelStore(Base):
+  """ in-memory channel-list backed by the channel-file """
+
+  CHECK_INTERVAL = 5        # check channel-file for changes every x seconds
+  USER_FILE      = os.path.join(os.path.expanduser("~"),".pi-webradio.channels")
+
+  def __init__(self,app,channel_file,web_root):
+    """ initialization """
+
+    self._api          = app.api
+    self.debug         = app.debug
+    self._channel_file = channel_file
+    self._file         = channel_file     # file in use (see _active_file)
+    self._web_root     = web_root
+
+    self.lock      = threading.RLock()    # serializes reads and writes
+    self._raw      = []                    # entries as stored in the file
+    self._channels = []                    # entries with nr, logo, thumbs
+    self._names    = {}                    # name (lower case) -> index
+    self._mtime    = None                  # mtime of parsed channel-file
+    self._check    = 0                     # time of last mtime-check
+
+  # --- return channel-list   -------------------------------------------------
+
+  def get_channels(self):
+    """ return current channel-list (must not be modified by the caller) """
+
+    self.check()
+    return self._channels
+
+  # --- read channels   -------------------------------------------------------
+
+  def read(self):
+    """ read channel-file """
+
+    with self.lock:
+      try:
+        self._file = self._active_file()
+        self.msg("ChannelStore: Loading channels from %s",self._file)
+        mtime = os.path.getmtime(self._file)
+        with open(self._file,"r") as f:
+          raw = json.load(f)
+        self._update(raw)
+        self._mtime = mtime
+        self._check = time.monotonic()
+        return True
+      except:
+        self.msg("ChannelStore: Loading channels failed")
+        if self.debug:
+          traceback.print_exc()
+        return False
+
+  # --- return channel-file in use   -----------------------------------------
+
+  def _active_file(self):
+    """ return the newer of the channel-file and the copy of the user """
+
+    files = [f for f in [self._channel_file,ChannelStore.USER_FILE]
+             if os.path.exists(f)]
+    if not files:
+      return self._channel_file
+    return max(files,key=os.path.getmtime)
+
+  # --- reload channels if necessary   ---------------------------------------
+
+  def check(self):
+    """ reload channels if the channel-file changed (the check itself
+        is rate-limited, so normal operation does not touch the disk)
+    """
+
+    now = time.monotonic()
+    if now - self._check < ChannelStore.CHECK_INTERVAL:
+      return
+    self._check = now
+    try:
+      file  = self._active_file()
+      mtime = os.path.getmtime(file)
+    except OSError:
+      return
+    if file != self._file or mtime != self._mtime:
+      self.msg("ChannelStore: channel-file changed")
+      self.read()
+
+  # --- add channel   ---------------------------------------------------------
+
+  def add(self,name,url,logo=None,nr=None):
+    """ add channel (before channel nr, default: append).
+        Returns map old channel-number -> new channel-number
+    """
+
+    with self.lock:
+      self.check()
+      if name.lower() in self._names:
+        raise ValueError("channel %s already exists" % name)
+      raw   = list(self._raw)
+      order = list(range(len(raw)))
+      entry = {'name': name, 'url': url, 'logo': logo}
+      if nr is None:
+        raw.append(entry)
+        order.append(None)
+      else:
+        index = self._index(nr,len(raw)+1)
+        raw.insert(index,entry)
+        order.insert(index,None)
+      return self._write(raw,order)
+
+  # --- remove channel   ------------------------------------------------------
+
+  def remove(self,nr):
+    """ remove channel nr (returns map of channel-numbers, see add()) """
+
+    with self.lock:
+      self.check()
+      raw   = list(self._raw)
+      order = list(range(len(raw)))
+      index = self._index(nr,len(raw))
+      del raw[index]
+      del order[index]
+      return self._write(raw,order)
+
+  # --- move channel   --------------------------------------------------------
+
+  def move(self,nr,to):
+    """ move channel nr to position to (returns map of channel-numbers,
+        see add())
+    """
+
+    with self.lock:
+      self.check()
+      raw   = list(self._raw)
+      order = list(range(len(raw)))
+      old   = self._index(nr,len(raw))
+      entry = raw.pop(old)
+      order.pop(old)
+      index = self._index(to,len(raw)+1)
+      raw.insert(index,entry)
+      order.insert(index,old)
+      return self._write(raw,order)
+
+  # --- update channel   ------------------------------------------------------
+
+  def update(self,nr,name=None,url=None,logo=None):
+    """ update attributes of channel nr (returns map of channel-numbers,
+        see add())
+    """
+
+    with self.lock:
+      self.check()
+      raw   = list(self._raw)
+      index = self._index(nr,len(raw))
+      entry = dict(raw[index])
+      if name is not None:
+        if self._names.get(name.lower(),index) != index:
+          raise ValueError("channel %s already exists" % name)
+        entry['name'] = name
+      if url is not None:
+        entry['url'] = url
+      if logo is not None:
+        entry['logo'] = logo if logo else None
+      raw[index] = entry
+      return self._write(raw,list(range(len(raw))))
+
+  # --- convert channel-number to index   ------------------------------------
+
+  def _index(self,nr,max_nr):
+    """ convert channel-number (1..max_nr) to list-index """
+
+    nr = int(nr)
+    if nr < 1 or nr > max_nr:
+      raise ValueError("invalid channel number %d" % nr)
+    return nr-1
+
+  # --- write channel-file   --------------------------------------------------
+
+  def _write(self,raw,order):
+    """ write channel-file atomically and update list. order contains
+        the old index (or None) for every entry of raw. Returns map old
+        channel-number -> new channel-number
+    """
+
+    try:
+      self._write_file(self._channel_file,raw)
+      self._file = self._channel_file
+    except PermissionError:
+      # the directory is not writable (e.g. /etc): use copy of the user
+      self.msg("ChannelStore: %s not writable, saving channels to %s",
+               self._channel_file,ChannelStore.USER_FILE)
+      self._write_file(ChannelStore.USER_FILE,raw)
+      self._file = ChannelStore.USER_FILE
+
+    self._update(raw)
+    self._mtime = os.path.getmtime(self._file)
+    self._check = time.monotonic()
+    return {old+1: new+1 for new,old in enumerate(order) if old is not None}
+
+  # --- write file atomically   ----------------------------------------------
+
+  def _write_file(self,path,raw):
+    """ write to temp-file and rename (raises PermissionError if the
+        directory is not writable)
+    """
+
+    dir    = os.path.dirname(os.path.abspath(path))
+    fd,tmp = tempfile.mkstemp(dir=dir,prefix=".channels.")
+    try:
+      with os.fdopen(fd,"w") as f:
+        json.dump(raw,f,indent=2,ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+      try:
+        os.chmod(tmp,os.stat(self._channel_file).st_mode & 0o777)
+      except OSError:
+        os.chmod(tmp,0o644)
+      os.replace(tmp,path)
+    except:
+      os.remove(tmp)
+      raise
+
+  # --- update derived data   -------------------------------------------------
+
+  def _update(self,raw):
+    """ create channel-list with derived attributes and name-index """
+
+    channels = []
+    names    = {}
+    logos    = []
+    for index,entry in enumerate(raw):
+      channel = dict(entry)
+      channel['nr'] = index+1
+      names[channel['name'].lower()] = index
+      if 'logo' in channel and channel['logo'] is not None:
+        logo_path = os.path.join(self._web_root,"images",channel['logo'])
+        if os.path.exists(logo_path):
+          channel['logo'] = os.path.join("images",channel['logo'])
+          mtime_logo = int(os.path.getmtime(logo_path))
+          channel['thumbs'] = {
+            size: "thumbs/%s/%s?v=%d" % (size,channel['logo'],mtime_logo)
+            for size in ThumbCache.SIZES}
+          logos.append(logo_path)
+        else:
+          channel['logo'] = None
+      channels.append(channel)
+
+    # replace references (readers don't lock)
+    self._raw      = raw
+    self._names    = names
+    self._channels = channels
+    if hasattr(self._api,'_thumb_prefill'):
+      self._api._thumb_prefill(logos)
@@ -23,8 +23,12 @@ class EventFormatter(object):
     'icy_name': '{value}',
     'rec_start': 'recording {name} for {duration} minutes',
     'rec_stop': 'finished recording. File {file}, duration: {duration}m',
+    'rec_gap': 'gap in recording of {name}: {start} - {end} ({reason})',
     'vol_set': 'setting current volume to {value}',
     'radio_play_channel': 'start playing channel {nr} ({name})',
+    'radio_channels': 'channel-list updated ({value} channels)',
+    'radio_channel_health': 'channel-health: {ok} ok, dead: {dead}',
+    'radio_timeshift': 'time-shift: {delay}s behind live ({buffered}s buffered)',
     'play': 'playing {value}',
     'pause': 'pausing {value}',
     'keep_alive': 'current time: {value}',
@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class IcyStream
+#
+# The class IcyStream opens (ICY) audio-streams and filters the body of the
+# stream: it strips inline metadata-blocks, collects title-changes and
+# (for MP3) only passes complete MPEG-frames.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import re, urllib.request
+
+class IcyStream(object):
+  """ filter for ICY-streams """
+
+  # bitrates (kbit/s) indexed by (MPEG-version 1 or 2, layer)
+  _BITRATES = {
+    (1,1): [0,32,64,96,128,160,192,224,256,288,320,352,384,416,448],
+    (1,2): [0,32,48,56,64,80,96,112,128,160,192,224,256,320,384],
+    (1,3): [0,32,40,48,56,64,80,96,112,128,160,192,224,256,320],
+    (2,1): [0,32,48,56,64,80,96,112,128,144,160,176,192,224,256],
+    (2,2): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160],
+    (2,3): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160]
+    }
+  # sample-rates indexed by version-bits
+  _SAMPLERATES = {3: [44100,48000,32000],
+                  2: [22050,24000,16000],
+                  0: [11025,12000,8000]}
+
+  _TITLE = re.compile(rb"StreamTitle='(.*?)';",re.DOTALL)
+
+  TIMEOUT   = 15                       # timeout for connect and read (s)
+  PLAYLISTS = ['audio/x-mpegurl','audio/mpegurl','audio/x-scpls']
+
+  def __init__(self,metaint=0,align=True):
+    """ initialization """
+
+    self._align   = align
+    self._titles  = []                    # pending (position,title)
+    self._title   = None
+    self._pos     = 0.0                   # duration of emitted frames
+    self.reset(metaint)
+
+  # --- open stream (resolve playlists)   ------------------------------------
+
+  @staticmethod
+  def open(url,metadata=False,timeout=TIMEOUT,depth=0):
+    """ open stream and return connection and file-extension
+        (None for unknown content-types)
+    """
+
+    request = urllib.request.Request(url)
+    if metadata:
+      request.add_header('Icy-MetaData','1')
+    conn = urllib.request.urlopen(request,timeout=timeout)
+    content_type = conn.headers.get_content_type()
+    if content_type in IcyStream.PLAYLISTS or url.endswith((".m3u",".pls")):
+      # use first url of playlist
+      lines = conn.read(16384).decode('utf-8','replace').splitlines()
+      conn.close()
+      for line in lines:
+        line = line.strip()
+        if line.startswith("File") and "=" in line:
+          line = line.split("=",1)[1]                 # pls-format
+        if line.startswith("http") and depth < 3:
+          return IcyStream.open(line,metadata,timeout,depth+1)
+      raise ValueError("could not parse playlist %s" % url)
+    elif content_type in ['application/ogg','audio/ogg']:
+      return conn,'.ogg'
+    elif content_type == 'audio/mpeg':
+      return conn,'.mp3'
+    else:
+      return conn,None
+
+  # --- return metadata-interval of stream   ----------------------------------
+
+  @staticmethod
+  def metaint(conn):
+    """ return metadata-interval (0: server sends no metadata) """
+
+    try:
+      return int(conn.headers.get('icy-metaint',0))
+    except ValueError:
+      return 0
+
+  # --- reset state (e.g. after a reconnect)   --------------------------------
+
+  def reset(self,metaint=0):
+    """ reset state for a new connection """
+
+    self._metaint = metaint               # audio-bytes between metadata
+    self._audio   = metaint               # audio-bytes until next metadata
+    self._meta    = -1                    # metadata-bytes left (-1: length)
+    self._mdata   = bytearray()
+    self._pending = bytearray()           # audio-data of incomplete frame
+    self._out     = bytearray()
+    self._synced  = False
+
+  # --- current position (seconds of emitted audio)   -------------------------
+
+  def position(self):
+    """ return position in seconds (only available with alignment) """
+
+    return self._pos
+
+  # --- return and clear pending title-changes   ------------------------------
+
+  def pop_titles(self):
+    """ return list of (position,title) since the last call """
+
+    titles, self._titles = self._titles, []
+    return titles
+
+  # --- process data   ---------------------------------------------------------
+
+  def feed(self,data):
+    """ process data from stream, return clean audio-data. With alignment,
+        only complete frames are returned and the rest is kept until the
+        next call (or dropped by reset()).
+    """
+
+    self._out = bytearray()
+    if self._metaint:
+      self._strip_meta(data)
+    else:
+      self._add_audio(data)
+    return self._out
+
+  # --- add audio-data to output   --------------------------------------------
+
+  def _add_audio(self,data):
+    """ add audio-data to output (complete frames only, if aligned) """
+
+    if self._align:
+      self._pending += data
+      self._out     += self._frames()
+    else:
+      self._out += data
+
+  # --- strip metadata   -------------------------------------------------------
+
+  def _strip_meta(self,data):
+    """ remove metadata-blocks from data """
+
+    pos  = 0
+    size = len(data)
+    while pos < size:
+      if self._audio:
+        n = min(self._audio,size-pos)
+        self._add_audio(data[pos:pos+n])
+        self._audio -= n
+        pos += n
+      elif self._meta < 0:
+        self._meta = 16*data[pos]
+        pos += 1
+        if not self._meta:
+          self._end_meta()
+      else:
+        n = min(self._meta,size-pos)
+        self._mdata += data[pos:pos+n]
+        self._meta -= n
+        pos += n
+        if not self._meta:
+          self._end_meta()
+
+  # --- end of metadata-block   ------------------------------------------------
+
+  def _end_meta(self):
+    """ parse metadata and prepare for next block """
+
+    if self._mdata:
+      m = IcyStream._TITLE.search(self._mdata)
+      if m:
+        try:
+          title = m.group(1).decode('utf-8')
+        except UnicodeDecodeError:
+          title = m.group(1).decode('latin-1')
+        if title != self._title:
+          self._title = title
+          self._titles.append((self._pos,title))
+    self._mdata = bytearray()
+    self._meta  = -1
+    self._audio = self._metaint
+
+  # --- parse frame-header   ---------------------------------------------------
+
+  def _frame_info(self,pos):
+    """ return (length,samples,rate) of frame at pos or None """
+
+    b = self._pending
+    if b[pos] != 0xFF or (b[pos+1] & 0xE0) != 0xE0:
+      return None
+    version = (b[pos+1] >> 3) & 3
+    layer   = 4 - ((b[pos+1] >> 1) & 3)
+    br_idx  = b[pos+2] >> 4
+    sr_idx  = (b[pos+2] >> 2) & 3
+    padding = (b[pos+2] >> 1) & 1
+    if version == 1 or layer == 4 or br_idx in [0,15] or sr_idx == 3:
+      return None
+
+    v       = 1 if version == 3 else 2
+    bitrate = 1000*IcyStream._BITRATES[(v,layer)][br_idx]
+    rate    = IcyStream._SAMPLERATES[version][sr_idx]
+    if layer == 1:
+      return ((12*bitrate//rate + padding)*4,384,rate)
+    elif layer == 3 and v == 2:
+      return (72*bitrate//rate + padding,576,rate)
+    else:
+      return (144*bitrate//rate + padding,1152,rate)
+
+  # --- extract complete frames   ---------------------------------------------
+
+  def _frames(self):
+    """ return all complete frames of the pending data """
+
+    b    = self._pending
+    pos  = 0
+    out  = bytearray()
+    size = len(b)
+    while pos+4 <= size:
+      info = self._frame_info(pos)
+      if info and not self._synced:
+        # require a second valid header to avoid false syncs
+        if pos+info[0]+4 > size:
+          break
+        if not self._frame_info(pos+info[0]):
+          info = None
+      if not info:
+        self._synced = False
+        pos += 1
+        continue
+      length,samples,rate = info
+      if pos+length > size:
+        break
+      self._synced = True
+      self._pos   += samples/rate
+      out         += b[pos:pos+length]
+      pos         += length
+    del b[:pos]
+    return out
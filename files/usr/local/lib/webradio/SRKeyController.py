@@ -125,23 +125,23 @@ class KeyController(Base):
           event = evdev.util.categorize(event)
           if not isinstance(event, evdev.events.KeyEvent):
             continue
-          self.msg("KeyController: processing %s (%d)" %
-                   (event.keycode,event.keystate))
+          self.msg("KeyController: processing %s (%d)",
+                   event.keycode,event.keystate)
           if event.keystate == event.key_down:
             if event.keycode in KeyController.KEY_SPECIAL:
               special += 1
               continue
             elif special > 0:
-              self.msg("KeyController: ignoring %s" % event.keycode)
+              self.msg("KeyController: ignoring %s",event.keycode)
               continue
             if event.keycode in self._kmap:
               # key is mapped, yield api-name
-              self.msg("KeyController: mapping %s to %s" %
-                       (event.keycode,self._kmap[event.keycode]))
+              self.msg("KeyController: mapping %s to %s",
+                       event.keycode,self._kmap[event.keycode])
               yield self._kmap[event.keycode]
             else:
               # key is not mapped, ignore
-              self.msg("KeyController: ignoring %s" % event.keycode)
+              self.msg("KeyController: ignoring %s",event.keycode)
           elif event.keystate == event.key_up:
             if event.keycode in KeyController.KEY_SPECIAL:
               special = max(0,special-1)
@@ -164,15 +164,15 @@ class KeyController(Base):
           continue
 
         keycode = os.read(sys.stdin.fileno(), 3).hex()
-        self.msg("KeyController: processing %s" % keycode)
+        self.msg("KeyController: processing %s",keycode)
         if keycode in self._kmap:
           # key is mapped, yield api-name
-          self.msg("KeyController: mapping %s to %s" %
-                   (keycode,self._kmap[keycode]))
+          self.msg("KeyController: mapping %s to %s",
+                   keycode,self._kmap[keycode])
           yield self._kmap[keycode]
         else:
           # key is not mapped, ignore
-          self.msg("KeyController: ignoring %s" % keycode)
+          self.msg("KeyController: ignoring %s",keycode)
     finally:
       termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
 
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class Logger
+#
+# The class Logger configures the output of all messages (see Base.msg).
+# Messages are put into a queue and written by a separate thread, so
+# callers never wait for I/O. Output is either text or json and goes to
+# stderr or to the systemd-journal.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import sys, json, queue, atexit, logging, logging.handlers
+
+try:
+  from systemd import journal
+  have_journal = True
+except:
+  have_journal = False
+
+from webradio import Base
+from webradio.SRBase import LOGGER, _Formatter
+
+class Logger(Base):
+  """ configure queue-based logging """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self.debug = app.debug
+    self.read_config(app)
+
+    if self._target == "journal" and have_journal:
+      handler = journal.JournalHandler(SYSLOG_IDENTIFIER="pi-webradio")
+    else:
+      if self._target == "journal":
+        self.msg("[WARNING] Logger: python3-systemd not installed, using stderr",
+                 force=True)
+      handler = logging.StreamHandler(sys.stderr)
+    if self._format == "json":
+      handler.setFormatter(_JsonFormatter())
+    elif self._target != "journal" or not have_journal:
+      handler.setFormatter(_Formatter())
+
+    # messages are formatted by the caller (only if logged) and written
+    # by the listener-thread
+    self._queue    = queue.SimpleQueue()
+    self._listener = logging.handlers.QueueListener(self._queue,handler)
+    self._old      = LOGGER.handlers
+    LOGGER.handlers = [logging.handlers.QueueHandler(self._queue)]
+    self._listener.start()
+    atexit.register(self.stop)
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self,app):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._format = self.get_value(app.parser,"GLOBAL","log_format","text")
+    self._target = self.get_value(app.parser,"GLOBAL","log_target","stderr")
+
+  # --- stop logging-thread   -------------------------------------------------
+
+  def stop(self):
+    """ write pending messages and stop the logging-thread """
+
+    if self._listener:
+      self._listener.stop()
+      self._listener  = None
+      LOGGER.handlers = self._old
+
+# --- format messages as json   -----------------------------------------------
+
+class _JsonFormatter(logging.Formatter):
+  """ format record as a single line of json """
+
+  def format(self,record):
+    entry = {'time':  round(record.created,3),
+             'level': record.levelname,
+             'msg':   record.getMessage()}
+    if record.threadName != "MainThread":
+      entry['thread'] = record.threadName
+    return json.dumps(entry,ensure_ascii=False)
@@ -12,10 +12,92 @@
 #
 # -----------------------------------------------------------------------------
 
-import os, subprocess, re, json, traceback, eyed3
+import os, sys, subprocess, re, json, traceback
 
 from webradio import Base
 
+# --- compact file-info   ------------------------------------------------------
+
+class FileInfo(object):
+  """ file-info of a single file. Artist, album and comment are usually
+      the same for all files of a directory, so they are interned.
+      The dict-representation (see as_dict()) is only created for the API
+  """
+
+  __slots__ = ('fname','total','artist','album','track','title','comment',
+               'chapters')
+
+  def __init__(self,fname,total,artist,album,track,title,comment="",
+               chapters=None):
+    self.fname    = fname
+    self.total    = total
+    self.artist   = FileInfo._intern(artist)
+    self.album    = FileInfo._intern(album)
+    self.track    = tuple(track)
+    self.title    = title
+    self.comment  = FileInfo._intern(comment)
+    self.chapters = chapters
+
+  @staticmethod
+  def _intern(value):
+    return sys.intern(value) if isinstance(value,str) else value
+
+  # --- dict-like read-access   ---------------------------------------------
+
+  def __getitem__(self,key):
+    try:
+      return getattr(self,key)
+    except AttributeError:
+      raise KeyError(key)
+
+  def get(self,key,default=None):
+    value = getattr(self,key,None)
+    return default if value is None else value
+
+  # --- pretty print duration/time   ----------------------------------------
+
+  @staticmethod
+  def pp_time(seconds):
+    """ pritty-print time as mm:ss or hh:mm """
+
+    m, s = divmod(seconds,60)
+    h, m = divmod(m,60)
+    if h > 0:
+      return "{0:02d}:{1:02d}:{2:02d}".format(h,m,s)
+    else:
+      return "{0:02d}:{1:02d}".format(m,s)
+
+  # --- conversions   --------------------------------------------------------
+
+  def as_dict(self):
+    """ return new dict (the format of the API) """
+
+    info = {'total':        self.total,
+            'total_pretty': FileInfo.pp_time(self.total),
+            'fname':        self.fname,
+            'artist':       self.artist,
+            'album':        self.album,
+            'track':        list(self.track),
+            'title':        self.title,
+            'comment':      self.comment}
+    if self.chapters:
+      info['chapters'] = self.chapters
+    return info
+
+  def as_row(self):
+    """ return values as list (see FileInfo.__slots__) """
+
+    row = [getattr(self,field) for field in FileInfo.__slots__]
+    if not self.chapters:
+      row.pop()
+    return row
+
+  @staticmethod
+  def from_dict(info):
+    """ create from dict (old format of .dirinfo) """
+
+    return FileInfo(*[info.get(field) for field in FileInfo.__slots__])
+
 class MP3Info(Base):
   """ query MP3-info from files """
 
@@ -56,24 +138,13 @@ class MP3Info(Base):
   def __init__(self,app):
     """ constructor """
 
-    self.debug   = app.debug
-
-  # --- pretty print duration/time   ----------------------------------------
-
-  def _pp_time(self,seconds):
-    """ pritty-print time as mm:ss or hh:mm """
-
-    m, s = divmod(seconds,60)
-    h, m = divmod(m,60)
-    if h > 0:
-      return "{0:02d}:{1:02d}:{2:02d}".format(h,m,s)
-    else:
-      return "{0:02d}:{1:02d}".format(m,s)
+    self.debug    = app.debug
+    self._metrics = app.metrics
 
   # --- create file info for a given file   ----------------------------------
 
   def get_fileinfo(self,dir,file,tracks=1):
-    """ create file info """
+    """ create file info (returns a FileInfo-object) """
 
     if os.path.isabs(file):
       f = file
@@ -92,7 +163,7 @@ class MP3Info(Base):
     else:
       artist = dname
       album  = ""
-    self.msg("MP3Info: artist/album from directory: %s/%s" % (artist,album))
+    self.msg("MP3Info: artist/album from directory: %s/%s",artist,album)
 
     # defaults for artist/title from filename (without extension)
     # Could be:
@@ -112,12 +183,13 @@ class MP3Info(Base):
       title  = fname[ind+3:]
     else:
       title  = fname                           # uses artist from dirname
-    self.msg("MP3Info: artist/title from filename: %s/%s" % (artist,title))
+    self.msg("MP3Info: artist/title from filename: %s/%s",artist,title)
 
-    mp3info = eyed3.load(f)
+    import eyed3                               # slow import, load on demand
+    with self._metrics.timer('webradio_eyed3_parse_seconds'):
+      mp3info = eyed3.load(f)
     info                 = {}
     info['total']        = int(mp3info.info.time_secs)
-    info['total_pretty'] = self._pp_time(info['total'])
     info['fname']        = file
     if mp3info.tag:
       info['artist']       = mp3info.tag.artist if mp3info.tag.artist else artist
@@ -151,47 +223,136 @@ class MP3Info(Base):
       for key,value in MP3Info._ENC_MAP.items():
         v = v.replace(key,value)
       info[tag] = v
-    self.msg("MP3Info: file-info: %s" % json.dumps(info))
-    return info
+
+    # chapters (e.g. songs of a recording)
+    chapters = self.get_chapters(f)
+    if chapters:
+      info['chapters'] = chapters
+    self.msg("MP3Info: file-info: %s",json.dumps(info))
+    return FileInfo.from_dict(info)
+
+  # --- return chapters from cue-sheet   --------------------------------------
+
+  def get_chapters(self,file):
+    """ return list of [start,title] from the cue-sheet <file>.cue or None """
+
+    cue_file = os.path.splitext(file)[0]+".cue"
+    if not os.path.exists(cue_file):
+      return None
+    chapters = []
+    title    = ""
+    try:
+      with open(cue_file,"r",errors='replace') as f:
+        for line in f:
+          line = line.strip()
+          if line.startswith("TRACK"):
+            title = ""
+          elif line.startswith("TITLE"):
+            title = line[5:].strip().strip('"')
+          elif line.startswith("INDEX 01"):
+            m,s,fr = [int(v) for v in line[8:].strip().split(':')]
+            chapters.append([round(60*m+s+fr/75,2),title])
+    except:
+      self.msg("MP3Info: could not parse cue-sheet %s",cue_file)
+      if self.debug:
+        traceback.print_exc()
+      return None
+    return chapters
+
+  # --- return embedded cover-art   ------------------------------------------
+
+  def get_cover_image(self,file):
+    """ return (data,mime-type) of embedded cover-art or None """
+
+    try:
+      import eyed3
+      mp3info = eyed3.load(file)
+      if not mp3info or not mp3info.tag or not len(mp3info.tag.images):
+        return None
+      images = sorted(mp3info.tag.images,
+        key=lambda img: img.picture_type != eyed3.id3.frames.ImageFrame.FRONT_COVER)
+      for img in images:
+        if img.image_data:
+          self.msg("MP3Info: found embedded cover-art (%s) in %s",
+                   img.mime_type,file)
+          return (img.image_data,img.mime_type)
+    except:
+      self.msg("MP3Info: could not read embedded cover-art of %s",file)
+      if self.debug:
+        traceback.print_exc()
+    return None
 
   # --- return directory info for given dir   --------------------------------
 
-  def get_dirinfo(self,dir,force_save=False):
-    """ return directory info """
+  def get_dirinfo(self,dir,force_save=False,mtime=None):
+    """ return directory info (files are FileInfo-objects). mtime is the
+        newest modification-time of the directory and its files, if known
+        (by default, only the directory itself is checked)
+    """
 
     info_file = os.path.join(dir,".dirinfo")
-    mtime_dir = os.path.getmtime(dir)
+    mtime_dir = mtime if mtime else os.path.getmtime(dir)
     if os.path.exists(info_file) and mtime_dir <= os.path.getmtime(info_file):
       try:
-        f = open(info_file,"r")
-        dirinfo = json.load(f)
-        f.close()
-        self.msg("MP3Info: using existing dir-info file %s" % info_file,force_save)
+        with open(info_file,"r") as f:
+          data = json.load(f)
+        dirinfo = self._parse_dirinfo(data)
+        self.msg("MP3Info: using existing dir-info file %s",
+                 info_file,force=force_save)
+        self._metrics.inc('webradio_dirinfo_requests_total',result='hit')
+        if force_save and not 'fields' in data:
+          self._save_dirinfo(info_file,dirinfo,force_save)  # convert format
         return dirinfo
       except:
-        self.msg("MP3Info: could not load dir-info file %s" % info_file)
+        self.msg("MP3Info: could not load dir-info file %s",info_file)
         if self.debug:
           traceback.print_exc()
 
+    self._metrics.inc('webradio_dirinfo_requests_total',result='miss')
     dirinfo = self._create_dirinfo(dir)
     # only update dirinfo-file if it already existed before
     if os.path.exists(info_file) or force_save:
-      try:
-        f = open(info_file,"w")
-        json.dump(dirinfo,f,indent=2,ensure_ascii=False)
-        f.close()
-        self.msg("MP3Info: saving dir-info file %s" % info_file,force_save)
-      except:
-        self.msg("MP3Info: could not write dir-info file %s" % info_file,force_save)
+      self._save_dirinfo(info_file,dirinfo,force_save)
     return dirinfo
 
+  # --- parse content of dir-info file   ---------------------------------------
+
+  def _parse_dirinfo(self,data):
+    """ convert content of a dir-info file. The compact format has a list
+        of field-names and a row of values per file, the old format
+        has a dict per file
+    """
+
+    if 'fields' in data:
+      fields = data['fields']
+      files  = [FileInfo(**dict(zip(fields,row))) for row in data['files']]
+    else:
+      files  = [FileInfo.from_dict(info) for info in data['files']]
+    return {'dirs': data['dirs'], 'files': files}
+
+  # --- save dir-info file   ---------------------------------------------------
+
+  def _save_dirinfo(self,info_file,dirinfo,force_save):
+    """ save dir-info in compact format """
+
+    data = {'dirs':   dirinfo['dirs'],
+            'fields': FileInfo.__slots__,
+            'files':  [info.as_row() for info in dirinfo['files']]}
+    try:
+      with open(info_file,"w") as f:
+        json.dump(data,f,ensure_ascii=False,separators=(',',':'))
+      self.msg("MP3Info: saving dir-info file %s",info_file,force=force_save)
+    except:
+      self.msg("MP3Info: could not write dir-info file %s",
+               info_file,force=force_save)
+
   # --- recursively write directory info for given dir   ---------------------
 
   def write_dirinfo(self,dir):
     """ recursively write directory info """
 
     if not os.path.isdir(dir):
-      self.msg("MP3Info: error: %d is no directory" % dir,True)
+      self.msg("MP3Info: error: %s is no directory",dir,force=True)
       return
     dirinfo = self.get_dirinfo(dir,True)
     for d in dirinfo['dirs']:
@@ -204,7 +365,7 @@ class MP3Info(Base):
 
     dirinfo = {'dirs':  [], 'files': []}
     files   = []
-    self.msg("MP3Info: collecting dir-info for %s" % dir)
+    self.msg("MP3Info: collecting dir-info for %s",dir)
 
     for f in os.listdir(dir):
       if os.path.isfile(os.path.join(dir,f)):
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class Metrics
+#
+# The class Metrics collects counters, gauges and latency-histograms of the
+# hot paths of the service. The metrics are available with the API
+# get_metrics and in Prometheus text-format at /metrics.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import time, threading, traceback
+
+from webradio import Base
+
+class Metrics(Base):
+  """ registry of metrics """
+
+  # name: (type, help)
+  METRICS = {
+    'webradio_api_call_seconds':
+      ('histogram','duration of API-calls (web API)'),
+    'webradio_events_total':
+      ('counter',  'events distributed to the consumers'),
+    'webradio_event_queue_depth':
+      ('gauge',    'events waiting in the input-queue'),
+    'webradio_event_consumers':
+      ('gauge',    'registered event-consumers'),
+    'webradio_event_consumer_drops_total':
+      ('counter',  'consumers dropped because their queue was full'),
+    'webradio_mpg123_starts_total':
+      ('counter',  'started mpg123-processes'),
+    'webradio_mpg123_cmd_seconds':
+      ('histogram','latency of mpg123-commands'),
+    'webradio_dirinfo_requests_total':
+      ('counter',  'dir-info requests (result: hit or miss of .dirinfo)'),
+    'webradio_eyed3_parse_seconds':
+      ('histogram','time to read the tags of a file with eyed3'),
+    'webradio_recorder_bytes_total':
+      ('counter',  'bytes written by the recorder'),
+    'webradio_recorder_gaps_total':
+      ('counter',  'gaps in recordings'),
+    'webradio_recordings_active':
+      ('gauge',    'active recordings'),
+    }
+
+  # upper bounds of the histogram-buckets (seconds)
+  BUCKETS = (0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10)
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._api      = app.api
+    self.debug     = app.debug
+    self._lock     = threading.Lock()
+    self._values   = {}                # (name,labels) -> value
+    self._hists    = {}                # (name,labels) -> [counts,sum,count]
+    self._gauges   = {}                # name -> function
+    self.register_apis()
+
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api.get_metrics = self.get_metrics
+
+  # --- increment counter   --------------------------------------------------
+
+  def inc(self,name,value=1,**labels):
+    """ increment counter name (with optional labels) """
+
+    key = (name,tuple(sorted(labels.items())))
+    with self._lock:
+      self._values[key] = self._values.get(key,0) + value
+
+  # --- set gauge   ------------------------------------------------------------
+
+  def set(self,name,value,**labels):
+    """ set gauge name (with optional labels) """
+
+    key = (name,tuple(sorted(labels.items())))
+    with self._lock:
+      self._values[key] = value
+
+  # --- register gauge-function   --------------------------------------------
+
+  def gauge(self,name,func):
+    """ register function returning the value of gauge name (called
+        for every query of the metrics)
+    """
+
+    self._gauges[name] = func
+
+  # --- add observation to histogram   ---------------------------------------
+
+  def observe(self,name,value,**labels):
+    """ add value (seconds) to histogram name """
+
+    key = (name,tuple(sorted(labels.items())))
+    with self._lock:
+      hist = self._hists.get(key)
+      if not hist:
+        hist = self._hists[key] = [[0]*len(Metrics.BUCKETS),0.0,0]
+      for i,bound in enumerate(Metrics.BUCKETS):
+        if value <= bound:
+          hist[0][i] += 1
+          break
+      hist[1] += value
+      hist[2] += 1
+
+  # --- measure duration   ---------------------------------------------------
+
+  def timer(self,name,**labels):
+    """ return context-manager adding its duration to histogram name """
+
+    return _Timer(self,name,labels)
+
+  # --- sample name   ----------------------------------------------------------
+
+  def _sample(self,name,labels,extra=()):
+    """ return name of sample in Prometheus-format """
+
+    labels = list(labels) + list(extra)
+    if not labels:
+      return name
+    return "%s{%s}" % (name,",".join('%s="%s"' % (k,str(v).replace('"',"'"))
+                                     for k,v in labels))
+
+  # --- collect all values   ---------------------------------------------------
+
+  def _collect(self):
+    """ return copies of values and histograms (with current gauges) """
+
+    with self._lock:
+      values = dict(self._values)
+      hists  = {key: [list(h[0]),h[1],h[2]] for key,h in self._hists.items()}
+    for name,func in self._gauges.items():
+      try:
+        values[(name,())] = func()
+      except:
+        if self.debug:
+          traceback.print_exc()
+    return values,hists
+
+  # --- return metrics   -------------------------------------------------------
+
+  def get_metrics(self):
+    """ return all metrics (histograms with count, sum and buckets) """
+
+    values,hists = self._collect()
+    result = {self._sample(name,labels): value
+              for (name,labels),value in values.items()}
+    for (name,labels),(counts,total,count) in hists.items():
+      result[self._sample(name,labels)] = {
+        'count':   count,
+        'sum':     round(total,6),
+        'buckets': dict(zip([str(b) for b in Metrics.BUCKETS],counts))
+        }
+    return result
+
+  # --- return metrics in Prometheus text-format   ---------------------------
+
+  def prometheus(self):
+    """ return all metrics in Prometheus text-format """
+
+    values,hists = self._collect()
+    lines = []
+    for name in sorted(set(n for n,_ in values) | set(n for n,_ in hists)):
+      mtype,text = Metrics.METRICS.get(name,('untyped',''))
+      lines.append("# HELP %s %s" % (name,text))
+      lines.append("# TYPE %s %s" % (name,mtype))
+      for (n,labels),value in sorted(values.items()):
+        if n == name:
+          lines.append("%s %s" % (self._sample(name,labels),value))
+      for (n,labels),(counts,total,count) in sorted(hists.items()):
+        if n != name:
+          continue
+        cumulative = 0
+        for bound,c in zip(Metrics.BUCKETS,counts):
+          cumulative += c
+          lines.append("%s %d" % (self._sample(name+"_bucket",labels,
+                                               [('le',bound)]),cumulative))
+        lines.append("%s %d" % (self._sample(name+"_bucket",labels,
+                                             [('le','+Inf')]),count))
+        lines.append("%s %f" % (self._sample(name+"_sum",labels),total))
+        lines.append("%s %d" % (self._sample(name+"_count",labels),count))
+    return "\n".join(lines)+"\n"
+
+# --- context-manager for timing   --------------------------------------------
+
+class _Timer(object):
+  """ measure duration of a block and add it to a histogram """
+
+  def __init__(self,metrics,name,labels):
+    self._metrics = metrics
+    self._name    = name
+    self._labels  = labels
+
+  def __enter__(self):
+    self._start = time.monotonic()
+    return self
+
+  def __exit__(self,*args):
+    self._metrics.observe(self._name,time.monotonic()-self._start,
+                          **self._labels)
+    return False
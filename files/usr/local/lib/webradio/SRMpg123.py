@@ -21,11 +21,14 @@ from webradio import Base
 class Mpg123(Base):
   """ mpg123 control-object """
 
+  PROGRESS_INTERVAL = 5                # parse @F-lines every x seconds
+
   def __init__(self,app):
     """ initialization """
 
     self._app       = app
     self._api       = app.api
+    self._metrics   = app.metrics
     self.debug      = app.debug
     self._process   = None
     self._op_event  = threading.Event()
@@ -33,6 +36,8 @@ class Mpg123(Base):
     self._pause     = False
     self._volume    = -1
     self._elapsed   = 0
+    self._seconds   = 0                # elapsed time (absolute)
+    self._progress  = 0                # time of next progress-update
     self._mute      = False
     self._url       = None
 
@@ -83,7 +88,7 @@ class Mpg123(Base):
       self._volume = state_map['volume']
     else:
       self._volume = self._vol_default
-    self.msg("Mpg123: volume is: %d" % self._volume)
+    self.msg("Mpg123: volume is: %d",self._volume)
 
   # --- active-state (return true if playing)   --------------------------------
 
@@ -99,6 +104,15 @@ class Mpg123(Base):
 
     return self._elapsed
 
+  # --- current position   ---------------------------------------------------
+
+  def position(self):
+    """ return (name,seconds) of the current url/file or None """
+
+    if not self._play:
+      return None
+    return (self._url,self._seconds)
+
   # --- create player in the background in remote-mode   ----------------------
 
   def create(self):
@@ -108,7 +122,7 @@ class Mpg123(Base):
     opts = shlex.split(self._mpg123_opts)
     args += opts
 
-    self.msg("Mpg123: starting mpg123 with args %r" % (args,))
+    self.msg("Mpg123: starting mpg123 with args %r",args)
     # start process with line-buffered stdin/stdout
     self._process = subprocess.Popen(args,bufsize=1,
                                      universal_newlines=True,
@@ -116,6 +130,7 @@ class Mpg123(Base):
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.STDOUT,
                                      errors='replace')
+    self._metrics.inc('webradio_mpg123_starts_total')
     self._reader_thread = Thread(target=self._process_stdout)
     self._reader_thread.start()
     self.vol_set(self._volume)
@@ -133,12 +148,13 @@ class Mpg123(Base):
             self._exec_cmd("SAMPLE")
           return False
         self.stop(last=False)        # since we are about to play another file
-      self.msg("Mpg123: starting to play %s" % url)
+      self.msg("Mpg123: starting to play %s",url)
       self._last = last
       if url.startswith("http"):
         self._url   = url
       else:
         self._url   = os.path.basename(url)
+      self._seconds = max(0,elapsed)
       if url.endswith(".m3u"):
         self._exec_cmd("LOADLIST 0 %s" % url)
       else:
@@ -162,7 +178,7 @@ class Mpg123(Base):
     if not self._play:
       return
     if self._process:
-      self.msg("Mpg123: stopping current url/file: %s" % self._url)
+      self.msg("Mpg123: stopping current url/file: %s",self._url)
       self._last = last
       self._exec_cmd("STOP")
       self._elapsed   = 0
@@ -226,6 +242,7 @@ class Mpg123(Base):
     """ jump to specified absolute position (elapsed time in seconds) """
 
     self._exec_cmd("JUMP %ss" % str(elapsed))
+    self._progress = 0                 # update position with next frame
     self._exec_cmd("SAMPLE")
 
   # --- execute mpg123-command   ----------------------------------------------
@@ -234,9 +251,12 @@ class Mpg123(Base):
     """ execute mpg123-command """
 
     self._op_event.clear()
+    start = time.monotonic()
     self._process.stdin.write(cmd+"\n")
     if wait:
       self._op_event.wait()
+      self._metrics.observe('webradio_mpg123_cmd_seconds',
+                            time.monotonic()-start,cmd=cmd.split()[0])
 
   # --- process output of mpg123   --------------------------------------------
 
@@ -254,8 +274,9 @@ class Mpg123(Base):
         # catch e.g. decode-error
         continue
       if line.startswith("@F"):
+        self._update_progress(line)
         continue
-      self.msg("Mpg123: processing line: %s" % line)
+      self.msg("Mpg123: processing line: %s",line)
       if line.startswith("@I ICY-META"):
         (line,_) = regex.subn(r'\1',line)
         self._api._push_event({'type': 'icy_meta',
@@ -300,6 +321,25 @@ class Mpg123(Base):
 
     self.msg("Mpg123: stopping mpg123 reader-thread")
 
+  # --- update progress from frame-info   -------------------------------------
+
+  def _update_progress(self,line):
+    """ parse @F-line (frame-info) at a low rate and update elapsed time """
+
+    now = time.monotonic()
+    if now < self._progress:
+      return
+    self._progress = now + Mpg123.PROGRESS_INTERVAL
+    try:
+      # @F <frame> <frames left> <seconds> <seconds left>
+      _,_,_,secs,left = line.split()
+      secs,left = float(secs),float(left)
+    except ValueError:
+      return
+    self._seconds = secs
+    if secs+left > 0:
+      self._elapsed = secs/(secs+left)
+
   # --- increase volume   ----------------------------------------------------
 
   def vol_up(self,by=None):
@@ -332,7 +372,7 @@ class Mpg123(Base):
     val = min(max(0,int(val)),100)
     self._volume = val
     if self._process:
-      self.msg("Mpg123: setting current volume to: %d%%" % val)
+      self.msg("Mpg123: setting current volume to: %d%%",val)
       self._exec_cmd("VOLUME %d" % val,wait=False)
       self._api._push_event({'type': 'vol_set',
                               'value': self._volume})
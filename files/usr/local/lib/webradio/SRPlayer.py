@@ -12,13 +12,24 @@
 #
 # -----------------------------------------------------------------------------
 
-import os, time, datetime, threading, copy, queue
+import os, time, datetime, threading, queue, collections
 
-from webradio import Base, MP3Info
+from webradio import Base, MP3Info, StateStore
 
 class Player(Base):
   """ Player-controller """
 
+  # names of cover-files (lower case, in order of preference)
+  COVER_FILES = ['cover.jpg','cover.jpeg','cover.png',
+                 'folder.jpg','folder.jpeg','folder.png',
+                 'front.jpg','front.png']
+
+  DEFAULT_POSITIONS = os.path.join(os.path.expanduser("~"),
+                                   ".cache","pi-webradio","positions.json")
+  MAX_POSITIONS = 1000      # keep resume-positions of x files
+  END_MARGIN    = 15        # restart files within x seconds of the end
+  MAX_COVERS    = 64        # cache cover-files of x directories/files
+
   def __init__(self,app):
     """ initialization """
 
@@ -33,11 +44,19 @@ class Player(Base):
     self._dirplay     = None
     self._dirstop     = threading.Event()
     self._init_thread = None
+    self._covers      = collections.OrderedDict()      # LRU
+    self._cover_lock  = threading.Lock()
+    self._pos_lock    = threading.Lock()
 
     self.read_config()
     self.register_apis()
 
     self._mp3info = MP3Info(app)
+    if self._resume:
+      self._pos_store = StateStore(app,self._pos_file,
+                                   self._collect_positions,compact=True)
+      self._positions = collections.OrderedDict(self._pos_store.load())
+      self._pos_store.start()
 
   # --- read configuration   --------------------------------------------------
 
@@ -57,9 +76,15 @@ class Player(Base):
                                     self._root_dir)
     self._def_dir = os.path.abspath(self._def_dir)
 
+    self._resume   = self.get_value(self._app.parser,"PLAYER",
+                                    "player_resume","1") == "1"
+    self._pos_file = self.get_value(self._app.parser,"PLAYER",
+                                    "player_positions",
+                                    Player.DEFAULT_POSITIONS)
+
     self._dir = self._def_dir
-    self.msg("Player: root dir:    %s" % self._root_dir)
-    self.msg("Player: default dir: %s" % self._def_dir)
+    self.msg("Player: root dir:    %s",self._root_dir)
+    self.msg("Player: default dir: %s",self._def_dir)
 
   # --- register APIs   ------------------------------------------------------
 
@@ -72,10 +97,18 @@ class Player(Base):
     self._api.player_resume     = self.player_resume
     self._api.player_toggle     = self.player_toggle
     self._api.player_set_pos    = self.player_set_pos
+    self._api.player_set_chapter = self.player_set_chapter
     self._api.player_select_dir = self.player_select_dir
     self._api.player_play_dir   = self.player_play_dir
     self._api._player_get_cover_file = self._player_get_cover_file
 
+  # --- return current file   -------------------------------------------------
+
+  def get_file(self):
+    """ return current file (None if there is no current file) """
+
+    return self._file
+
   # --- return persistent state of this class   -------------------------------
 
   def get_persistent_state(self):
@@ -94,26 +127,62 @@ class Player(Base):
     self.msg("Player: restoring persistent state")
     if 'player_dir' in state_map:
       self._dir = state_map['player_dir']
-      self.msg("Player: currrent dir (tentative):  %s" % self._dir)
+      self.msg("Player: currrent dir (tentative):  %s",self._dir)
     if 'player_file' in state_map:
       self._file = state_map['player_file']
-      self.msg("Player: currrent file (tentative): %s" % self._file)
+      self.msg("Player: currrent file (tentative): %s",self._file)
     if 'player_elapsed' in state_map:
       self._elapsed = state_map['player_elapsed']
-      self.msg("Player: elapsed: %s" % self._elapsed)
+      self.msg("Player: elapsed: %s",self._elapsed)
     self._api.update_state(section="player",key="last_dir",
                            value=self._dir[len(self._root_dir):]+os.path.sep,
                            publish=False)
     self._init_thread = threading.Thread(target=self._init_state)
     self._init_thread.start()
 
+  # --- collect resume-positions   --------------------------------------------
+
+  def _collect_positions(self):
+    """ update position of the current file, return all positions
+        (oldest first)
+    """
+
+    pos = self._backend.position()
+    with self._pos_lock:
+      if (pos and self._file and pos[1] > 0 and
+          pos[0] == os.path.basename(self._file)):
+        self._positions[self._file] = int(pos[1])
+        self._positions.move_to_end(self._file)
+        while len(self._positions) > Player.MAX_POSITIONS:
+          self._positions.popitem(last=False)
+      return list(self._positions.items())
+
+  # --- query resume-position   -----------------------------------------------
+
+  def _get_position(self,file,total):
+    """ return resume-position of file (seconds) """
+
+    with self._pos_lock:
+      secs = self._positions.get(file,0)
+    if secs > total - Player.END_MARGIN:
+      return 0                                   # file was finished
+    return secs
+
+  # --- save resume-positions   -----------------------------------------------
+
+  def stop(self):
+    """ save resume-positions (call before the backend stops) """
+
+    if self._resume:
+      self._pos_store.save()
+
   # --- lazy query of dir-info during initialization   ----------------------
 
   def _init_state(self):
     """ wait for directory and query dir-info """
 
     # check directory (wait if necessary)
-    self.msg("Player: waiting for %s" % self._dir)
+    self.msg("Player: waiting for %s",self._dir)
     while not os.path.exists(self._dir) and self._wait_dir:
       time.sleep(1)
       self._wait_dir -= 1
@@ -125,13 +194,15 @@ class Player(Base):
     else:
       # oops, check failed, now check everything
       if not os.path.exists(self._root_dir):
-        self.msg("[WARNING] Player: root-directory %s of player does not exist" %
-                 self._root_dir,True)
+        self.msg("[WARNING] Player: root-directory %s of player does not exist",
+                 self._root_dir,force=True)
         self._root_dir = os.path.expanduser("~")
-        self.msg("[WARNING] Player: using %s as fallback" % self._root_dir,True)
+        self.msg("[WARNING] Player: using %s as fallback",
+                 self._root_dir,force=True)
       if not self._check_dir(self._def_dir):
         self._def_dir = self._root_dir
-        self.msg("[WARNING] Player: using %s as fallback" % self._root_dir,True)
+        self.msg("[WARNING] Player: using %s as fallback",
+                 self._root_dir,force=True)
       self._dir = self._def_dir
       self._get_dirinfo(self._dir,True)
 
@@ -141,8 +212,8 @@ class Player(Base):
       self._elapsed = 0
 
     self._init_thread = None
-    self.msg("Player: currrent dir:  %s" % self._dir)
-    self.msg("Player: currrent file: %s" % self._file)
+    self.msg("Player: currrent dir:  %s",self._dir)
+    self.msg("Player: currrent file: %s",self._file)
 
   # --- check directory   ---------------------------------------------------
 
@@ -151,12 +222,12 @@ class Player(Base):
 
     path = os.path.abspath(path)
     if not os.path.exists(path):
-      self.msg("[WARNING] Player: %s does not exist" % path)
+      self.msg("[WARNING] Player: %s does not exist",path)
       return False
 
     if not os.path.commonpath([self._root_dir,path]) == self._root_dir:
-      self.msg("[WARNING] Player: %s is not child of root-directory" % path,
-               True)
+      self.msg("[WARNING] Player: %s is not child of root-directory",path,
+               force=True)
       return False
 
     return True
@@ -168,7 +239,7 @@ class Player(Base):
 
     path = os.path.abspath(path)
     if not os.path.exists(path):
-      self.msg("[WARNING] Player: %s does not exist" % path)
+      self.msg("[WARNING] Player: %s does not exist",path)
       return False
     else:
       return self._check_dir(os.path.dirname(path))
@@ -200,19 +271,24 @@ class Player(Base):
     if self._dirinfo:
       self._dirinfo['cur_file'] = base
       _,file_info = self._get_index(base)
-      file_info = copy.deepcopy(file_info)      # keep original as is
     else:
       file_info = self._mp3info.get_fileinfo(None,self._file)
-    # add info
+    # add info (to a new dict, keep original as is)
+    file_info = file_info.as_dict()
     file_info['last']  = last
 
     # this will push the information to all clients, even if the file
     # is already playing.
 
     self._api._push_event({'type': 'file_info', 'value': file_info })
-    if self._backend.play(self._file,last,self._elapsed*file_info['total']):
+    elapsed = self._elapsed*file_info['total']
+    if self._resume and not elapsed:
+      elapsed = self._get_position(self._file,file_info['total'])
+    if self._backend.play(self._file,last,elapsed):
       self._api.update_state(section="player",key="last_file",
                              value=os.path.basename(self._file),publish=False)
+    if hasattr(self._api,'_timeshift_stop'):
+      self._api._timeshift_stop()               # radio is not playing anymore
     self._api.update_state(section="player",key="file_info",
                            value=file_info,
                            publish=False)
@@ -260,6 +336,25 @@ class Player(Base):
 
     self._backend.jump(elapsed)
 
+  # --- jump to chapter   -----------------------------------------------------
+
+  def player_set_chapter(self,nr):
+    """ jump to start of chapter nr (1..n) of the current file """
+
+    if not self._file:
+      raise ValueError("default file not set")
+    base = os.path.basename(self._file)
+    if self._dirinfo and self._dirinfo.get('cur_file') == base:
+      _,file_info = self._get_index(base)
+    else:
+      file_info = self._mp3info.get_fileinfo(None,self._file)
+    chapters = file_info.get('chapters',[])
+    nr = int(nr)
+    if nr < 1 or nr > len(chapters):
+      raise ValueError("invalid chapter number %d" % nr)
+    self._backend.jump(chapters[nr-1][0])
+    return chapters[nr-1]
+
   # --- select directory, return entries   ------------------------------------
 
   def player_select_dir(self,dir=None):
@@ -279,10 +374,10 @@ class Player(Base):
     else:
       if os.path.isabs(dir):
         dir = os.path.normpath(self._root_dir+dir)   # cannot use join here!
-        self.msg("Player: dir is absolute, fullpath %s" % dir)
+        self.msg("Player: dir is absolute, fullpath %s",dir)
       else:
         dir = os.path.normpath(os.path.join(self._dir,dir))
-        self.msg("Player: dir is relative, fullpath %s" % dir)
+        self.msg("Player: dir is relative, fullpath %s",dir)
       if not self._check_dir(dir):
         self._lock.release()
         raise ValueError("invalid directory %s" % dir)
@@ -307,10 +402,19 @@ class Player(Base):
       self._get_dirinfo(dir)
       self._dirinfo['cur_dir'] = cur_dir
     else:
-      self.msg("Player: using cached dir-info for %s" % dir)
+      self.msg("Player: using cached dir-info for %s",dir)
 
     self._lock.release()
-    return self._dirinfo
+    return self._dirinfo_dict()
+
+  # --- return dir-info for the API   -----------------------------------------
+
+  def _dirinfo_dict(self):
+    """ return copy of dir-info with files as dicts """
+
+    result = dict(self._dirinfo)
+    result['files'] = [info.as_dict() for info in self._dirinfo['files']]
+    return result
 
   # --- play all files in directory   -----------------------------------------
 
@@ -329,13 +433,13 @@ class Player(Base):
 
     # copy file-list
     if not start:
-      files = copy.deepcopy(self._dirinfo['files'])
+      files = list(self._dirinfo['files'])
     else:
       try:
         index,_ = self._get_index(start)
-        self.msg("Player: starting play_dir with file %s (index %i)" %
-                 (start,index))
-        files = copy.deepcopy(self._dirinfo['files'][index:])
+        self.msg("Player: starting play_dir with file %s (index %i)",
+                 start,index)
+        files = self._dirinfo['files'][index:]
       except ValueError:
         raise ValueError("file %s does not exist" % start)
 
@@ -367,7 +471,7 @@ class Player(Base):
       fname = f['fname']
       if do_exit:
         break
-      self.msg("Player: _play_dir: playing next file %s" % fname)
+      self.msg("Player: _play_dir: playing next file %s",fname)
       self.player_play_file(fname,last=index==index_last)
       while True:
         # a naive implementation would just block on the queue, but
@@ -380,7 +484,7 @@ class Player(Base):
           ev_queue.task_done()
           if ev:
             if ev['type'] == 'eof' and ev['value']['name'] == fname:
-              self.msg("Player: processing eof for %s" % fname)
+              self.msg("Player: processing eof for %s",fname)
               self._elapsed = 0
               break                              # start next file
           else:
@@ -395,15 +499,77 @@ class Player(Base):
     self._backend.stop()
     self._dirplay = None
 
-  # --- return name of cover file (currently only cover.jpg)   ---------------
+  # --- return name of cover file   -----------------------------------------
 
   def _player_get_cover_file(self):
-    """ return name of cover file """
+    """ return name of cover file. This is either a cover-file within
+        the current directory or the embedded cover-art of the current
+        file (extracted to the thumbnail-cache). Results are cached until
+        the directory changes (for the last MAX_COVERS directories/files).
+    """
 
-    cover = os.path.join(self._dir,"cover.jpg")
-    if os.path.exists(cover):
-      return cover
-    else:
+    dir = self._dir
+    try:
+      mtime = os.path.getmtime(dir)
+    except OSError:
+      return None
+    file = self._file if self._file and os.path.dirname(self._file) == dir else None
+
+    key = (dir,file)
+    with self._cover_lock:
+      # extracted cover-art might have been evicted from the thumbnail-cache
+      entry = self._covers.get(key)
+      if entry and entry[0] == mtime and (not entry[1] or
+                                          os.path.exists(entry[1])):
+        self._covers.move_to_end(key)
+        return entry[1]
+
+    cover = self._find_cover_file(dir)
+    if not cover:
+      cover = self._extract_cover(dir,file)
+    with self._cover_lock:
+      self._covers[key] = (mtime,cover)
+      self._covers.move_to_end(key)
+      while len(self._covers) > Player.MAX_COVERS:
+        self._covers.popitem(last=False)
+    return cover
+
+  # --- search cover-file within directory   ---------------------------------
+
+  def _find_cover_file(self,dir):
+    """ search for cover-file (case-insensitive) """
+
+    try:
+      names = {f.lower(): f for f in os.listdir(dir)}
+    except OSError:
+      return None
+    for name in Player.COVER_FILES:
+      if name in names:
+        return os.path.join(dir,names[name])
+    return None
+
+  # --- extract embedded cover-art   -----------------------------------------
+
+  def _extract_cover(self,dir,file):
+    """ extract embedded cover-art of given (or first) file into the cache """
+
+    if not hasattr(self._api,'_thumb_add'):
+      return None
+    if not file:
+      if not self._dirinfo or not len(self._dirinfo['files']):
+        return None
+      file = os.path.join(dir,self._dirinfo['files'][0]['fname'])
+
+    image = self._mp3info.get_cover_image(file)
+    if not image:
+      return None
+    data,mime_type = image
+    ext = ".png" if mime_type == "image/png" else ".jpg"
+    try:
+      return self._api._thumb_add(data,ext)
+    except:
+      self.msg("[WARNING] Player: could not save cover-art of %s",
+               file,force=True)
       return None
 
   # --- create directory info for given dir   --------------------------------
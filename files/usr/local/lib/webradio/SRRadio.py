@@ -16,7 +16,7 @@ import os, time, datetime, shlex, json
 import queue, collections
 import traceback
 
-from webradio import *
+from webradio import Base, ChannelStore
 
 class Radio(Base):
   """ Radio-controller """
@@ -34,7 +34,8 @@ class Radio(Base):
     self.stop_event    = app.stop_event
     self.read_config()
     self.register_apis()
-    self.read_channels()
+    self._store = ChannelStore(app,self._channel_file,self._web_root)
+    self._store.read()
 
   # --- read configuration   --------------------------------------------------
 
@@ -68,6 +69,9 @@ class Radio(Base):
     self._api.radio_play_next      = self.radio_play_next
     self._api.radio_play_prev      = self.radio_play_prev
     self._api.radio_add_channel    = self.radio_add_channel
+    self._api.radio_remove_channel = self.radio_remove_channel
+    self._api.radio_move_channel   = self.radio_move_channel
+    self._api.radio_update_channel = self.radio_update_channel
 
   # --- return persistent state of this class   -------------------------------
 
@@ -91,90 +95,93 @@ class Radio(Base):
 
   # --- add channel   ---------------------------------------------------------
 
-  def radio_add_channel(self, url, radio_name, logo, nr=None):
-    """ add channel"""
+  def radio_add_channel(self, url, radio_name, logo=None, nr=None):
+    """ add channel (before channel nr, default: append at the end) """
 
-    if url is None:
-      return False #TODO add proper error messages
-    if radio_name is None:
+    if not url or not radio_name:
+      self.msg("Radio: url and name of channel are mandatory")
       return False
-    if logo == "":
-      logo = None
-
-    channel = {
-      "name": radio_name,
-      "url": url,
-      "logo": logo
-    }
-    # TODO check if name is available !!!
-    if nr == None:
-      self._channels.append(channel)
-    else:
-      self._channels.insert(nr, channel)
+    return self._modify_channels(self._store.add,radio_name,url,
+                                 logo if logo else None,nr)
 
-    try:
-      with open(self._channel_file, "w") as fp:
-        json.dump(self._channels, fp, indent=2)
-    except PermissionError:
-      # TODO consider moving pi-webradio.channels (and conf) into user dir instead of root /etc
-      return False
+  # --- remove channel   ------------------------------------------------------
+
+  def radio_remove_channel(self,nr):
+    """ remove channel """
+
+    return self._modify_channels(self._store.remove,nr)
 
-    # reload and give back state for error handling
-    return self.read_channels()
+  # --- move channel   --------------------------------------------------------
 
-  # --- read channels   -------------------------------------------------------
+  def radio_move_channel(self,nr,to):
+    """ move channel to given position """
 
-  def read_channels(self):
-    """ read channels into a list """
+    return self._modify_channels(self._store.move,nr,to)
+
+  # --- update channel   ------------------------------------------------------
+
+  def radio_update_channel(self,nr,radio_name=None,url=None,logo=None):
+    """ update name, url and/or logo of channel """
+
+    return self._modify_channels(self._store.update,nr,radio_name,url,logo)
+
+  # --- modify channel-list (helper)   ---------------------------------------
+
+  def _modify_channels(self,func,*args):
+    """ execute modification of the channel-list and handle errors """
 
-    self._channels = []
     try:
-      self.msg("Radio: Loading channels from %s" % self._channel_file)
-      f = open(self._channel_file,"r")
-      self._channels = json.load(f)
-      f.close()
-      nr=1
-      for channel in self._channels:
-        channel['nr'] = nr
-        if 'logo' in channel and channel['logo'] is not None:
-          logo_path = os.path.join(self._web_root,"images",channel['logo'])
-          if os.path.exists(logo_path):
-            channel['logo'] = os.path.join("images",channel['logo'])
-          else:
-            channel['logo'] = None
-        nr += 1
-      return True
-    except:
-      self.msg("Radio: Loading channels failed")
-      if self.debug:
-        traceback.print_exc()
+      # remap channel-numbers under the lock of the channel-list, so
+      # other threads never see numbers of the old list
+      with self._store.lock:
+        nr_map  = func(*args)
+        removed = self._channel_nr and self._channel_nr not in nr_map
+        self._channel_nr = nr_map.get(self._channel_nr,0)
+        last    = nr_map.get(self._last_channel,0)
+        changed = last != self._last_channel
+        self._last_channel = last
+    except ValueError as ex:
+      self.msg("Radio: %s",ex)
       return False
+    except PermissionError:
+      self.msg("[WARNING] Radio: no permission to update channel-file",
+               force=True)
+      return False
+
+    if removed:
+      self.msg("Radio: current channel removed")
+      self.radio_off()
+    if changed:
+      self._api.update_state(section="radio",key="channel_nr",
+                             value=last,publish=False)
+    self._api._push_event({'type': 'radio_channels',
+                           'value': len(self._store.get_channels())})
+    return True
 
   # --- get channel info   ----------------------------------------------------
 
   def radio_get_channel(self,nr=0):
     """ return info-dict {name,url,logo} for channel nr """
 
-    self.read_channels()
     try:
       nr = int(nr)
     except:
       nr = 0
-    if nr == 0:
-      if self._last_channel == 0:
-        nr = 1
-      else:
-        nr = self._last_channel
-
-    return dict(self._channels[nr-1])
+    with self._store.lock:
+      channels = self._store.get_channels()
+      if nr == 0:
+        if self._last_channel == 0:
+          nr = 1
+        else:
+          nr = self._last_channel
+      return dict(channels[nr-1])
 
   # --- return channel-list   ------------------------------------------------
 
   def radio_get_channels(self):
     """ return complete channel-list """
 
-    self.read_channels()
-    return [dict(c) for c in self._channels]
+    return [dict(c) for c in self._store.get_channels()]
 
   # --- play given channel   --------------------------------------------------
 
@@ -183,46 +190,61 @@ class Radio(Base):
 
     channel = self.radio_get_channel(int(nr))
     nr      = channel['nr']
-    self.msg("Radio: start playing channel %d (%s)" % (nr,channel['name']))
+    self.msg("Radio: start playing channel %d (%s)",nr,channel['name'])
+
+    # play from time-shift buffer if configured
+    url = channel['url']
+    if hasattr(self._api,'_timeshift_play'):
+      url = self._api._timeshift_play(url)
 
     # check if we have to do anything
-    if self._backend.play(channel['url']):
+    if self._backend.play(url):
       self._api.update_state(section="radio",key="channel_nr",
                              value=channel,publish=False)
       self._api._push_event({'type': 'radio_play_channel', 'value': channel})
       self._channel_nr   = nr
       self._last_channel = self._channel_nr
     else:
-      self.msg("Radio: already on channel %d" % nr)
+      self.msg("Radio: already on channel %d",nr)
       # theoretically we could also have lost our backend
     return channel
 
   # --- switch to next channel   ----------------------------------------------
 
   def radio_play_next(self):
-    """ switch to next channel """
+    """ switch to next channel (skip dead channels) """
 
     self.msg("Radio: switch to next channel")
     if self._channel_nr == 0:
       return self.radio_play_channel(0)
-    elif self._channel_nr == len(self._channels):
-      return self.radio_play_channel(1)
-    else:
-      return self.radio_play_channel(1+self._channel_nr)
+    return self._play_alive(lambda nr,n: nr % n + 1)
 
   # --- switch to previous channel   ------------------------------------------
 
 
   def radio_play_prev(self):
-    """ switch to previous channel """
+    """ switch to previous channel (skip dead channels) """
 
     self.msg("Radio: switch to previous channel")
     if self._channel_nr == 0:
       return self.radio_play_channel(0)
-    if self._channel_nr == 1:
-      return self.radio_play_channel(len(self._channels))
-    else:
-      return self.radio_play_channel(self._channel_nr-1)
+    return self._play_alive(lambda nr,n: (nr-2) % n + 1)
+
+  # --- play next alive channel in given direction   --------------------------
+
+  def _play_alive(self,step):
+    """ play the first channel (in direction of step) which is not dead """
+
+    with self._store.lock:
+      channels = list(self._store.get_channels())
+      nr = self._channel_nr
+    for _ in range(len(channels)):
+      nr = step(nr,len(channels))
+      if (not hasattr(self._api,'_channel_alive') or
+          self._api._channel_alive(channels[nr-1]['url'])):
+        break
+      self.msg("Radio: skipping dead channel %d",nr)
+    return self.radio_play_channel(nr)
 
   # --- turn radio off   ------------------------------------------------------
 
@@ -232,6 +254,8 @@ class Radio(Base):
     self.msg("Radio: turning radio off")
     self._channel_nr = 0
     self._backend.stop()
+    if hasattr(self._api,'_timeshift_stop'):
+      self._api._timeshift_stop()
 
   # --- turn radio on   -------------------------------------------------------
 
@@ -62,7 +62,7 @@ class RadioClient(Base):
       response = self._request.getresponse()
       data = (response.status,response.reason,response.read())
     except Exception as ex:
-      self.msg("RadioClient: exception: %s" % ex)
+      self.msg("RadioClient: exception: %s",ex)
       self._request = httplib.HTTPConnection(self._host,self._port)
       data = (-1,"connect error",None)
 
@@ -91,7 +91,7 @@ class RadioClient(Base):
       self._sseclient = sseclient.SSEClient(response)
       return self._sseclient.events()
     except Exception as ex:
-      self.msg("RadioClient: exception: %s" % ex)
+      self.msg("RadioClient: exception: %s",ex)
       return None
 
   # --- query API-list   -----------------------------------------------------
@@ -103,7 +103,7 @@ class RadioClient(Base):
       return self._api_list
     else:
       _1,_2,apis = self.exec("get_api_list")
-      self.msg("RadioClient: API-list: %r" % (apis,))
+      self.msg("RadioClient: API-list: %r",apis)
       if apis:
         self._api_list = json.loads(apis)
         return self._api_list
@@ -118,7 +118,7 @@ class RadioClient(Base):
     try:
       while True and not self._stop.is_set():
         events = self.get_events()
-        self.msg("RadioClient: events: %r" % (events,))
+        self.msg("RadioClient: events: %r",events)
         if not events:
           time.sleep(3)
           continue
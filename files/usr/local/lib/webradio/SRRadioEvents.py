@@ -27,6 +27,7 @@ class RadioEvents(Base):
     """ initialization """
 
     self._api         = app.api
+    self._metrics     = app.metrics
     self.debug        = app.debug
     self._stop_event  = app.stop_event
     self._input_queue = queue.Queue()
@@ -34,6 +35,9 @@ class RadioEvents(Base):
     self._consumers   = {}
     self._formatter   = EventFormatter()
     self.register_apis()
+    self._metrics.gauge('webradio_event_queue_depth',self._input_queue.qsize)
+    self._metrics.gauge('webradio_event_consumers',
+                        lambda: len(self._consumers))
     threading.Thread(target=self._process_events).start()
 
   # --- register APIs   ------------------------------------------------------
@@ -58,10 +62,10 @@ class RadioEvents(Base):
     """ add a consumer to the list of consumers """
 
     if id in self._consumers:
-      self.msg("RadioEvents: reusing consumer-queue with id %s" % id)
+      self.msg("RadioEvents: reusing consumer-queue with id %s",id)
       return self._consumers[id]
     else:
-      self.msg("RadioEvents: adding consumer with id %s" % id)
+      self.msg("RadioEvents: adding consumer with id %s",id)
       with self._lock:
         self._consumers[id] = queue.Queue(RadioEvents.QUEUE_SIZE)
       try:
@@ -98,7 +102,7 @@ class RadioEvents(Base):
       try:
         event = self._input_queue.get(block=True,timeout=1)   # block 1s
         self._input_queue.task_done()
-        self.msg("RadioEvents: received event: %r" % (event,))
+        self.msg("RadioEvents: received event: %r",event)
         count = 0
       except queue.Empty:
         count = (count+1) % RadioEvents.KEEP_ALIVE_INTERVAL
@@ -110,6 +114,7 @@ class RadioEvents(Base):
                    datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 
       event['text'] = self._formatter.format(event)
+      self._metrics.inc('webradio_events_total')
       stale_consumers = []
       for id, consumer in self._consumers.items():
         try:
@@ -120,8 +125,9 @@ class RadioEvents(Base):
       # delete stale consumers
       with self._lock:
         for id in stale_consumers:
-          self.msg("RadioEvents: deleting stale queue with id %s" % id)
+          self.msg("RadioEvents: deleting stale queue with id %s",id)
           del self._consumers[id]
+          self._metrics.inc('webradio_event_consumer_drops_total')
 
     self.msg("RadioEvents: stopping event-processing")
     for consumer in self._consumers.values():
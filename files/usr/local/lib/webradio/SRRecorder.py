@@ -15,15 +15,16 @@
 #
 # -----------------------------------------------------------------------------
 
-import threading, os, datetime, urllib.request
+import threading, os, time, datetime, json, uuid, traceback
 from threading import Thread
 
-from webradio import Base
+from webradio import Base, IcyStream
 
 class Recorder(Thread,Base):
   """ Recorder-controller """
 
   RECORD_CHUNK = 65536                 # with 128kbs, this should be around 4s
+  BACKOFF_MAX  = 30                    # max. delay between reconnects (s)
 
   def __init__(self,app):
     """ initialization """
@@ -32,12 +33,14 @@ class Recorder(Thread,Base):
     self._app            = app
     self.debug           = app.debug
     self._api            = app.api
-    self._rec_thread     = None
-    self._rec_stop_event = None
-    self._rec_start_dt   = None
+    self._metrics        = app.metrics
+    self._lock           = threading.Lock()
+    self._recordings     = {}          # id -> recording (dict)
 
     self.read_config()
     self.register_apis()
+    self._metrics.gauge('webradio_recordings_active',
+                        lambda: len(self._recordings))
 
   # --- read configuration   --------------------------------------------------
 
@@ -60,6 +63,12 @@ class Recorder(Thread,Base):
       self._duration = int(self._app.options.duration)
     else:
       self._duration = int(self.get_value(self._app.parser,"RECORD","duration",60))
+    self._max_rec = int(self.get_value(self._app.parser,"RECORD",
+                                       "max_recordings",4))
+    self._fsync   = int(self.get_value(self._app.parser,"RECORD",
+                                       "fsync_interval",60))
+    self._icy     = self.get_value(self._app.parser,"RECORD",
+                                   "icy_mode","0") == "1"
 
   # --- register APIs   ------------------------------------------------------
 
@@ -67,108 +76,382 @@ class Recorder(Thread,Base):
     """ register API-functions """
 
     self._api.rec_start  = self.rec_start
+    self._api._rec_start = self._rec_start
     self._api.rec_stop   = self.rec_stop
     self._api.rec_toggle = self.rec_toggle
+    self._api.rec_list   = self.rec_list
 
   # --- return status of recorder   -------------------------------------------
 
   def is_recording(self):
     """ return status of recorder """
 
-    return self._rec_start_dt is not None
+    return len(self._recordings) > 0
+
+  # --- return public status of a recording   --------------------------------
+
+  def _rec_status(self,rec):
+    """ return status of recording (without internal objects) """
+
+    return {'id':       rec['id'],
+            'nr':       rec['channel']['nr'],
+            'name':     rec['channel']['name'],
+            'file':     rec['file'],
+            'start':    rec['start'],
+            'duration': rec['duration'],
+            'bytes':    rec['bytes'],
+            'gaps':     rec['gaps'],
+            'title':    rec['chapters'][-1][1] if rec['chapters'] else None,
+            'status':   rec['status']}
+
+  # --- open stream (resolve playlists)   ------------------------------------
+
+  def _open_stream(self,url):
+    """ open stream and return connection and file-extension """
+
+    conn,ext = IcyStream.open(url,metadata=self._icy)
+    if not ext:
+      self.msg('Recorder: unknown content type %r. Assuming mp3',
+               conn.headers.get_content_type())
+      ext = '.mp3'
+    return conn,ext
 
   # --- record stream   -------------------------------------------------------
 
-  def record_stream(self,channel):
+  def record_stream(self,rec):
     """ record the given stream """
 
-    name = channel['name']
-    url  = channel['url']
-    request = urllib.request.Request(url)
-    cur_dt_string = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = "%s%s%s_%s" % (self._target_dir,os.sep,cur_dt_string,
-                                                             name)
-
-    content_type = request.get_header('Content-Type')
-    if(content_type == 'audio/mpeg'):
-      filename += '.mp3'
-    elif(content_type == 'application/ogg' or content_type == 'audio/ogg'):
-      filename += '.ogg'
-    elif(content_type == 'audio/x-mpegurl'):
-      url = None
-      conn = urllib.request.urlopen(request)
-      with conn as stream:
-        if not line.startswith('#') and len(line) > 1:
-          url = line
-          stream.close()
-      if url:
-        request = urllib.request.Request(url)
-        filename += '.mp3'
+    name       = rec['channel']['name']
+    start_dt   = datetime.datetime.now()
+    start      = time.monotonic()
+    deadline   = start+60*rec['duration']
+    try:
+      buffer = None
+      if hasattr(self._api,'_stream_acquire'):
+        # share a single connection with the radio and other recordings
+        buffer = self._api._stream_acquire(rec['channel']['url'])
+      if buffer:
+        try:
+          self._record_buffer(rec,buffer,start_dt,deadline)
+        finally:
+          self._api._stream_release(buffer)
       else:
-        self.msg("Recorder: could not parse m3u-playlist")
-        return
-    else:
-      self.msg('Recorder: unknown content type %r. Assuming mp3' % content_type)
-      filename += '.mp3'
-
-    with open(filename, "wb") as stream:
-      self.msg('Recorder: recording %s for %d minutes' % (name,self._duration))
-      self._api._push_event({'type': 'rec_start',
-                             'value': {'name': name,
-                                       'duration': self._duration}})
-      conn = urllib.request.urlopen(request)
-      self._rec_start_dt = datetime.datetime.now()
-      while(not self._rec_stop_event.is_set() and
-            (datetime.datetime.now()-self._rec_start_dt).total_seconds() <
-                                                           60*self._duration):
-        stream.write(conn.read(Recorder.RECORD_CHUNK))
-
-    duration = int((datetime.datetime.now()-self._rec_start_dt).total_seconds()/60)
+        self._record_conn(rec,start_dt,deadline)
+    except:
+      self.msg("[WARNING] Recorder: recording of %s failed",name,force=True)
+      if self.debug:
+        traceback.print_exc()
+
+    duration = int((time.monotonic()-start)/60)
     self.msg('Recorder: recording finished')
+    rec['status'] = 'finished'
     self._api._push_event({'type': 'rec_stop',
-                             'value': {'file': filename,
+                             'value': {'id': rec['id'],
+                                       'file': rec['file'],
                                        'duration': duration}})
-    self._rec_stop_event.set()
+    with self._lock:
+      self._recordings.pop(rec['id'],None)
+
+  # --- create file of recording   --------------------------------------------
+
+  def _create_file(self,rec,ext,start_dt):
+    """ create output-file and publish start of recording """
+
+    name = rec['channel']['name']
+    rec['file'] = "%s%s%s_%s%s" % (self._target_dir,os.sep,
+                                   start_dt.strftime('%Y%m%d_%H%M%S'),name,ext)
+    stream = open(rec['file'],"wb")
+    self.msg('Recorder: recording %s for %d minutes',name,rec['duration'])
+    self._api._push_event({'type': 'rec_start',
+                           'value': {'id': rec['id'],
+                                     'name': name,
+                                     'duration': int(round(rec['duration']))}})
+    rec['start']  = start_dt.strftime("%Y-%m-%d %H:%M:%S")
+    rec['status'] = 'recording'
+    return stream
+
+  # --- record from own connection   -----------------------------------------
+
+  def _record_conn(self,rec,start_dt,deadline):
+    """ record from a dedicated connection to the stream """
+
+    conn,ext = self._open_stream(rec['channel']['url'])
+    if self._icy:
+      # strip metadata, write complete frames (mp3) and collect titles
+      rec['icy'] = IcyStream(IcyStream.metaint(conn),align=(ext == '.mp3'))
+    with conn, self._create_file(rec,ext,start_dt) as stream:
+      while True:
+        reason = self._copy_stream(rec,conn,stream,deadline)
+        conn.close()
+        if reason in ['deadline','stop']:
+          break
+        # stream broke: reconnect and continue with the same file
+        gap_start = datetime.datetime.now()
+        offset    = rec['bytes']
+        conn      = self._reconnect(rec,deadline)
+        self._log_gap(rec,gap_start,offset,reason)
+        if not conn:
+          break
+        if rec['icy']:
+          rec['icy'].reset(IcyStream.metaint(conn))      # drops partial frame
+
+  # --- record from shared stream-buffer   -----------------------------------
+
+  def _record_buffer(self,rec,buffer,start_dt,deadline):
+    """ record from a stream-buffer. The buffer never waits for the
+        recorder, if writing falls behind, the lost data is logged as gap
+    """
+
+    stop_event = rec['stop_event']
+    pos        = buffer.live()
+
+    # wait for the first data (the buffer might be new)
+    data = None
+    while not data:
+      if stop_event.is_set() or buffer.closed or time.monotonic() >= deadline:
+        return
+      data,next_pos = buffer.read(pos,Recorder.RECORD_CHUNK,timeout=1)
+    pos        = next_pos-len(data)
+    start_secs = buffer.seconds(pos)
+    if self._icy:
+      title = buffer.title(pos)
+      if title:
+        self._add_chapters(rec,[(0,title)])
+    next_sync  = time.monotonic() + self._fsync
+
+    with self._create_file(rec,buffer.ext,start_dt) as stream:
+      while True:
+        if data:
+          if next_pos-len(data) > pos:
+            gap_start = datetime.datetime.now()
+            self._log_gap(rec,gap_start,rec['bytes'],
+                          'overrun: lost %d bytes' % (next_pos-len(data)-pos))
+          stream.write(data)
+          rec['bytes'] += len(data)
+          self._metrics.inc('webradio_recorder_bytes_total',len(data))
+          if self._icy:
+            titles = buffer.titles(pos,next_pos)
+            if titles:
+              self._add_chapters(rec,[(buffer.seconds(p)-start_secs,t)
+                                      for p,t in titles])
+          pos = next_pos
+
+        now = time.monotonic()
+        if stop_event.is_set() or now >= deadline or buffer.closed:
+          break
+        if self._fsync and now >= next_sync:
+          stream.flush()
+          os.fsync(stream.fileno())
+          next_sync = now + self._fsync
+        data,next_pos = buffer.read(pos,Recorder.RECORD_CHUNK,timeout=1)
+
+  # --- copy data from connection to file   ----------------------------------
+
+  def _copy_stream(self,rec,conn,stream,deadline):
+    """ copy data until deadline, stop-request or end of stream.
+        Returns the reason for returning.
+    """
+
+    buffer     = memoryview(bytearray(Recorder.RECORD_CHUNK))
+    stop_event = rec['stop_event']
+    next_sync  = time.monotonic() + self._fsync
+
+    while not stop_event.is_set():
+      now = time.monotonic()
+      if now >= deadline:
+        return 'deadline'
+      if self._fsync and now >= next_sync:
+        stream.flush()
+        os.fsync(stream.fileno())
+        next_sync = now + self._fsync
+
+      try:
+        n = conn.readinto(buffer)
+      except Exception as ex:
+        self.msg("Recorder: stream of %s broken: %r",rec['channel']['name'],ex)
+        return 'error: %r' % ex
+      if not n:
+        self.msg("Recorder: end of stream for %s",rec['channel']['name'])
+        return 'eof'
+      if rec['icy']:
+        data = rec['icy'].feed(buffer[:n])
+        stream.write(data)
+        rec['bytes'] += len(data)
+        self._metrics.inc('webradio_recorder_bytes_total',len(data))
+        titles = rec['icy'].pop_titles()
+        if titles:
+          self._add_chapters(rec,titles)
+      else:
+        stream.write(buffer[:n])
+        rec['bytes'] += n
+        self._metrics.inc('webradio_recorder_bytes_total',n)
+    return 'stop'
+
+  # --- add chapters to recording   -------------------------------------------
+
+  def _add_chapters(self,rec,titles):
+    """ add title-changes to the chapter-list and rewrite the cue-sheet """
+
+    for pos,title in titles:
+      if not rec['chapters']:
+        pos = 0                        # first title starts the recording
+      self.msg("Recorder: title of %s at %.1fs: %s",rec['id'],pos,title)
+      rec['chapters'].append((pos,title))
+    if not rec['file'].endswith(".mp3"):
+      return                           # no positions without frame-alignment
+
+    cue_file = os.path.splitext(rec['file'])[0]+".cue"
+    lines = ['TITLE "%s"' % self._cue_str(rec['channel']['name']),
+             'FILE "%s" MP3' % os.path.basename(rec['file'])]
+    for index,(pos,title) in enumerate(rec['chapters']):
+      frames = int(round(75*pos))                   # cue-sheets use 1/75s
+      lines += ['  TRACK %02d AUDIO' % (index+1),
+                '    TITLE "%s"' % self._cue_str(title),
+                '    INDEX 01 %02d:%02d:%02d' % (frames//4500,
+                                                 (frames//75)%60,frames%75)]
+    try:
+      with open(cue_file+".tmp","w") as f:
+        f.write("\n".join(lines)+"\n")
+      os.replace(cue_file+".tmp",cue_file)
+    except:
+      self.msg("[WARNING] Recorder: could not write %s",cue_file,force=True)
+
+  # --- quote string for cue-sheet   ------------------------------------------
+
+  def _cue_str(self,text):
+    """ remove characters not allowed within quoted strings """
+
+    return text.replace('"',"'").replace('\n',' ').replace('\r',' ')
+
+  # --- reconnect to stream   -------------------------------------------------
+
+  def _reconnect(self,rec,deadline):
+    """ reconnect with exponential backoff until deadline or stop-request """
+
+    rec['status'] = 'reconnecting'
+    delay = 1
+    while True:
+      wait = min(delay,deadline-time.monotonic())
+      if wait <= 0 or rec['stop_event'].wait(wait):
+        return None
+      try:
+        conn,_ = self._open_stream(rec['channel']['url'])
+        self.msg("Recorder: reconnected to %s",rec['channel']['name'])
+        rec['status'] = 'recording'
+        return conn
+      except Exception as ex:
+        self.msg("Recorder: reconnect to %s failed: %r",
+                 rec['channel']['name'],ex)
+        delay = min(2*delay,Recorder.BACKOFF_MAX)
+
+  # --- log gap of recording   ------------------------------------------------
+
+  def _log_gap(self,rec,gap_start,offset,reason):
+    """ append gap to the sidecar-file <recording>.gaps (one json per line) """
+
+    gap_end = datetime.datetime.now()
+    gap = {'start':    gap_start.strftime("%Y-%m-%d %H:%M:%S"),
+           'end':      gap_end.strftime("%Y-%m-%d %H:%M:%S"),
+           'duration': round((gap_end-gap_start).total_seconds(),1),
+           'offset':   offset,
+           'reason':   reason}
+    rec['gaps'] += 1
+    self._metrics.inc('webradio_recorder_gaps_total')
+    self.msg("Recorder: gap in recording %s: %r",rec['id'],gap)
+    self._api._push_event({'type': 'rec_gap',
+                           'value': dict(gap,id=rec['id'],
+                                         name=rec['channel']['name'])})
+    try:
+      with open(rec['file']+".gaps","a") as f:
+        f.write(json.dumps(gap)+"\n")
+    except:
+      self.msg("[WARNING] Recorder: could not write %s.gaps",
+               rec['file'],force=True)
 
   # --- start recording   -----------------------------------------------------
 
-  def rec_start(self,nr=0,sync=False):
-    """ start recording (argument is channel number) """
+  def rec_start(self,nr=0,duration=None):
+    """ start recording (argument is channel number, duration is in
+        minutes), return id
+    """
+
+    return self._rec_start(nr,duration)
+
+  # --- start recording (internal)   ------------------------------------------
+
+  def _rec_start(self,nr=0,duration=None,sync=False):
+    """ start recording, with sync=True record in the calling thread
+        (not available as public API: sync is a string over http)
+    """
 
     channel = self._api.radio_get_channel(nr)
-    self.msg("Recorder: start recording of channel %d (%s)" %
-                                                (channel['nr'],channel['name']))
-    if self._rec_stop_event is None:
-      # no recording ongoing, start it
-      self._rec_stop_event = threading.Event()
-      if not sync:
-        self._rec_thread = Thread(target=self.record_stream,args=(channel,))
-        self._rec_thread.start()
-      else:
-        self.record_stream(channel)
+    with self._lock:
+      if len(self._recordings) >= self._max_rec:
+        self.msg("[WARNING] Recorder: maximum number of recordings (%d) reached",
+                 self._max_rec,force=True)
+        return None
+      rec = {'id':         uuid.uuid4().hex[:8],
+             'channel':    channel,
+             'file':       None,
+             'start':      None,
+             'duration':   float(duration) if duration else self._duration,
+             'bytes':      0,
+             'gaps':       0,
+             'icy':        None,
+             'chapters':   [],
+             'status':     'starting',
+             'stop_event': threading.Event(),
+             'thread':     None}
+      self._recordings[rec['id']] = rec
+
+    self.msg("Recorder: start recording %s of channel %d (%s)",
+             rec['id'],channel['nr'],channel['name'])
+    if not sync:
+      rec['thread'] = Thread(target=self.record_stream,args=(rec,))
+      rec['thread'].start()
+    else:
+      self.record_stream(rec)
+    return rec['id']
+
+  # --- list recordings   -----------------------------------------------------
+
+  def rec_list(self):
+    """ return status of all active recordings """
+
+    with self._lock:
+      return [self._rec_status(rec) for rec in self._recordings.values()]
 
   # --- stop recording   ------------------------------------------------------
 
-  def rec_stop(self):
-    """ stop recording """
+  def rec_stop(self,id=None):
+    """ stop given recording (default: stop all recordings) """
 
-    if self._rec_stop_event:
-      # recording is ongoing, so stop it
-      self.msg("Recorder: stop recording")
-      self._rec_stop_event.set()
-      if self._rec_thread:
-        self._rec_thread.join()
-      self._rec_thread     = None
-      self._rec_stop_event = None
-      self._rec_start_dt   = None
+    with self._lock:
+      if id:
+        recs = [self._recordings[id]] if id in self._recordings else []
+      else:
+        recs = list(self._recordings.values())
+
+    for rec in recs:
+      self.msg("Recorder: stop recording %s",rec['id'])
+      rec['stop_event'].set()
+    for rec in recs:
+      if rec['thread'] and rec['thread'] != threading.current_thread():
+        rec['thread'].join()
+    return len(recs) > 0
 
   # --- toggle recording   ----------------------------------------------------
 
   def rec_toggle(self,nr=0):
-    """ toggle recording """
-
-    if self._rec_stop_event:
-      # recording is ongoing, so stop it
-      self.rec_stop()
+    """ toggle recording of given channel """
+
+    nr = self._api.radio_get_channel(nr)['nr']
+    with self._lock:
+      ids = [rec['id'] for rec in self._recordings.values()
+             if rec['channel']['nr'] == nr]
+    if ids:
+      # recording of this channel is ongoing, so stop it
+      for id in ids:
+        self.rec_stop(id)
     else:
       self.rec_start(nr)
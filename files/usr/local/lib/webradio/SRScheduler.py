@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class Scheduler
+#
+# The class Scheduler starts timed recordings. Entries are kept in a
+# persistent priority-queue ordered by start-time.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, datetime, json, heapq, threading, traceback, uuid
+
+from webradio import Base
+
+class Scheduler(Base):
+  """ scheduler for timed recordings """
+
+  REPEAT   = {'once': None, 'daily': 1, 'weekly': 7}
+  MAX_WAIT = 60            # recheck clock at least every x seconds (no RTC)
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app        = app
+    self._api        = app.api
+    self.debug       = app.debug
+    self._stop_event = app.stop_event
+    self._cond       = threading.Condition()
+    self._entries    = {}                  # id -> entry
+    self._heap       = []                  # (start,id)
+
+    self.read_config()
+    self.register_apis()
+    self._load()
+    threading.Thread(target=self._run,name="Scheduler",daemon=True).start()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [RECORD]
+    self._store    = self.get_value(self._app.parser,"RECORD","schedule_file",
+                       os.path.join(os.path.expanduser("~"),
+                                    ".pi-webradio-schedule.json"))
+    self._pre_roll = int(self.get_value(self._app.parser,"RECORD",
+                                        "pre_roll",10))
+    self._duration = float(self.get_value(self._app.parser,"RECORD",
+                                          "duration",60))
+
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api.rec_schedule      = self.rec_schedule
+    self._api.rec_schedule_list = self.rec_schedule_list
+    self._api.rec_schedule_del  = self.rec_schedule_del
+
+  # --- add scheduled recording   ---------------------------------------------
+
+  def rec_schedule(self,nr,start,duration=None,repeat='once'):
+    """ schedule recording of channel nr. start is either
+        'YYYY-MM-DD HH:MM' or 'HH:MM' (next occurrence), duration is in
+        minutes and repeat is one of once, daily, weekly
+    """
+
+    if not repeat in Scheduler.REPEAT:
+      raise ValueError("invalid value for repeat: %s" % repeat)
+    # keep name and url, the channel-number changes if channels are edited
+    channel = self._api.radio_get_channel(nr)
+    entry = {'id':       uuid.uuid4().hex[:8],
+             'name':     channel['name'],
+             'url':      channel['url'],
+             'start':    self._parse_start(start),
+             'duration': float(duration) if duration else self._duration,
+             'repeat':   repeat}
+    self.msg("Scheduler: adding %r",entry)
+    with self._cond:
+      self._add_entry(entry)
+      self._save()
+      self._cond.notify()
+    return self._entry_status(entry)
+
+  # --- list scheduled recordings   ------------------------------------------
+
+  def rec_schedule_list(self):
+    """ return scheduled recordings ordered by start-time """
+
+    with self._cond:
+      entries = sorted(self._entries.values(),key=lambda e: e['start'])
+      return [self._entry_status(e) for e in entries]
+
+  # --- delete scheduled recording   ------------------------------------------
+
+  def rec_schedule_del(self,id):
+    """ delete scheduled recording (the heap-entry is dropped lazily) """
+
+    with self._cond:
+      if not id in self._entries:
+        return False
+      del self._entries[id]
+      self._save()
+      self._cond.notify()
+    return True
+
+  # --- stop scheduler   ------------------------------------------------------
+
+  def stop(self):
+    """ wake up and stop scheduler-thread """
+
+    with self._cond:
+      self._cond.notify()
+
+  # --- parse start-time   ----------------------------------------------------
+
+  def _parse_start(self,start):
+    """ parse start-time, return timestamp """
+
+    start = start.strip()
+    if len(start) <= 5:
+      t   = datetime.datetime.strptime(start,"%H:%M").time()
+      now = datetime.datetime.now()
+      dt  = datetime.datetime.combine(now.date(),t)
+      if dt <= now:
+        dt += datetime.timedelta(days=1)
+    else:
+      dt = datetime.datetime.fromisoformat(start)
+    return dt.timestamp()
+
+  # --- status of entry   -----------------------------------------------------
+
+  def _entry_status(self,entry):
+    """ return entry with formatted start-time """
+
+    status = dict(entry)
+    status['nr']    = self._channel_nr(entry)
+    status['start'] = datetime.datetime.fromtimestamp(
+      entry['start']).strftime("%Y-%m-%d %H:%M")
+    return status
+
+  # --- lookup channel-number of entry   --------------------------------------
+
+  def _channel_nr(self,entry):
+    """ return current channel-number of entry (0 if channel is gone) """
+
+    channels = self._api.radio_get_channels()
+    for channel in channels:
+      if channel['name'].lower() == entry['name'].lower():
+        return channel['nr']
+    for channel in channels:                   # channel was renamed
+      if channel['url'] == entry.get('url'):
+        return channel['nr']
+    return 0
+
+  # --- add entry to queue (caller holds lock)   ------------------------------
+
+  def _add_entry(self,entry):
+    """ add entry to queue """
+
+    self._entries[entry['id']] = entry
+    heapq.heappush(self._heap,(entry['start'],entry['id']))
+
+  # --- compute next start-time of repeating entry   --------------------------
+
+  def _next_start(self,entry,now):
+    """ return next start after now (or None for non-repeating entries) """
+
+    days = Scheduler.REPEAT[entry['repeat']]
+    if not days:
+      return None
+    dt = datetime.datetime.fromtimestamp(entry['start'])
+    while dt.timestamp() <= now:
+      dt += datetime.timedelta(days=days)       # keeps local time across DST
+    return dt.timestamp()
+
+  # --- scheduler-thread   ----------------------------------------------------
+
+  def _run(self):
+    """ wait for next due entry and start recording """
+
+    self.msg("Scheduler: starting scheduler-thread")
+    with self._cond:
+      while not self._stop_event.is_set():
+        if not self._heap:
+          self._cond.wait(Scheduler.MAX_WAIT)
+          continue
+        start,id = self._heap[0]
+        delay = start - self._pre_roll - time.time()
+        if delay > 0:
+          self._cond.wait(min(delay,Scheduler.MAX_WAIT))
+          continue
+
+        heapq.heappop(self._heap)
+        entry = self._entries.get(id)
+        if not entry or entry['start'] != start:
+          continue                                 # deleted or rescheduled
+        self._start_entry(entry)
+        self._save()
+    self.msg("Scheduler: stopping scheduler-thread")
+
+  # --- start recording of entry (caller holds lock)   ------------------------
+
+  def _start_entry(self,entry):
+    """ start recording and reschedule/remove entry """
+
+    now = time.time()
+    end = entry['start'] + 60*entry['duration']
+    if now < end:
+      # add pre-roll, but cut recording if we are late (e.g. after boot)
+      minutes = (end - min(now,entry['start']))/60
+      self.msg("Scheduler: starting recording of channel %s for %.1f minutes",
+               entry['name'],minutes)
+      try:
+        nr = self._channel_nr(entry)
+        if not nr:
+          raise ValueError("channel %s not found" % entry['name'])
+        self._api.rec_start(nr=nr,duration=minutes)
+      except:
+        self.msg("[WARNING] Scheduler: could not start recording of channel %s",
+                 entry['name'],force=True)
+        if self.debug:
+          traceback.print_exc()
+    else:
+      self.msg("Scheduler: missed recording of channel %s",
+               entry['name'],force=True)
+
+    next_start = self._next_start(entry,max(now,end))
+    if next_start:
+      entry['start'] = next_start
+      heapq.heappush(self._heap,(next_start,entry['id']))
+    else:
+      del self._entries[entry['id']]
+
+  # --- load queue   ----------------------------------------------------------
+
+  def _load(self):
+    """ load scheduled recordings """
+
+    try:
+      if os.path.exists(self._store):
+        self.msg("Scheduler: loading schedule from %s",self._store)
+        with open(self._store,"r") as f:
+          for entry in json.load(f):
+            self._add_entry(entry)
+    except:
+      self.msg("[WARNING] Scheduler: loading schedule failed",force=True)
+      if self.debug:
+        traceback.print_exc()
+
+  # --- save queue (caller holds lock)   --------------------------------------
+
+  def _save(self):
+    """ save scheduled recordings (write to temp-file and rename) """
+
+    try:
+      tmp = self._store + ".tmp"
+      with open(tmp,"w") as f:
+        json.dump(list(self._entries.values()),f,indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+      os.replace(tmp,self._store)
+    except:
+      self.msg("[WARNING] Scheduler: saving schedule failed",force=True)
+      if self.debug:
+        traceback.print_exc()
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class Search
+#
+# The class Search implements a full-text search over channel-names and
+# the MP3-files below the root-directory of the player. Tracks are indexed
+# in a SQLite FTS5-table which is updated incrementally in the background.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, re, time, hashlib, sqlite3, threading, traceback
+
+from webradio import Base, MP3Info
+
+class Search(Base):
+  """ full-text search for channels and files """
+
+  DEFAULT_DB = os.path.join(os.path.expanduser("~"),
+                            ".cache","pi-webradio","search.db")
+  MAX_LIMIT  = 100
+  MIN_RANKED = 3            # rank results only for words of this length
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app         = app
+    self._api         = app.api
+    self.debug        = app.debug
+    self._stop_event  = app.stop_event
+    self._lock        = threading.Lock()
+    self._index_lock  = threading.Lock()
+    self._mp3info     = MP3Info(app)
+    self._db          = None
+
+    self.read_config()
+    self.register_apis()
+    try:
+      self._open_db()
+    except Exception as ex:
+      # e.g. SQLite without FTS5: channels are still searchable
+      self.msg("[WARNING] Search: file-search disabled (%s: %s)",
+               self._db_file,ex,force=True)
+      self._db = None
+      return
+    self.search_update()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [PLAYER]
+    self._root_dir = os.path.abspath(
+      self.get_value(self._app.parser,"PLAYER","player_root_dir",
+                     os.path.expanduser("~")))
+    self._db_file  = self.get_value(self._app.parser,"PLAYER","search_db",
+                                    Search.DEFAULT_DB)
+
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api.search        = self.search
+    self._api.search_update = self.search_update
+
+  # --- open (and create) database   -----------------------------------------
+
+  def _open_db(self):
+    """ open database and create tables """
+
+    os.makedirs(os.path.dirname(self._db_file),exist_ok=True)
+    db = sqlite3.connect(self._db_file,check_same_thread=False)
+    with self._lock:
+      db.execute("PRAGMA journal_mode=WAL")
+      db.execute("PRAGMA synchronous=NORMAL")
+      db.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS files USING fts5
+                    (artist, album, title, comment,
+                     dir UNINDEXED, fname UNINDEXED,
+                     tokenize='unicode61 remove_diacritics 2',
+                     prefix='1 2 3')""")
+      columns = [c[1] for c in db.execute("PRAGMA table_info(dirs)")]
+      if 'mtime' in columns:
+        # old index only knows the mtime of directories: rebuild
+        db.execute("DROP TABLE dirs")
+        db.execute("DELETE FROM files")
+      db.execute("""CREATE TABLE IF NOT EXISTS dirs
+                    (dir TEXT PRIMARY KEY, stamp TEXT)""")
+      db.commit()
+    self._db = db
+
+  # --- search channels and files   ------------------------------------------
+
+  def search(self,q,limit=20,kind=None):
+    """ search channels and files. Every word of the query must match
+        (as a prefix) a word of the channel-name or artist, album, title or
+        comment of a file. kind is one of None, 'channels', 'files'.
+    """
+
+    limit = min(max(1,int(limit)),Search.MAX_LIMIT)
+    words = [w for w in re.split(r'\W+',q.lower()) if w]
+    result = {'channels': [], 'files': []}
+    if not words:
+      return result
+
+    if kind in [None,'channels']:
+      result['channels'] = self._search_channels(words,limit)
+    if kind in [None,'files']:
+      result['files'] = self._search_files(words,limit)
+    return result
+
+  # --- search channels   -----------------------------------------------------
+
+  def _search_channels(self,words,limit):
+    """ prefix-search within channel-names (the list is small) """
+
+    hits = []
+    for channel in self._api.radio_get_channels():
+      tokens = [t for t in re.split(r'\W+',channel['name'].lower()) if t]
+      if all(any(t.startswith(w) for t in tokens) for w in words):
+        hits.append({'nr': channel['nr'], 'name': channel['name']})
+        if len(hits) == limit:
+          break
+    return hits
+
+  # --- search files   --------------------------------------------------------
+
+  def _search_files(self,words,limit):
+    """ prefix-search within the FTS-index """
+
+    if not self._db:
+      return []
+    query = " AND ".join(['"%s"*' % w.replace('"','""') for w in words])
+
+    # ranking very short prefixes would need to score most of the index,
+    # so results are unordered while the user types the first characters
+    if max(len(w) for w in words) >= Search.MIN_RANKED:
+      order = "ORDER BY rank"
+    else:
+      order = ""
+
+    start = time.monotonic()
+    with self._lock:
+      rows = self._db.execute("""SELECT dir, fname, artist, album, title
+                                 FROM files WHERE files MATCH ?
+                                 %s LIMIT ?""" % order,
+                              (query,limit)).fetchall()
+    self.msg("Search: query %s: %d hits in %.1fms",
+             query,len(rows),1000*(time.monotonic()-start))
+    return [{'dir': d, 'fname': f, 'artist': a, 'album': b, 'title': t}
+            for d,f,a,b,t in rows]
+
+  # --- update index   --------------------------------------------------------
+
+  def search_update(self):
+    """ start (incremental) update of the file-index in the background """
+
+    if not self._db:
+      return False
+    if self._index_lock.locked():
+      self.msg("Search: index-update already running")
+      return False
+    threading.Thread(target=self._update_index,daemon=True).start()
+    return True
+
+  # --- update index (thread)   -----------------------------------------------
+
+  def _update_index(self):
+    """ walk root-directory and update changed directories """
+
+    with self._index_lock:
+      start = time.monotonic()
+      try:
+        with self._lock:
+          known = dict(self._db.execute("SELECT dir, stamp FROM dirs"))
+        seen  = set()
+        count = 0
+        for path,dirs,_ in os.walk(self._root_dir):
+          if self._stop_event.is_set():
+            return
+          dirs[:] = [d for d in dirs if not d.startswith('.')]
+          rel_dir = path[len(self._root_dir):]+os.path.sep
+          seen.add(rel_dir)
+          try:
+            stamp,mtime = self._dir_stamp(path)
+          except OSError:
+            continue
+          if known.get(rel_dir) == stamp:
+            continue
+          self._index_dir(path,rel_dir,stamp,mtime)
+          count += 1
+
+        # remove directories which don't exist anymore
+        with self._lock:
+          for rel_dir in set(known.keys())-seen:
+            self._db.execute("DELETE FROM files WHERE dir=?",(rel_dir,))
+            self._db.execute("DELETE FROM dirs WHERE dir=?",(rel_dir,))
+          self._db.commit()
+        self.msg("Search: updated %d directories in %.1fs",
+                 count,time.monotonic()-start)
+      except:
+        self.msg("[WARNING] Search: index-update failed",force=True)
+        if self.debug:
+          traceback.print_exc()
+
+  # --- stamp of a directory   -----------------------------------------------
+
+  def _dir_stamp(self,path):
+    """ return (stamp,mtime) of directory. The stamp changes if a file is
+        added, removed or modified in place (e.g. by a tag-editor), mtime
+        is the newest modification-time of the directory and its files
+    """
+
+    mtime   = os.path.getmtime(path)
+    entries = []
+    with os.scandir(path) as it:
+      for entry in it:
+        if entry.name.startswith('.') or not entry.is_file():
+          continue
+        stat  = entry.stat()
+        mtime = max(mtime,stat.st_mtime)
+        entries.append((entry.name,stat.st_mtime_ns,stat.st_size))
+    entries.sort()
+    return hashlib.md5(repr(entries).encode('utf-8')).hexdigest(),mtime
+
+  # --- index a single directory   --------------------------------------------
+
+  def _index_dir(self,path,rel_dir,stamp,mtime):
+    """ replace index-entries of a directory """
+
+    try:
+      dirinfo = self._mp3info.get_dirinfo(path,mtime=mtime)
+    except:
+      self.msg("Search: could not query dir-info of %s",path)
+      return
+    rows = [(f['artist'],f['album'],f['title'],f['comment'],rel_dir,f['fname'])
+            for f in dirinfo['files']]
+    with self._lock:
+      self._db.execute("DELETE FROM files WHERE dir=?",(rel_dir,))
+      self._db.executemany("""INSERT INTO files
+                              (artist,album,title,comment,dir,fname)
+                              VALUES (?,?,?,?,?,?)""",rows)
+      self._db.execute("INSERT OR REPLACE INTO dirs VALUES (?,?)",
+                       (rel_dir,stamp))
+      self._db.commit()
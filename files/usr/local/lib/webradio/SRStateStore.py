@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class StateStore
+#
+# The class StateStore saves the persistent state of the application. It
+# polls the state in the background and writes changes (debounced and
+# batched) atomically. The previous version of the file is kept as
+# last good snapshot.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, json, threading, traceback
+
+from webradio import Base
+
+class StateStore(Base):
+  """ crash-safe store for the persistent state """
+
+  CHECK_INTERVAL = 5        # collect state every x seconds
+
+  def __init__(self,app,path,collect,compact=False):
+    """ initialization: collect is a function returning the current state,
+        compact states are written without whitespace
+    """
+
+    self._app        = app
+    self.debug       = app.debug
+    self._stop_event = app.stop_event
+    self._path       = path
+    self._backup     = path + ".bak"
+    self._collect    = collect
+    self._compact    = compact
+    self._lock       = threading.Lock()
+    self._saved      = None            # serialized state of last write
+
+    # section [GLOBAL]
+    self._interval = int(self.get_value(app.parser,"GLOBAL",
+                                        "state_interval",60))
+
+  # --- load state   ----------------------------------------------------------
+
+  def load(self):
+    """ load state (fallback: last good snapshot) """
+
+    for path in [self._path,self._backup]:
+      if not os.path.exists(path):
+        continue
+      try:
+        self.msg("StateStore: Loading settings from %s",path)
+        with open(path,"r") as f:
+          data = f.read()
+        state = json.loads(data)
+        if path == self._path:
+          self._saved = data
+        else:
+          self.msg("[WARNING] StateStore: using last good snapshot %s",
+                   path,force=True)
+        return state
+      except:
+        self.msg("[WARNING] StateStore: could not load %s",path,force=True)
+        if self.debug:
+          traceback.print_exc()
+    return {}
+
+  # --- start background-thread   ---------------------------------------------
+
+  def start(self):
+    """ start saving changes periodically """
+
+    if self._interval > 0:
+      threading.Thread(target=self._run,name="StateStore",daemon=True).start()
+
+  # --- save state   -----------------------------------------------------------
+
+  def save(self):
+    """ collect and save state (if changed) """
+
+    self._write(self._serialize(self._collect()))
+
+  # --- serialize state   ------------------------------------------------------
+
+  def _serialize(self,state):
+    """ convert state to json """
+
+    if self._compact:
+      return json.dumps(state,separators=(',',':'),sort_keys=True)
+    return json.dumps(state,indent=2,sort_keys=True)
+
+  # --- write state   ----------------------------------------------------------
+
+  def _write(self,data):
+    """ write state atomically and keep the previous version """
+
+    with self._lock:
+      if data == self._saved:
+        return
+      self.msg("StateStore: Saving settings to %s",self._path)
+      tmp = self._path + ".tmp"
+      try:
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)),exist_ok=True)
+        with open(tmp,"w") as f:
+          f.write(data)
+          f.flush()
+          os.fsync(f.fileno())
+        if self._saved is not None and os.path.exists(self._path):
+          # the current file is known to be good
+          os.replace(self._path,self._backup)
+        os.replace(tmp,self._path)
+
+        # persist the renames
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self._path)),
+                         os.O_RDONLY)
+        try:
+          os.fsync(dir_fd)
+        finally:
+          os.close(dir_fd)
+        self._saved = data
+      except:
+        self.msg("[WARNING] StateStore: could not save %s",
+                 self._path,force=True)
+        if self.debug:
+          traceback.print_exc()
+
+  # --- poll state and save changes (thread)   --------------------------------
+
+  def _run(self):
+    """ write changes after the state is stable for one check-interval
+        or after at most interval seconds
+    """
+
+    self.msg("StateStore: starting state-thread")
+    last    = None
+    pending = None                     # time of first unsaved change
+    while not self._stop_event.wait(StateStore.CHECK_INTERVAL):
+      try:
+        data = self._serialize(self._collect())
+      except:
+        if self.debug:
+          traceback.print_exc()
+        continue
+      if data == self._saved:
+        pending = None
+      else:
+        now = time.monotonic()
+        if pending is None:
+          pending = now
+        if data == last or now - pending >= self._interval:
+          self._write(data)
+          pending = None
+      last = data
+    self.msg("StateStore: stopping state-thread")
@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class StreamBuffer
+#
+# The class StreamBuffer fetches a live stream and keeps the last part of
+# the stream in a bounded ring-buffer (in memory or in a file). Readers
+# address the data with absolute byte-positions and never block the
+# fetcher: a reader which falls behind just skips the lost data.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, mmap, time, bisect, tempfile, threading, traceback
+
+from webradio import Base, IcyStream
+
+class StreamBuffer(Base):
+  """ ring-buffer for a live stream """
+
+  READ_CHUNK     = 16384
+  READ_TIMEOUT   = 5                   # readers recheck state every x seconds
+  META_INT       = 16000               # metadata-interval for ICY-clients
+  INDEX_INTERVAL = 1.0                 # distance of time-index entries (s)
+  BACKOFF_MAX    = 30                  # max. delay between reconnects (s)
+  DEFAULT_RATE   = 16000               # bytes/s if the index is too short
+
+  def __init__(self,app,url,size,dir=None):
+    """ initialization """
+
+    self._api     = app.api
+    self.debug    = app.debug
+    self.url      = url
+    self.ext      = None
+    self.content_type = 'audio/mpeg'
+    self.size     = size
+    self._cond    = threading.Condition()
+    self._start   = 0                  # oldest available position
+    self._end     = 0                  # next write-position
+    self._titles  = []                 # (position,title)
+    self._index   = []                 # (position,seconds)
+    self._users   = 0
+    self.closed   = False
+
+    if dir:
+      self._file = tempfile.TemporaryFile(dir=dir,prefix=".buffer.")
+      self._file.truncate(size)
+      self._data = None
+    else:
+      # anonymous mapping: the kernel only allocates pages when written
+      self._file = None
+      self._data = mmap.mmap(-1,size)
+
+    self.msg("StreamBuffer: buffering %s (%d bytes in %s)",
+             url,size,dir if dir else "memory")
+    threading.Thread(target=self._fetch,name="StreamBuffer",
+                     daemon=True).start()
+
+  # --- register and unregister users   ---------------------------------------
+
+  def acquire(self):
+    """ register user of the buffer """
+
+    with self._cond:
+      self._users += 1
+
+  def release(self):
+    """ unregister user, close buffer after the last user is gone.
+        Returns True if the buffer was closed.
+    """
+
+    with self._cond:
+      self._users -= 1
+      if self._users > 0:
+        return False
+    self.close()
+    return True
+
+  # --- close buffer   ---------------------------------------------------------
+
+  def close(self):
+    """ stop fetcher and wake up readers """
+
+    self.msg("StreamBuffer: closing buffer for %s",self.url)
+    with self._cond:
+      self.closed = True
+      self._cond.notify_all()
+
+  # --- positions   ------------------------------------------------------------
+
+  def live(self):
+    """ return live position """
+
+    return self._end
+
+  def oldest(self):
+    """ return oldest available position """
+
+    return self._start
+
+  # --- read data   ------------------------------------------------------------
+
+  def read(self,pos,size=READ_CHUNK,timeout=None):
+    """ read up to size bytes starting at pos. Returns (data,next-pos).
+        Data is empty after a timeout or if the buffer is closed.
+    """
+
+    with self._cond:
+      pos = min(pos,self._end)
+      if pos == self._end and not self.closed:
+        self._cond.wait_for(lambda: self._end > pos or self.closed,timeout)
+      if self.closed:
+        return b'',pos
+      pos = max(pos,self._start)                 # reader fell behind
+      n   = min(size,self._end-pos)
+      if n <= 0:
+        return b'',pos
+      offset = pos % self.size
+      first  = min(n,self.size-offset)
+      if self._data is not None:
+        data = self._data[offset:offset+first] + self._data[:n-first]
+      else:
+        data = os.pread(self._file.fileno(),first,offset)
+        if n > first:
+          data += os.pread(self._file.fileno(),n-first,0)
+      return bytes(data),pos+n
+
+  # --- read data continuously (generator)   ---------------------------------
+
+  def reader(self,pos,metaint=0):
+    """ yield (data,next-position) starting at pos until the buffer is
+        closed. With metaint > 0, ICY-metadata-blocks are inserted
+    """
+
+    since = 0
+    title = None
+    while True:
+      data,next_pos = self.read(pos,timeout=StreamBuffer.READ_TIMEOUT)
+      if not data:
+        if self.closed:
+          return
+        continue
+      if not metaint:
+        yield data,next_pos
+        pos = next_pos
+        continue
+
+      pos  = next_pos-len(data)                  # skipped lost data
+      view = memoryview(data)
+      while view:
+        n      = min(len(view),metaint-since)
+        chunk  = bytes(view[:n])
+        view   = view[n:]
+        pos   += n
+        since += n
+        if since == metaint:
+          since     = 0
+          new_title = self.title(pos)
+          if new_title != title:
+            title  = new_title
+            chunk += self._meta_block(title)
+          else:
+            chunk += b'\0'
+        yield chunk,pos
+
+  # --- wait for data   --------------------------------------------------------
+
+  def wait(self,timeout):
+    """ wait until the buffer has data, return False on timeout or close """
+
+    with self._cond:
+      self._cond.wait_for(lambda: self._end > 0 or self.closed,timeout)
+      return self._end > 0 and not self.closed
+
+  # --- create metadata-block   -----------------------------------------------
+
+  def _meta_block(self,title):
+    """ create ICY metadata-block with the given title """
+
+    meta = ("StreamTitle='%s';" % (title if title else "")).encode('utf-8')
+    meta = meta[:16*255]
+    n    = (len(meta)+15)//16
+    return bytes([n]) + meta.ljust(16*n,b'\0')
+
+  # --- convert position to stream-time   -------------------------------------
+
+  def seconds(self,pos):
+    """ return stream-time (seconds) of position """
+
+    with self._cond:
+      if not self._index:
+        return 0.0
+      i = max(0,bisect.bisect_right(self._index,(pos,float('inf')))-1)
+      p,s = self._index[i]
+      return s + (pos-p)/self._rate()
+
+  # --- convert stream-time to position   -------------------------------------
+
+  def position(self,seconds):
+    """ return position of stream-time seconds """
+
+    with self._cond:
+      if not self._index:
+        return self._end
+      times = [s for _,s in self._index]
+      i = max(0,bisect.bisect_right(times,seconds)-1)
+      p,s = self._index[i]
+      pos = p + int((seconds-s)*self._rate())
+      return min(max(pos,self._start),self._end)
+
+  # --- return title at position   --------------------------------------------
+
+  def title(self,pos):
+    """ return stream-title at position (or None) """
+
+    with self._cond:
+      i = bisect.bisect_right(self._titles,(pos,chr(0x10ffff)))
+      return self._titles[i-1][1] if i else None
+
+  # --- return title-changes within range   ---------------------------------
+
+  def titles(self,start,end):
+    """ return title-changes (position,title) with start < position <= end """
+
+    with self._cond:
+      return [(p,t) for p,t in self._titles if start < p <= end]
+
+  # --- return status   --------------------------------------------------------
+
+  def status(self):
+    """ return status of buffer """
+
+    return {'url':      self.url,
+            'size':     self.size,
+            'used':     self._end-self._start,
+            'buffered': round(self.seconds(self._end) -
+                              self.seconds(self._start),1),
+            'users':    self._users}
+
+  # --- average rate (bytes/s, caller holds lock)   ---------------------------
+
+  def _rate(self):
+    """ estimate rate of stream from the time-index """
+
+    if len(self._index) > 1:
+      p0,s0 = self._index[0]
+      p1,s1 = self._index[-1]
+      if s1 > s0:
+        return (p1-p0)/(s1-s0)
+    return StreamBuffer.DEFAULT_RATE
+
+  # --- append data   ----------------------------------------------------------
+
+  def _append(self,data,titles,seconds):
+    """ append data to ring-buffer and update titles and index """
+
+    with self._cond:
+      n = len(data)
+      if n:
+        offset = self._end % self.size
+        first  = min(n,self.size-offset)
+        if self._data is not None:
+          self._data[offset:offset+first] = data[:first]
+          self._data[:n-first]            = data[first:]
+        else:
+          os.pwrite(self._file.fileno(),data[:first],offset)
+          if n > first:
+            os.pwrite(self._file.fileno(),data[first:],0)
+        self._end  += n
+        self._start = max(self._start,self._end-self.size)
+
+      for _,title in titles:
+        self._titles.append((self._end,title))
+      if not self._index or (
+          seconds - self._index[-1][1] >= StreamBuffer.INDEX_INTERVAL):
+        self._index.append((self._end,seconds))
+
+      # drop outdated entries (but keep the entry valid at the start)
+      i = bisect.bisect_right(self._index,(self._start,float('inf')))
+      if i > 1:
+        del self._index[:i-1]
+      i = bisect.bisect_right(self._titles,(self._start,chr(0x10ffff)))
+      if i > 1:
+        del self._titles[:i-1]
+      self._cond.notify_all()
+
+  # --- fetch stream (thread)   -----------------------------------------------
+
+  def _fetch(self):
+    """ fetch stream and reconnect until the buffer is closed """
+
+    icy   = None
+    delay = 1
+    start = time.monotonic()
+    while not self.closed:
+      try:
+        conn,ext = IcyStream.open(self.url,metadata=True)
+        self.ext = ext if ext else '.mp3'
+        self.content_type = conn.headers.get_content_type()
+        if icy:
+          icy.reset(IcyStream.metaint(conn))
+        else:
+          icy = IcyStream(IcyStream.metaint(conn),align=(self.ext == '.mp3'))
+        delay = 1
+        with conn:
+          while not self.closed:
+            data = conn.read1(StreamBuffer.READ_CHUNK)
+            if not data:
+              self.msg("StreamBuffer: end of stream %s",self.url)
+              break
+            data = icy.feed(data)
+            # stream-time: exact for mp3, otherwise based on arrival-time
+            seconds = icy.position() if self.ext == '.mp3' else \
+                      time.monotonic()-start
+            self._append(data,icy.pop_titles(),seconds)
+      except Exception as ex:
+        self.msg("StreamBuffer: stream %s broken: %r",self.url,ex)
+        if self.debug:
+          traceback.print_exc()
+
+      with self._cond:
+        if not self.closed:
+          self._cond.wait(delay)
+      delay = min(2*delay,StreamBuffer.BACKOFF_MAX)
+
+    with self._cond:
+      if self._file:
+        self._file.close()
+      else:
+        self._data.close()
+    self.msg("StreamBuffer: stopped fetching %s",self.url)
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class ThumbCache
+#
+# The class ThumbCache creates and caches resized versions of images
+# (channel-logos, cover-art) in a number of fixed sizes.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, glob, hashlib, threading, traceback
+
+from webradio import Base
+
+# PIL is optional: without it, the original images are used
+try:
+  from PIL import Image
+  have_pil = True
+except:
+  have_pil = False
+
+class ThumbCache(Base):
+  """ cache for resized images """
+
+  # size-variants: name: (width,height,exact)
+  SIZES = {
+    'list': (128,128,False),           # channel-list of web-gui
+    'play': (200,200,False),           # play-tab of web-gui
+    'lcd':  (240,240,True)             # ST7789 display (Pirate-Audio)
+    }
+
+  DEFAULT_DIR = os.path.join(os.path.expanduser("~"),
+                             ".cache","pi-webradio","thumbs")
+  MAX_SOURCES = 256                    # keep x added images (cover-art)
+
+  def __init__(self,cache_dir=None,debug=False):
+    """ initialization """
+
+    self.debug      = debug
+    self._cache_dir = cache_dir if cache_dir else ThumbCache.DEFAULT_DIR
+    self._lock      = threading.Lock()
+    self._thumbs    = {}
+    try:
+      os.makedirs(self._cache_dir,exist_ok=True)
+    except:
+      self.msg("[WARNING] ThumbCache: could not create %s",self._cache_dir,
+               force=True)
+
+  # --- return thumbnail   ----------------------------------------------------
+
+  def get(self,src,size):
+    """ return path of thumbnail of src (fallback: src itself) """
+
+    if not size in ThumbCache.SIZES:
+      return None
+    try:
+      mtime = os.path.getmtime(src)
+    except OSError:
+      return None
+
+    key   = (src,size)
+    entry = self._thumbs.get(key)
+    if entry and entry[0] == mtime:
+      return entry[1]
+    elif not have_pil:
+      return src
+
+    # thumbnail-name is keyed on source-path, size and mtime of source
+    prefix = "%s_%s_" % (hashlib.sha1(src.encode('utf-8')).hexdigest()[:16],
+                         size)
+    ext    = ".png" if src.lower().endswith(".png") else ".jpg"
+    thumb  = os.path.join(self._cache_dir,"%s%d%s" % (prefix,int(mtime),ext))
+    if not os.path.exists(thumb):
+      try:
+        self._create(src,thumb,ThumbCache.SIZES[size])
+      except:
+        self.msg("ThumbCache: could not create thumbnail for %s",src)
+        if self.debug:
+          traceback.print_exc()
+        return src
+      self._remove_stale(prefix,thumb)
+
+    with self._lock:
+      self._thumbs[key] = (mtime,thumb)
+    return thumb
+
+  # --- add image-data to the cache   ----------------------------------------
+
+  def add(self,data,ext):
+    """ add image-data (e.g. embedded cover-art) to the cache.
+        The file is content-addressed, so identical images are only
+        stored once. Returns the path of the file.
+    """
+
+    key  = hashlib.sha1(data).hexdigest()
+    path = os.path.join(self._cache_dir,"src_%s%s" % (key,ext))
+    if os.path.exists(path):
+      # mark as used: set atime only, the mtime is part of the thumb-names
+      os.utime(path,(time.time(),os.path.getmtime(path)))
+    else:
+      self.msg("ThumbCache: adding %s (%d bytes)",path,len(data))
+      tmp = "%s.%d.tmp" % (path,os.getpid())
+      with open(tmp,"wb") as f:
+        f.write(data)
+      os.replace(tmp,path)
+      self._evict_sources()
+    return path
+
+  # --- remove least recently used images   ----------------------------------
+
+  def _evict_sources(self):
+    """ remove added images (and their thumbnails) beyond MAX_SOURCES """
+
+    with self._lock:
+      sources = []
+      for f in glob.glob(os.path.join(self._cache_dir,"src_*")):
+        try:
+          if not f.endswith(".tmp"):
+            sources.append((os.stat(f).st_atime,f))
+        except OSError:
+          pass
+      if len(sources) <= ThumbCache.MAX_SOURCES:
+        return
+      sources.sort()
+      for _,src in sources[:len(sources)-ThumbCache.MAX_SOURCES]:
+        self.msg("ThumbCache: removing %s",src)
+        prefix = hashlib.sha1(src.encode('utf-8')).hexdigest()[:16]
+        for f in [src]+glob.glob(os.path.join(self._cache_dir,prefix+"_*")):
+          try:
+            os.remove(f)
+          except OSError:
+            pass
+        for key in [k for k in self._thumbs if k[0] == src]:
+          del self._thumbs[key]
+
+  # --- create thumbnails in the background   --------------------------------
+
+  def prefill(self,files):
+    """ create thumbnails of all sizes for the given files """
+
+    def _prefill():
+      for f in files:
+        for size in ThumbCache.SIZES:
+          self.get(f,size)
+      self.msg("ThumbCache: prefilled thumbnails of %d files",len(files))
+
+    if have_pil:
+      threading.Thread(target=_prefill,daemon=True).start()
+
+  # --- create a thumbnail   --------------------------------------------------
+
+  def _create(self,src,thumb,dim):
+    """ create resized image (write to temp-file and rename) """
+
+    width,height,exact = dim
+    self.msg("ThumbCache: creating %s (%dx%d)",thumb,width,height)
+    with Image.open(src) as im:
+      if exact:
+        img = im.resize((width,height))
+      else:
+        img = im.copy()
+        img.thumbnail((width,height))
+    if thumb.endswith(".jpg") and not img.mode in ['RGB','L']:
+      img = img.convert('RGB')
+
+    tmp = "%s.%d.tmp" % (thumb,os.getpid())
+    img.save(tmp,format="PNG" if thumb.endswith(".png") else "JPEG")
+    os.replace(tmp,thumb)
+
+  # --- remove outdated versions of a thumbnail   ----------------------------
+
+  def _remove_stale(self,prefix,thumb):
+    """ remove thumbnails of older versions of the source """
+
+    for f in glob.glob(os.path.join(self._cache_dir,prefix+"*")):
+      if f != thumb and not f.endswith(".tmp"):
+        try:
+          os.remove(f)
+        except:
+          pass
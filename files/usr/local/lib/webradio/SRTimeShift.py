@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Pi-Webradio: implementation of class TimeShift
+#
+# The class TimeShift manages the stream-buffers of live streams. It
+# serves the buffers to mpg123 with a small http-server on localhost,
+# so the radio can pause, rewind and catch up to live without
+# reconnecting to the station. The buffers are shared between the radio
+# and the recorder, so every stream is only fetched once. Only the buffer
+# of the radio gets the full time-shift size, all buffers together are
+# limited by a global budget.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# -----------------------------------------------------------------------------
+
+import threading, traceback, urllib.parse, itertools
+import http.server
+
+from webradio import Base, StreamBuffer, IcyStream
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+  """ request-handler of the local stream-server """
+
+  protocol_version = 'HTTP/1.0'
+
+  def do_GET(self):
+    self.server.timeshift._serve(self)
+
+  def log_message(self,format,*args):
+    pass
+
+class TimeShift(Base):
+  """ time-shift buffers for live streams """
+
+  SHARED_SIZE = 2*1024*1024            # buffer-size without time-shift
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app      = app
+    self._api      = app.api
+    self.debug     = app.debug
+    self._backend  = app.backend
+    self._lock     = threading.Lock()
+    self._buffers  = {}                # url -> StreamBuffer
+    self._used     = 0                 # total size of all buffers
+    self._ids      = {}                # id -> StreamBuffer
+    self._next_id  = itertools.count(1)
+    self._buffer   = None              # buffer played by the radio
+    self._path     = None              # path of current local url
+    self._direct   = None              # url played by mpg123 directly
+    self._pos      = 0                 # position served to mpg123
+    self._server   = None
+
+    self.read_config()
+    self.register_apis()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [RADIO]
+    self._enabled = self.get_value(self._app.parser,"RADIO",
+                                   "timeshift","0") == "1"
+    self._size    = int(self.get_value(self._app.parser,"RADIO",
+                                       "timeshift_size",32))*1024*1024
+    self._dir     = self.get_value(self._app.parser,"RADIO",
+                                   "timeshift_dir",None)
+    self._budget  = int(self.get_value(self._app.parser,"RADIO",
+                                       "timeshift_budget",64))*1024*1024
+
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api.radio_rewind     = self.radio_rewind
+    self._api.radio_forward    = self.radio_forward
+    self._api.radio_live       = self.radio_live
+    self._api.radio_timeshift  = self.radio_timeshift
+    self._api._stream_acquire  = self._stream_acquire
+    self._api._stream_release  = self._stream_release
+    self._api._timeshift_play  = self._timeshift_play
+    self._api._timeshift_stop  = self._timeshift_stop
+
+  # --- acquire buffer of a stream   -----------------------------------------
+
+  def _stream_acquire(self,url):
+    """ return shared buffer for url (None if the budget is exhausted) """
+
+    with self._lock:
+      buffer,created = self._acquire(url,TimeShift.SHARED_SIZE)
+      switch = created and url == self._direct
+
+    if switch and buffer.wait(IcyStream.TIMEOUT):
+      # the radio plays this url with its own connection: switch the
+      # radio to the new buffer, so the stream is only fetched once
+      with self._lock:
+        if url == self._direct:                  # radio did not change
+          self.msg("TimeShift: switching radio to shared buffer")
+          self._direct = None
+          self._start_server()
+          buffer.acquire()
+          self._buffer = buffer
+          self._load(buffer.live())
+    return buffer
+
+  # --- acquire buffer (caller holds lock)   ---------------------------------
+
+  def _acquire(self,url,size):
+    """ return (buffer,created) for url. A new buffer gets the given size
+        (limited by the budget), an existing buffer keeps its size.
+    """
+
+    buffer  = self._buffers.get(url)
+    created = not buffer
+    if created:
+      free = self._budget - self._used
+      if free < TimeShift.SHARED_SIZE:
+        self.msg("[WARNING] TimeShift: budget exhausted, not buffering %s",
+                 url,force=True)
+        return None,False
+      size   = min(size,free)
+      buffer = StreamBuffer(self._app,url,size,self._dir)
+      buffer.id = str(next(self._next_id))
+      self._buffers[url]   = buffer
+      self._ids[buffer.id] = buffer
+      self._used += size
+    buffer.acquire()
+    return buffer,created
+
+  # --- release buffer of a stream   -----------------------------------------
+
+  def _stream_release(self,buffer):
+    """ release buffer, remove it after the last user is gone """
+
+    with self._lock:
+      self._release(buffer)
+
+  def _release(self,buffer):
+    """ release buffer (caller holds lock) """
+
+    if buffer.release():
+      self._buffers.pop(buffer.url,None)
+      self._ids.pop(buffer.id,None)
+      self._used -= buffer.size
+
+  # --- play stream from buffer   --------------------------------------------
+
+  def _timeshift_play(self,url):
+    """ return url for mpg123: the local url of the buffer of url if
+        time-shift is enabled or the url is already buffered (e.g. for a
+        recording), otherwise url itself
+    """
+
+    with self._lock:
+      if self._buffer and self._buffer.url == url:
+        return self._local_url()                 # no change
+      self._stop()
+      buffer = None
+      if self._enabled or url in self._buffers:
+        buffer,_ = self._acquire(url,self._size if self._enabled else
+                                     TimeShift.SHARED_SIZE)
+      if not buffer:
+        self._direct = url
+        return url
+      self._start_server()
+      self._buffer = buffer
+      return self._local_url(buffer.live())
+
+  # --- stop playing from buffer   -------------------------------------------
+
+  def _timeshift_stop(self):
+    """ release buffer of the radio """
+
+    with self._lock:
+      self._stop()
+
+  def _stop(self):
+    """ release buffer of the radio (caller holds lock) """
+
+    self._direct = None
+    if self._buffer:
+      self._release(self._buffer)
+      self._buffer = None
+      self._path   = None
+
+  # --- rewind   -------------------------------------------------------------
+
+  def radio_rewind(self,secs=30):
+    """ rewind radio by secs seconds (limited by the buffer) """
+
+    return self._jump(-float(secs))
+
+  # --- fast forward   ---------------------------------------------------------
+
+  def radio_forward(self,secs=30):
+    """ forward radio by secs seconds (limited by the live position) """
+
+    return self._jump(float(secs))
+
+  # --- catch up to live   -----------------------------------------------------
+
+  def radio_live(self):
+    """ continue playing at the live position """
+
+    with self._lock:
+      if not self._buffer:
+        return None
+      self._load(self._buffer.live())
+    return self.radio_timeshift()
+
+  # --- return status   --------------------------------------------------------
+
+  def radio_timeshift(self):
+    """ return status of time-shift: delay to live and buffered seconds """
+
+    if not self._buffer:
+      return {'enabled': self._enabled, 'delay': 0, 'buffered': 0}
+    buffer = self._buffer
+    status = buffer.status()
+    status['enabled'] = self._enabled
+    status['delay']   = round(buffer.seconds(buffer.live()) -
+                              buffer.seconds(self._pos),1)
+    return status
+
+  # --- jump relative to the current position   ------------------------------
+
+  def _jump(self,secs):
+    """ restart mpg123 at a new position of the buffer """
+
+    with self._lock:
+      if not self._buffer:
+        return None
+      buffer  = self._buffer
+      target  = buffer.seconds(self._pos) + secs
+      if target >= buffer.seconds(buffer.live()):
+        pos = buffer.live()
+      else:
+        pos = buffer.position(target)
+      self._load(pos)
+    return self.radio_timeshift()
+
+  # --- load local url at position (caller holds lock)   ---------------------
+
+  def _load(self,pos):
+    """ reload mpg123 at the given position """
+
+    self.msg("TimeShift: loading %s at position %d",self._buffer.url,pos)
+    self._backend.play(self._local_url(pos))
+    self._api._push_event({'type': 'radio_timeshift',
+                           'value': self.radio_timeshift()})
+
+  # --- local url   ------------------------------------------------------------
+
+  def _local_url(self,pos=None):
+    """ return local url for the given position (None: current url) """
+
+    if pos is not None:
+      self._pos  = pos
+      self._path = "/%s?pos=%d" % (self._buffer.id,pos)
+    return "http://127.0.0.1:%d%s" % (self._server.server_port,self._path)
+
+  # --- start local server   -------------------------------------------------
+
+  def _start_server(self):
+    """ start local http-server (on first use) """
+
+    if self._server:
+      return
+    self._server = http.server.ThreadingHTTPServer(('127.0.0.1',0),_Handler)
+    self._server.daemon_threads = True
+    self._server.timeshift      = self
+    threading.Thread(target=self._server.serve_forever,name="TimeShift",
+                     daemon=True).start()
+    self.msg("TimeShift: started local server on port %d",
+             self._server.server_port)
+
+  # --- stop buffers and server   --------------------------------------------
+
+  def stop(self):
+    """ close all buffers and stop local server """
+
+    with self._lock:
+      for buffer in self._buffers.values():
+        buffer.close()
+    if self._server:
+      self._server.shutdown()
+
+  # --- serve buffer (called from request-handler)   -------------------------
+
+  def _serve(self,handler):
+    """ serve buffer to client, optionally with inline metadata """
+
+    url    = urllib.parse.urlparse(handler.path)
+    query  = urllib.parse.parse_qs(url.query)
+    buffer = self._ids.get(url.path.strip('/'))
+    if not buffer:
+      handler.send_error(404)
+      return
+    pos     = int(query.get('pos',[buffer.live()])[0])
+    metaint = StreamBuffer.META_INT if handler.headers.get(
+                                       'Icy-MetaData') == '1' else 0
+
+    handler.send_response(200)
+    handler.send_header('Content-Type',buffer.content_type)
+    if metaint:
+      handler.send_header('icy-metaint',str(metaint))
+    handler.end_headers()
+    self.msg("TimeShift: serving %s from position %d",buffer.url,pos)
+
+    try:
+      for data,pos in buffer.reader(pos,metaint):
+        if handler.path == self._path:
+          self._pos = pos
+        handler.wfile.write(data)
+    except (BrokenPipeError,ConnectionResetError):
+      pass
+    except:
+      if self.debug:
+        traceback.print_exc()
+    self.msg("TimeShift: client of %s disconnected",buffer.url)
@@ -68,8 +68,8 @@ class VoskController(Base):
       }
 
     try:
-      self.msg("VoskController: reading vosk-config from %s" %
-                                                   VoskController.CONFIG_FILE)
+      self.msg("VoskController: reading vosk-config from %s",
+               VoskController.CONFIG_FILE)
       f = open(VoskController.CONFIG_FILE,"r")
       vosk_config = json.load(f)
       f.close()
@@ -92,7 +92,7 @@ class VoskController(Base):
     """ toggle command-mode """
 
     self._cmd_mode = mode
-    self.msg("VoskController: command-mode set to: '%r'" % self._cmd_mode)
+    self.msg("VoskController: command-mode set to: '%r'",self._cmd_mode)
 
   # --- process audio-block   ------------------------------------------------
 
@@ -100,7 +100,7 @@ class VoskController(Base):
     """This is called (from a separate thread) for each audio block."""
 
     if status:
-      self.msg("VoskController: status %s" % status)
+      self.msg("VoskController: status %s",status)
     if self._stop.is_set():
       self._audio_queue.put(None)
     else:
@@ -172,7 +172,7 @@ class VoskController(Base):
             break
           if rec.AcceptWaveform(data):
             phrase = json.loads(rec.FinalResult())['text']
-            self.msg("VoskController: phrase: '%s'" % phrase)
+            self.msg("VoskController: phrase: '%s'",phrase)
             if phrase in self._wmap:
               # only process valid commands ...
               if self._wmap[phrase][0] == "_set_cmd_mode":
@@ -186,7 +186,7 @@ class VoskController(Base):
                 if self._wmap[phrase][0] != "vol_mute_on":
                   yield ["vol_mute_off"]
               else:
-                self.msg("VoskController: not in command-mode, ignoring %s" %
+                self.msg("VoskController: not in command-mode, ignoring %s",
                          phrase)
             elif len(phrase):
               # non-empty, but unknown phrase
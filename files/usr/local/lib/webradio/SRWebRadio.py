@@ -13,10 +13,10 @@
 #
 # -----------------------------------------------------------------------------
 
-import os, sys, json, traceback, threading
+import os, sys, traceback, threading
 import configparser
 
-from webradio import *
+from webradio import Base, Logger, Api, Metrics, StateStore
 
 # --- main application class   ----------------------------------------------
 
@@ -31,9 +31,10 @@ class WebRadio(Base):
     self.options    = options
     self.parser     = configparser.RawConfigParser(inline_comment_prefixes=(';',))
     self.parser.optionxform = str
-    self.parser.read('/etc/pi-webradio.conf')
+    self.parser.read(options.config)
 
     self.read_config(options)
+    self._logger = Logger(self)
     self._store = os.path.join(os.path.expanduser("~"),".pi-webradio.json")
 
     self._threads    = []                   # thread-store
@@ -42,21 +43,25 @@ class WebRadio(Base):
     # create API-object and register our own functions
     self.api = Api(self)
     self.register_apis()
+    self.metrics = Metrics(self)
 
-    # create all objects
+    # create (and import) only the objects needed for the selected mode
     if options.do_record:
+      from webradio import RadioEvents, Radio, Recorder
       self._events  = RadioEvents(self)
       self.backend  = None
       self.radio    = Radio(self)
       self.recorder = Recorder(self)
       self._objects = [self,self.radio,self.recorder]
     elif options.do_play:
+      from webradio import RadioEvents, Mpg123, Radio, Player
       self._events  = RadioEvents(self)
       self.backend  = Mpg123(self)
       self.radio    = Radio(self)
       self.player   = Player(self)
       self._objects = [self,self.radio,self.player,self.backend]
     elif options.do_list:
+      from webradio import Radio
       self.backend  = None
       self.radio    = Radio(self)
       self._objects = [self,self.radio]
@@ -65,19 +70,26 @@ class WebRadio(Base):
       self.radio    = None
       self._objects = [self]
     else:
+      from webradio import RadioEvents, Mpg123, TimeShift, Radio, Player
       self._events  = RadioEvents(self)
-      self._server  = WebServer(self)
       self.backend  = Mpg123(self)
+      self.timeshift = TimeShift(self)
       self.radio    = Radio(self)
       self.player   = Player(self)
-      self.recorder = Recorder(self)
-      self._objects = [self,self.radio,self.player,
-                       self.recorder,self.backend]
+      self._objects = [self,self.radio,self.player,self.backend]
+      if not self._play_on_boot:
+        self._create_services()
 
     self._state = {'mode': 'radio'}
+    self._state_store = StateStore(self,self._store,self._collect_state)
+    self._persistent  = {}
     self._load_state()
     if self.backend:
       self.backend.create()
+    if hasattr(self,'_server'):
+      self._state_store.start()
+    elif self._play_on_boot and self.backend and not options.do_play:
+      self._boot_play()            # play-on-boot: services start in run()
 
   # --- read configuration   -------------------------------------------------
 
@@ -89,6 +101,38 @@ class WebRadio(Base):
       self.debug = True
     else:
       self.debug  = self.get_value(self.parser,"GLOBAL", "debug","0") == "1"
+    self._play_on_boot = self.get_value(self.parser,"GLOBAL",
+                                        "play_on_boot","0") == "1"
+
+  # --- create services (everything not needed for playing)   ---------------
+
+  def _create_services(self):
+    """ create webserver and background-services """
+
+    from webradio import WebServer, ChannelHealth, Recorder, Scheduler, Search
+    self._server   = WebServer(self)
+    self.health    = ChannelHealth(self)
+    self.recorder  = Recorder(self)
+    self.scheduler = Scheduler(self)
+    self.search    = Search(self)
+    self._objects.insert(3,self.recorder)
+
+  # --- play last channel or file   -------------------------------------------
+
+  def _boot_play(self):
+    """ resume last channel or file directly after startup """
+
+    try:
+      if self._state['mode'] == 'player' and self.player.get_file():
+        self.msg("WebRadio: play-on-boot: resuming last file")
+        self.api.player_play_file()
+      else:
+        self.msg("WebRadio: play-on-boot: resuming last channel")
+        self.api.radio_on()
+    except:
+      self.msg("[WARNING] WebRadio: play-on-boot failed",force=True)
+      if self.debug:
+        traceback.print_exc()
 
   # --- register APIs   ------------------------------------------------------
 
@@ -108,7 +152,7 @@ class WebRadio(Base):
   def _get_version(self):
     """ return version """
 
-    self.msg("WebRadio: version: %s" % WebRadio.VERSION)
+    self.msg("WebRadio: version: %s",WebRadio.VERSION)
     return WebRadio.VERSION
 
   # --- return state   -----------------------------------------------------
@@ -203,36 +247,35 @@ class WebRadio(Base):
       self.api._push_event({'type': 'state', 'value': self._state})
     return
 
-  # --- query state of objects and save   -------------------------------------
+  # --- query state of objects   ---------------------------------------------
 
-  def _save_state(self):
-    """ query and save state of objects """
+  def _collect_state(self):
+    """ query state of objects (keep state of objects not created yet) """
 
-    state = {}
+    state = dict(self._persistent)
     for obj in self._objects:
       state[obj.__module__] = obj.get_persistent_state()
+    return state
 
-    f = open(self._store,"w")
-    self.msg("WebRadio: Saving settings to %s" % self._store)
-    json.dump(state,f,indent=2,sort_keys=True)
-    f.close()
+  # --- query state of objects and save   -------------------------------------
+
+  def _save_state(self):
+    """ query and save state of objects """
+
+    self._state_store.save()
 
   # --- load state of objects   -----------------------------------------------
 
-  def _load_state(self):
-    """ load state of objects """
+  def _load_state(self,objects=None):
+    """ load state of objects (default: all objects) """
 
     try:
-      if not os.path.exists(self._store):
-        state = {}
-      else:
-        self.msg("Webradio: Loading settings from %s" % self._store)
-        f = open(self._store,"r")
-        state = json.load(f)
-        f.close()
-      for obj in self._objects:
-        if obj.__module__ in state:
-          obj.set_persistent_state(state[obj.__module__])
+      if objects is None:
+        self._persistent = self._state_store.load()
+        objects = self._objects
+      for obj in objects:
+        if obj.__module__ in self._persistent:
+          obj.set_persistent_state(self._persistent[obj.__module__])
     except:
       self.msg("Webradio: Loading settings failed")
       if self.debug:
@@ -268,21 +311,44 @@ class WebRadio(Base):
   def cleanup(self):
     """ cleanup of ressources """
 
+    if hasattr(self,'player'):
+      self.player.stop()                 # needs the position of the backend
     if hasattr(self,'backend') and self.backend:
       self.backend.destroy()
     if hasattr(self,'_server') and self._server:
       self._server.stop()
     self.stop_event.set()
+    if hasattr(self,'scheduler'):
+      self.scheduler.stop()
+    if hasattr(self,'timeshift'):
+      self.timeshift.stop()
+    if hasattr(self,'health'):
+      self.health.stop()
     if hasattr(self.api,'rec_stop'):
       self.api.rec_stop()
     map(threading.Thread.join,self._threads)
     self._save_state()
     self.msg("Webradio: ... done stopping program")
+    self._logger.stop()
 
   # --- run method   ----------------------------------------------------------
 
   def run(self):
     """ start all threads and return """
 
-    threading.Thread(target=self._server.run).start()
-    self.msg("WebRadio: started web-server")
+    if hasattr(self,'_server'):
+      threading.Thread(target=self._server.run).start()
+      self.msg("WebRadio: started web-server")
+    else:
+      threading.Thread(target=self._run_services).start()
+
+  # --- create and start services after play-on-boot   -----------------------
+
+  def _run_services(self):
+    """ create services, restore their state and start the web-server """
+
+    self._create_services()
+    self._load_state([self.recorder])
+    self._state_store.start()
+    self.msg("WebRadio: started services")
+    self._server.run()
@@ -12,14 +12,14 @@
 
 # --- System-Imports   -------------------------------------------------------
 
-import os, json, queue, traceback, uuid
+import os, json, queue, traceback, uuid, threading
 
 from flask import Flask, Response, render_template, request, make_response
-from flask import send_from_directory, send_file
+from flask import send_from_directory, send_file, abort
 
 from werkzeug.serving import make_server, WSGIRequestHandler
 
-from webradio import Base
+from webradio import Base, AssetCache, ThumbCache, IcyStream, StreamBuffer
 
 class WebServer(Base):
   """ Serve GUI and process API-requests """
@@ -38,8 +38,27 @@ class WebServer(Base):
     self._flask = Flask('pi-webradio',template_folder=self._web_root,
                         root_path=self._web_root)
     self._flask.debug = self.debug
+    self._assets = AssetCache(app,self._web_root)
+    self._flask.jinja_env.globals['asset'] = self._assets.url
+    self._index  = None
+    self._index_version = None
+    self._thumbs = ThumbCache(self._thumb_dir,self.debug)
+    self.register_apis()
+    if hasattr(self._api,'radio_get_channels'):
+      # channels were read before the webserver existed (play-on-boot)
+      self._thumb_prefill([os.path.join(self._web_root,c['logo'])
+                          for c in self._api.radio_get_channels()
+                          if c.get('logo')])
     self._set_routes()
 
+  # --- register APIs   ------------------------------------------------------
+
+  def register_apis(self):
+    """ register API-functions """
+
+    self._api._thumb_prefill = self._thumb_prefill
+    self._api._thumb_add     = self._thumb_add
+
   # --- read configuration   --------------------------------------------------
 
   def read_config(self,pgm_dir):
@@ -53,6 +72,11 @@ class WebServer(Base):
       os.path.join(pgm_dir,"..","lib","webradio","web"))
     self._web_root  = self.get_value(self._app.parser,"WEB","web_root",
                                          default_web_root)
+    self._thumb_dir = self.get_value(self._app.parser,"WEB","thumb_dir",
+                                     ThumbCache.DEFAULT_DIR)
+    self._relay     = self.get_value(self._app.parser,"WEB","relay","0") == "1"
+    self._burst     = int(self.get_value(self._app.parser,"WEB",
+                                         "relay_burst",5))
 
   # --- set up routing   -----------------------------------------------------
 
@@ -65,12 +89,17 @@ class WebServer(Base):
     self._flask.add_url_rule('/webfonts/<path:filepath>','webfonts',self.webfonts)
     self._flask.add_url_rule('/images/<path:filepath>','images',self.images)
     self._flask.add_url_rule('/js/<path:filepath>','js',self.js_pages)
+    self._flask.add_url_rule('/thumbs/<size>/<path:filepath>','thumbs',
+                             self.thumbs)
     self._flask.add_url_rule('/api/get_events','get_events',self.get_events)
     self._flask.add_url_rule('/api/player_get_cover',
                              'player_get_cover',self.get_cover)
     self._flask.add_url_rule('/api/update_state','update_state',
                              self.update_state,methods=['POST'])
     self._flask.add_url_rule('/api/<path:api>','api',self.process_api)
+    if self._relay:
+      self._flask.add_url_rule('/stream/<int:nr>','stream',self.relay)
+    self._flask.add_url_rule('/metrics','metrics',self.metrics)
 
   # --- return absolute path of web-files   ----------------------------------
 
@@ -81,21 +110,106 @@ class WebServer(Base):
   # --- static routes   ------------------------------------------------------
 
   def css_pages(self,filepath):
-    return send_from_directory(self._get_path('css'),filepath)
+    return self._send_asset(self._assets.get(os.path.join('css',filepath)))
 
   def webfonts(self,filepath):
-    return send_from_directory(self._get_path('webfonts'),filepath)
-  
+    return self._send_asset(self._assets.get(os.path.join('webfonts',filepath)))
+
   def images(self,filepath):
-    return send_from_directory(self._get_path('images'),filepath)
-  
+    return self._send_asset(self._assets.get(os.path.join('images',filepath)))
+
   def js_pages(self,filepath):
-    return send_from_directory(self._get_path('js'),filepath)
-  
+    return self._send_asset(self._assets.get(os.path.join('js',filepath)))
+
+  # --- resized images   ----------------------------------------------------
+
+  def thumbs(self,size,filepath):
+    """ return resized image (only images below web-root/images) """
+
+    images = os.path.realpath(self._get_path('images'))
+    src    = os.path.realpath(self._get_path(filepath))
+    if not os.path.commonpath([images,src]) == images:
+      abort(404)
+    thumb = self._thumbs.get(src,size)
+    if not thumb:
+      abort(404)
+    response = send_file(thumb,conditional=True)
+    response.headers['Cache-Control'] = self._assets.cache_control(
+      'v' in request.args)
+    return response
+
+  # --- create thumbnails of logos   ----------------------------------------
+
+  def _thumb_prefill(self,files):
+    """ create thumbnails of the given images in the background
+        (only images below web-root/images)
+    """
+
+    if isinstance(files,str):
+      files = [files]
+    images = os.path.realpath(self._get_path('images'))
+    files  = [f for f in map(os.path.realpath,files)
+              if os.path.commonpath([images,f]) == images]
+    self._thumbs.prefill(files)
+    return len(files)
+
+  # --- add image to thumbnail-cache   ---------------------------------------
+
+  def _thumb_add(self,data,ext):
+    """ add image-data (bytes, e.g. embedded cover-art) to the
+        thumbnail-cache and return the path of the file
+    """
+
+    if not isinstance(data,bytes) or not ext in ['.jpg','.png']:
+      raise ValueError("_thumb_add needs image-data and extension .jpg|.png")
+    return self._thumbs.add(data,ext)
+
+  # --- send cached asset   --------------------------------------------------
+
+  def _send_asset(self,asset,versioned=None):
+    """ send asset with the best encoding and cache-headers """
+
+    if not asset:
+      abort(404)
+    if versioned is None:
+      versioned = request.args.get('v') == asset['etag']
+
+    # select encoding supported by the client
+    encoding = 'identity'
+    for enc in ['br','gzip']:
+      if enc in asset['data'] and request.accept_encodings.quality(enc) > 0:
+        encoding = enc
+        break
+    if encoding == 'identity':
+      etag = asset['etag']
+    else:
+      etag = "%s-%s" % (asset['etag'],encoding)
+
+    if etag in request.if_none_match:
+      response = make_response(('',304))
+    else:
+      response = make_response(asset['data'][encoding])
+      response.content_type = asset['mimetype']
+      if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = self._assets.cache_control(versioned)
+    return response
+
   # --- main page   ----------------------------------------------------------
 
   def main_page(self):
-    return render_template("index.html")
+    """ return pre-rendered main page (rendered again if one of the
+        referenced assets changed, since the page contains their versions)
+    """
+
+    if (not self._index or self.debug or
+        self._index_version != self._assets.version()):
+      page = render_template("index.html").encode('utf-8')
+      self._index = self._assets.create(page,"text/html; charset=utf-8")
+      self._index_version = self._assets.version()
+    return self._send_asset(self._index,versioned=False)
 
   # --- process API-call   -------------------------------------------------
 
@@ -104,24 +218,24 @@ class WebServer(Base):
 
     if api.startswith("_"):
       # internal API, illegal request!
-      self.msg("illegal api-call: %s" % api)
+      self.msg("illegal api-call: %s",api)
       msg = '"illegal request /api/%s"' % api
       response = make_response(('{"msg": ' + msg +'}',400))
       response.content_type = 'application/json'
       return response
     else:
-      self.msg("processing api-call: %s" % api)
+      self.msg("processing api-call: %s",api)
       try:
         response = self._api._exec(api,**request.args)
         return json.dumps(response)
       except NotImplementedError as err:
-        self.msg("illegal request: /api/%s" % api)
+        self.msg("illegal request: /api/%s",api)
         msg = '"/api/%s not implemented"' % api
         response = make_response(('{"msg": ' + msg +'}',400))
         response.content_type = 'application/json'
         return response
       except Exception as ex:
-        self.msg("exception while calling: /api/%s" % api)
+        self.msg("exception while calling: /api/%s",api)
         traceback.print_exc()
         msg = '"internal server error"'
         response = make_response(('{"msg": ' + msg +'}',500))
@@ -153,13 +267,77 @@ class WebServer(Base):
   # --- return cover   -----------------------------------------------------
 
   def get_cover(self,dir="ignored"):
-    """ return cover if available """
+    """ return cover if available (optionally resized) """
 
     cover = self._api._player_get_cover_file()
-    if cover:
-      return send_file(cover)
+    if not cover:
+      cover = self._get_path('images','default.png')
+    size = request.args.get('size')
+    if size:
+      cover = self._thumbs.get(cover,size) or cover
+
+    # the url does not change with the cover, so clients must revalidate
+    response = send_file(cover,conditional=True)
+    response.headers['Cache-Control'] = self._assets.cache_control(False)
+    return response
+
+  # --- relay stream of channel   -----------------------------------------
+
+  def relay(self,nr):
+    """ relay stream of channel nr (0: current channel). All listeners
+        of a channel share a single upstream connection
+    """
+
+    try:
+      channel = self._api.radio_get_channel(nr)
+    except:
+      abort(404)
+    buffer = self._api._stream_acquire(channel['url'])
+    if not buffer:
+      abort(503)
+    if not buffer.wait(IcyStream.TIMEOUT):
+      self._api._stream_release(buffer)
+      abort(504)
+
+    # late joiners start a few seconds behind live, so clients can fill
+    # their buffers at once
+    live  = buffer.live()
+    start = buffer.position(buffer.seconds(live)-self._burst)
+    if request.headers.get('Icy-MetaData') == '1':
+      metaint = StreamBuffer.META_INT
     else:
-      return send_from_directory(self._get_path('images'),'default.png')
+      metaint = 0
+    self.msg("WebServer: relaying channel %d from position %d",
+             channel['nr'],start)
+
+    def stream():
+      for data,_ in buffer.reader(start,metaint):
+        yield data
+
+    # release the buffer even if the stream is never iterated (HEAD-request
+    # or client disconnects before the first chunk)
+    def release():
+      self.msg("WebServer: listener of channel %d disconnected",channel['nr'])
+      self._api._stream_release(buffer)
+
+    response = Response(stream(),mimetype=buffer.content_type)
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-cache, no-store'
+    response.headers['icy-name']      = channel['name'].encode(
+                                          'latin-1','replace').decode('latin-1')
+    if metaint:
+      response.headers['icy-metaint'] = str(metaint)
+    return response
+
+  # --- metrics in Prometheus text-format   --------------------------------
+
+  def metrics(self):
+    """ return metrics in Prometheus text-format """
+
+    response = make_response(self._app.metrics.prometheus())
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache, no-store'
+    return response
 
   # --- stream SSE (server sent events)   ----------------------------------
 
@@ -191,7 +369,8 @@ class WebServer(Base):
     """ stop the web-server """
 
     self.msg("WebServer: process stop-request")
-    self._server.shutdown()
+    if hasattr(self,'_server'):            # not started yet (play-on-boot)
+      self._server.shutdown()
 
   # --- service-loop   -----------------------------------------------------
 
@@ -209,9 +388,11 @@ class WebServer(Base):
                                  request_handler=QuietHandler,threaded=True)
     ctx = self._flask.app_context()
     ctx.push()
+    threading.Thread(target=self._assets.preload,
+                     args=('css','js','webfonts','images')).start()
 
     self.msg("WebServer: starting the web-server in debug-mode")
-    self.msg("WebServer: listening on port %s" % self._port)
-    self.msg("WebServer: using web-root: %s" % self._web_root)
+    self.msg("WebServer: listening on port %s",self._port)
+    self.msg("WebServer: using web-root: %s",self._web_root)
     self._server.serve_forever()
     self.msg("WebServer: finished")
@@ -1,8 +1,10 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 # ----------------------------------------------------------------------------
-# Pi-Webradio application module. The file just imports all classes
-# into the wstation namespace
+# Pi-Webradio application module. The file makes all classes available
+# in the webradio namespace. Classes (and their dependencies like flask or
+# eyed3) are only imported on first access, so every program only pays
+# for the modules it really uses.
 #
 # Author: Bernhard Bablok
 # License: GPL3
@@ -11,24 +13,57 @@
 #
 # ----------------------------------------------------------------------------
 
-from . SRBase           import Base           as Base
-from . SRApi            import Api            as Api
-from . SREventFormatter import EventFormatter as EventFormatter
-from . SRRadioEvents    import RadioEvents    as RadioEvents
-from . SRRadio          import Radio          as Radio
-from . SRMP3Info        import MP3Info        as MP3Info
-from . SRPlayer         import Player         as Player
-from . SRRecorder       import Recorder       as Recorder
-from . SRMpg123         import Mpg123         as Mpg123
-from . SRWebServer      import WebServer      as WebServer
-from . SRWebRadio       import WebRadio       as WebRadio
-from . SRRadioClient    import RadioClient    as RadioClient
-from . SRKeyController  import KeyController  as KeyController
+import importlib
 
-# voice control with Vosk is optional
-have_vosk = False
-try:
-  from . SRVoskController  import VoskController  as VoskController
-  have_vosk = True
-except:
-  pass
+# class-name -> module
+_CLASSES = {
+  'Base':           'SRBase',
+  'Logger':         'SRLogger',
+  'Api':            'SRApi',
+  'Metrics':        'SRMetrics',
+  'EventFormatter': 'SREventFormatter',
+  'RadioEvents':    'SRRadioEvents',
+  'StateStore':     'SRStateStore',
+  'IcyStream':      'SRIcyStream',
+  'ThumbCache':     'SRThumbCache',
+  'ChannelStore':   'SRChannelStore',
+  'Radio':          'SRRadio',
+  'ChannelHealth':  'SRChannelHealth',
+  'MP3Info':        'SRMP3Info',
+  'Player':         'SRPlayer',
+  'Search':         'SRSearch',
+  'StreamBuffer':   'SRStreamBuffer',
+  'TimeShift':      'SRTimeShift',
+  'Recorder':       'SRRecorder',
+  'Scheduler':      'SRScheduler',
+  'Mpg123':         'SRMpg123',
+  'AssetCache':     'SRAssetCache',
+  'WebServer':      'SRWebServer',
+  'WebRadio':       'SRWebRadio',
+  'RadioClient':    'SRRadioClient',
+  'KeyController':  'SRKeyController',
+  'VoskController': 'SRVoskController',
+  }
+
+# voice control with Vosk is optional, so it is not part of "import *"
+__all__ = [name for name in _CLASSES if name != 'VoskController']
+
+# --- import class on first access (PEP 562)   ------------------------------
+
+def __getattr__(name):
+  if name == 'have_vosk':
+    try:
+      __getattr__('VoskController')
+      value = True
+    except:
+      value = False
+  elif name in _CLASSES:
+    module = importlib.import_module("."+_CLASSES[name],__name__)
+    value  = getattr(module,name)
+  else:
+    raise AttributeError("module %r has no attribute %r" % (__name__,name))
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(list(globals()) + list(_CLASSES) + ['have_vosk'])
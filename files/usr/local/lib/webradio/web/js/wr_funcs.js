@@ -317,7 +317,7 @@ function handle_event_play(file) {
     }
     wr_state.player.last_index = wr_file2index[file];
     $('#f_'+wr_state.player.last_index).addClass('file_item_selected');
-    cover_url = '/api/player_get_cover?dir='+encodeURIComponent(
+    cover_url = '/api/player_get_cover?size=play&dir='+encodeURIComponent(
           wr_state.player.last_dir);
     $('#wr_play_logo').attr('src',cover_url);
   }
@@ -394,7 +394,8 @@ function getChannels() {
           .appendTo("#channel_grid");
         if (channel.logo) {
           // create image
-          item.html("<img class=\"ch_img\" src=\""+channel.logo+"\"/>");
+          item.html("<img class=\"ch_img\" src=\""+
+                    channel_logo(channel,'list')+"\"/>");
           } else {
             // create text
           item.html("<div class=\"ch_txt\">"+channel.name+"</div>");
@@ -404,6 +405,18 @@ function getChannels() {
     });
 };
 
+/**
+  return url of (resized) channel-logo
+*/
+
+function channel_logo(channel,size) {
+  if (channel.thumbs && channel.thumbs[size]) {
+    return channel.thumbs[size];
+  } else {
+    return channel.logo;
+  }
+}
+
 /**
   show channel-info
 */
@@ -411,7 +424,7 @@ function getChannels() {
 function update_channel_info(channel) {
   $('#wr_radio').empty();
   if (channel.logo) {
-    $('#wr_play_logo').attr('src',channel.logo);
+    $('#wr_play_logo').attr('src',channel_logo(channel,'play'));
     $('#wr_play_name').empty();
   } else {
     $('#wr_play_logo').attr('src','/images/default.png');
@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Create a synthetic mp3-library and benchmark the indexing (MP3Info).
+#
+#   mp3-library.py create [options] root
+#
+# creates a tree of directories (depth -d, width -w) with -f files per
+# leaf-directory. The files consist of valid MPEG1 layer III frames (CBR
+# or VBR with Xing-header) and ID3v2-tags in various encodings, including
+# mojibake (UTF-8 stored as latin-1). Some files get a cue-sheet.
+#
+#   mp3-library.py bench [options] root
+#
+# runs get_dirinfo and write_dirinfo cold (no .dirinfo-files) and warm
+# over the library. Every phase runs in a fresh interpreter and reports
+# files/sec and the peak RSS.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# ----------------------------------------------------------------------------
+
+import locale, os, sys, time, json, random, struct, threading, subprocess
+import resource, configparser, logging
+from   argparse import ArgumentParser, SUPPRESS
+
+# MPEG1 layer III, 44.1 kHz: bitrate-index -> kbit/s
+BITRATES = {1: 32, 2: 40, 3: 48, 4: 56, 5: 64, 6: 80, 7: 96, 8: 112,
+            9: 128, 10: 160, 11: 192, 12: 224, 13: 256, 14: 320}
+SAMPLES  = 1152                        # samples per frame
+RATE     = 44100
+
+# text-variants of the ID3v2-tags
+TEXTS = ["Ärger über Öl", "Café Señor", "Große Füße", "Crème brûlée",
+         "Plain Title", "Ça ira", "Dvořák: Humoreske", "Blåbærsyltetøy"]
+TAGS  = ['utf8', 'utf16', 'latin1', 'mojibake', 'none']
+
+# benchmark phases (in this order)
+PHASES = ['get_dirinfo cold', 'write_dirinfo cold',
+          'write_dirinfo warm', 'get_dirinfo warm']
+
+# --- application class   ----------------------------------------------------
+
+class App(object):
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self):
+    """ constructor """
+
+    parser = self._get_parser()
+    parser.parse_args(namespace=self)
+    self.root   = os.path.abspath(self.root[0])
+    self.prefix = os.path.abspath(self.prefix)
+    self._random = random.Random(self.seed)
+
+  # --- cmdline-parser   -----------------------------------------------------
+
+  def _get_parser(self):
+    """ configure cmdline-parser """
+
+    parser = ArgumentParser(add_help=False,
+                            description='MP3-library generator and benchmark')
+
+    parser.add_argument('-d', '--depth', type=int, dest='depth',
+      metavar='depth', default=3,
+      help="depth of the directory-tree (default: 3)")
+    parser.add_argument('-w', '--width', type=int, dest='width',
+      metavar='width', default=4,
+      help="subdirectories per directory (default: 4)")
+    parser.add_argument('-f', '--files', type=int, dest='files',
+      metavar='files', default=12,
+      help="files per leaf-directory (default: 12)")
+    parser.add_argument('-s', '--seconds', type=int, dest='seconds',
+      metavar='seconds', default=5,
+      help="duration of every file in seconds (default: 5)")
+    parser.add_argument('-V', '--vbr', type=int, dest='vbr',
+      metavar='percent', default=30,
+      help="percentage of VBR-files (default: 30)")
+    parser.add_argument('-c', '--cue', type=int, dest='cue',
+      metavar='percent', default=5,
+      help="percentage of files with a cue-sheet (default: 5)")
+    parser.add_argument('-r', '--seed', type=int, dest='seed',
+      metavar='seed', default=42,
+      help="seed of the random-generator (default: 42)")
+    parser.add_argument('-P', '--prefix', dest='prefix',
+      metavar='prefix', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),"..","files","usr","local"),
+      help="install-prefix of pi-webradio (default: files/usr/local of repo)")
+    parser.add_argument('-j', '--json', action='store_true',
+      dest='json', default=False,
+      help="print results as json")
+    parser.add_argument('--phase', dest='phase', default=None,
+      help=SUPPRESS)                   # internal: run a single phase
+    parser.add_argument('-h', '--help', action='help',
+      help='print this help')
+
+    parser.add_argument('command', choices=['create','bench'],
+      help='create library or run benchmark')
+    parser.add_argument('root', nargs=1, metavar='root',
+      help='root-directory of the library')
+    return parser
+
+  # --- print message   ------------------------------------------------------
+
+  def msg(self,text):
+    """ print progress-message """
+
+    if not self.json:
+      sys.stderr.write("%s\n" % text)
+      sys.stderr.flush()
+
+  # --- create frame   -------------------------------------------------------
+
+  def _frame(self,index,padding=0,payload=b''):
+    """ return MPEG1 layer III frame (joint-stereo) """
+
+    size   = 144000*BITRATES[index]//RATE + padding
+    header = bytes([0xff,0xfb,(index<<4)|(padding<<1),0x64])
+    return header + payload + bytes(size-len(header)-len(payload))
+
+  # --- create audio-data   --------------------------------------------------
+
+  def _audio(self,vbr):
+    """ return frames for the configured duration """
+
+    count = self.seconds*RATE//SAMPLES
+    if vbr:
+      indices = [self._random.choice([5,7,9,10,11,13]) for _ in range(count)]
+    else:
+      indices = [self._random.choice([9,11,14])]*count
+
+    # padding keeps the average frame-size of 44.1 kHz exact
+    frames = []
+    rest   = 0
+    for index in indices:
+      rest += 144000*BITRATES[index] % RATE
+      padding = 1 if rest >= RATE else 0
+      rest   -= padding*RATE
+      frames.append(self._frame(index,padding))
+    data = b''.join(frames)
+
+    if vbr:
+      # Xing-header in an empty first frame (after 32 bytes side-info)
+      xing = b'Xing' + struct.pack(">III",3,count,len(data)+417)
+      data = self._frame(9,0,bytes(32)+xing) + data
+    return data
+
+  # --- create ID3v2-tag   ---------------------------------------------------
+
+  def _id3(self,variant,artist,album,title,track,tracks,comment):
+    """ return ID3v2.3 (v2.4 for UTF-8) tag with the given texts """
+
+    if variant == 'utf8':
+      version, enc = 4, lambda t: b'\x03' + t.encode('utf-8')
+    elif variant == 'utf16':
+      version, enc = 3, lambda t: b'\x01' + t.encode('utf-16')
+    elif variant == 'latin1':
+      version, enc = 3, lambda t: b'\x00' + t.encode('latin-1','replace')
+    else:                              # UTF-8 bytes declared as latin-1
+      version, enc = 3, lambda t: b'\x00' + t.encode('utf-8')
+
+    def size(n,syncsafe):
+      if syncsafe:
+        return bytes([(n>>21)&0x7f,(n>>14)&0x7f,(n>>7)&0x7f,n&0x7f])
+      return struct.pack(">I",n)
+
+    frames = b''
+    for id,data in [('TPE1',enc(artist)),('TALB',enc(album)),
+                    ('TIT2',enc(title)),('TRCK',enc("%d/%d" % (track,tracks))),
+                    ('COMM',enc("")[:1]+b'eng'+enc("")[1:]+
+                     (b'\x00\x00' if variant == 'utf16' else b'\x00')+
+                     enc(comment)[1:])]:
+      frames += id.encode() + size(len(data),version == 4) + b'\x00\x00' + data
+    frames += bytes(256)               # padding
+    return b'ID3' + bytes([version,0,0]) + size(len(frames),True) + frames
+
+  # --- create cue-sheet   ---------------------------------------------------
+
+  def _cue(self,fname):
+    """ write cue-sheet with a few chapters """
+
+    with open(os.path.splitext(fname)[0]+".cue","w") as f:
+      f.write('FILE "%s" MP3\n' % os.path.basename(fname))
+      for n in range(1,4):
+        start = (n-1)*self.seconds//3
+        f.write('  TRACK %02d AUDIO\n    TITLE "%s"\n'
+                '    INDEX 01 %02d:%02d:00\n' % (n,self._random.choice(TEXTS),
+                                                 start//60,start%60))
+
+  # --- create leaf-directory   ----------------------------------------------
+
+  def _create_dir(self,dir,nr):
+    """ create files of a leaf-directory, return (files,bytes) """
+
+    artist = "%s %d" % (self._random.choice(TEXTS),nr)
+    album  = self._random.choice(TEXTS)
+    dir    = os.path.join(dir,"%s - %s" % (artist,album))
+    os.makedirs(dir,exist_ok=True)
+    size   = 0
+    for track in range(1,self.files+1):
+      title = self._random.choice(TEXTS)
+      fname = os.path.join(dir,"%02d - %s.mp3" % (track,title))
+      vbr   = self._random.randrange(100) < self.vbr
+      tag   = self._random.choice(TAGS)
+      data  = self._audio(vbr)
+      if tag != 'none':
+        data = self._id3(tag,artist,album,title,track,self.files,
+                         "%s, %s" % ("VBR" if vbr else "CBR",tag)) + data
+      with open(fname,"wb") as f:
+        f.write(data)
+      size += len(data)
+      if self._random.randrange(100) < self.cue:
+        self._cue(fname)
+    return self.files,size
+
+  # --- create library   -----------------------------------------------------
+
+  def create(self):
+    """ create directory-tree """
+
+    start = time.monotonic()
+    files = size = dirs = 0
+    paths = [self.root]
+    for level in range(1,self.depth):
+      paths = [os.path.join(p,"Level %d-%d" % (level,n))
+               for p in paths for n in range(1,self.width+1)]
+    for path in paths:
+      for _ in range(self.width):
+        dirs += 1
+        f,s = self._create_dir(path,dirs)
+        files += f
+        size  += s
+    result = {'dirs': dirs, 'files': files, 'bytes': size,
+              'seconds': round(time.monotonic()-start,1)}
+    self.msg("created %d files in %d directories (%.1f MB)" %
+             (files,dirs,size/1024/1024))
+    return result
+
+  # --- run benchmark   ------------------------------------------------------
+
+  def bench(self):
+    """ run all phases in a fresh interpreter """
+
+    for dirpath,_,files in os.walk(self.root):
+      if ".dirinfo" in files:
+        os.remove(os.path.join(dirpath,".dirinfo"))
+
+    result = {}
+    for phase in PHASES:
+      args = [sys.executable,os.path.abspath(__file__),"-P",self.prefix,
+              "--phase",phase,"bench",self.root]
+      out  = subprocess.run(args,capture_output=True,text=True,check=True)
+      result[phase] = json.loads(out.stdout)
+      self.msg("%-20s %8.1f files/sec %8d kB peak RSS" %
+               (phase,result[phase]['files_sec'],result[phase]['rss_peak_kb']))
+    return result
+
+  # --- run single phase   ---------------------------------------------------
+
+  def run_phase(self):
+    """ run phase with MP3Info and return statistics """
+
+    sys.path.insert(0,os.path.join(self.prefix,"lib"))
+    from webradio import Api, Metrics, MP3Info
+    logging.getLogger("webradio").setLevel(logging.WARNING)
+
+    # minimal application-context for MP3Info
+    self.debug      = False
+    self.parser     = configparser.RawConfigParser()
+    self.stop_event = threading.Event()
+    self.api        = Api(self)
+    self.metrics    = Metrics(self)
+    mp3info         = MP3Info(self)
+
+    dirs  = []
+    files = 0
+    for dirpath,_,names in os.walk(self.root):
+      dirs.append(dirpath)
+      files += len([f for f in names if f.endswith(".mp3")])
+
+    # get_dirinfo keeps all results (like a long running service)
+    rss   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    if self.phase.startswith("write_dirinfo"):
+      mp3info.write_dirinfo(self.root)
+    else:
+      infos = [mp3info.get_dirinfo(dir) for dir in dirs]
+    duration = time.monotonic()-start
+    self.stop_event.set()
+    return {'dirs':        len(dirs),
+            'files':       files,
+            'seconds':     round(duration,3),
+            'files_sec':   round(files/duration,1),
+            'rss_start_kb':rss,
+            'rss_peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+  # --- run command   --------------------------------------------------------
+
+  def run(self):
+    """ run command """
+
+    if self.phase:
+      print(json.dumps(self.run_phase()))
+      return
+    result = getattr(self,self.command)()
+    if self.json:
+      print(json.dumps(result,indent=2))
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == '__main__':
+
+  # set local to default from environment
+  locale.setlocale(locale.LC_ALL, '')
+
+  app = App()
+  app.run()
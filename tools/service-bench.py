@@ -0,0 +1,576 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Benchmark of the pi-webradio service.
+#
+# The script runs WebRadio (server-mode) in a temporary environment with a
+# scripted fake mpg123 (remote-mode) and a local http stream-server and
+# measures:
+#
+#   switch:   latency of channel-switches (/api/radio_play_channel)
+#   api:      round-trip latency of API-calls with N concurrent clients
+#   sse:      fan-out of events to M SSE-consumers (/api/get_events)
+#   dirinfo:  get_dirinfo on a synthetic library (cold and warm)
+#   recorder: throughput of the recorder
+#
+# Results (latencies in milliseconds) are written as json.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# ----------------------------------------------------------------------------
+
+import locale, os, sys, time, json, socket, shutil, tempfile, threading
+import traceback, statistics, platform, http.client, http.server, socketserver
+from   argparse import ArgumentParser
+
+BENCHMARKS = ['switch','api','sse','dirinfo','recorder']
+
+# MPEG1 layer III frame (128 kbit/s, 44.1 kHz, 417 bytes, 26 ms)
+FRAME      = b'\xff\xfb\x90\x64' + bytes(413)
+FRAME_RATE = 16000                             # bytes per second
+
+# scripted mpg123 in remote-mode. Loading an url reads the first bytes of
+# the stream before reporting "playing", like the real mpg123
+FAKE_MPG123 = r'''#!%s
+import sys, time, threading, urllib.request
+state = {'play': False, 'secs': 0.0}
+lock  = threading.Lock()
+
+def out(line):
+  sys.stdout.write(line+"\n")
+  sys.stdout.flush()
+
+def frames():
+  while True:
+    time.sleep(0.5)
+    with lock:
+      if state['play']:
+        state['secs'] += 0.5
+        out("@F 0 0 %%.2f %%.2f" %% (state['secs'],300-state['secs']))
+
+def load(url):
+  if url.startswith("http"):
+    try:
+      with urllib.request.urlopen(url,timeout=5) as stream:
+        stream.read(4096)
+    except Exception:
+      out("@E could not open %%s" %% url)
+  state['secs'] = 0.0
+
+threading.Thread(target=frames,daemon=True).start()
+out("@R MPG123 (fake)")
+for line in sys.stdin:
+  cmd = line.split()
+  if not cmd:
+    continue
+  with lock:
+    if cmd[0] in ("LOAD","LOADLIST"):
+      load(cmd[-1])
+      state['play'] = True
+      out("@P 2")
+    elif cmd[0] == "LOADPAUSED":
+      load(cmd[-1])
+      state['play'] = False
+      out("@P 1")
+    elif cmd[0] == "STOP":
+      state['play'] = False
+      out("@P 0")
+    elif cmd[0] == "PAUSE":
+      state['play'] = not state['play']
+      out("@P 2" if state['play'] else "@P 1")
+    elif cmd[0] == "SAMPLE":
+      out("@SAMPLE %%d 13230000" %% int(44100*state['secs']))
+    elif cmd[0] == "JUMP":
+      state['secs'] = float(cmd[1].rstrip('s'))
+      out("@J 0")
+    elif cmd[0] == "QUIT":
+      break
+''' % sys.executable
+
+CONFIG = """
+[GLOBAL]
+debug: 0
+channel_file: {dir}/channels.json
+slow_call: 0
+
+[WEB]
+host: 127.0.0.1
+port: {port}
+
+[RADIO]
+probe_interval: 0
+
+[RECORD]
+dir: {dir}/rec
+
+[PLAYER]
+player_root_dir: {dir}/music
+search_db: {dir}/search.db
+"""
+
+# --- helper class for options of WebRadio   ---------------------------------
+
+class Options(object):
+  pass
+
+# --- stream-server   --------------------------------------------------------
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+  """ serve an endless mp3-stream: /live/<nr> with the bitrate of the
+      stream, /fast/<mb> mb megabytes as fast as possible
+  """
+
+  protocol_version = 'HTTP/1.0'
+
+  def log_message(self,*args):
+    pass
+
+  def do_GET(self):
+    self.send_response(200)
+    self.send_header('Content-Type','audio/mpeg')
+    self.end_headers()
+    chunk = FRAME*40
+    try:
+      if self.path.startswith('/fast/'):
+        size = int(self.path[6:])*1024*1024
+        sent = 0
+        while sent < size:
+          self.wfile.write(chunk)
+          sent += len(chunk)
+        self.wfile.flush()
+        while True:                    # keep connection open (no reconnect)
+          time.sleep(1)
+      else:
+        start = time.monotonic()
+        sent  = 0
+        while True:
+          self.wfile.write(chunk)
+          sent += len(chunk)
+          delay = sent/FRAME_RATE - (time.monotonic()-start)
+          if delay > 0:
+            time.sleep(delay)
+    except OSError:
+      pass
+
+class StreamServer(socketserver.ThreadingMixIn,http.server.HTTPServer):
+  daemon_threads      = True
+  allow_reuse_address = True
+
+# --- application class   ----------------------------------------------------
+
+class App(object):
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self):
+    """ constructor """
+
+    parser = self._get_parser()
+    parser.parse_args(namespace=self)
+    self.prefix  = os.path.abspath(self.prefix)
+    self.results = {'meta': {
+      'time':     time.strftime("%Y-%m-%d %H:%M:%S"),
+      'host':     platform.node(),
+      'machine':  platform.machine(),
+      'python':   platform.python_version(),
+      'options':  {k: getattr(self,k) for k in
+                   ['benchmarks','switches','clients','requests','api',
+                    'consumers','events','rate','dirs','files','rec_size']}
+      }}
+
+  # --- cmdline-parser   -----------------------------------------------------
+
+  def _get_parser(self):
+    """ configure cmdline-parser """
+
+    parser = ArgumentParser(add_help=False,description='Service-Benchmark')
+
+    parser.add_argument('-P', '--prefix', dest='prefix',
+      metavar='prefix', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),"..","files","usr","local"),
+      help="install-prefix of pi-webradio (default: files/usr/local of repo)")
+    parser.add_argument('-s', '--switches', type=int, dest='switches',
+      metavar='switches', default=20,
+      help="number of channel-switches (default: 20)")
+    parser.add_argument('-c', '--clients', type=int, dest='clients',
+      metavar='clients', default=4,
+      help="number of concurrent API-clients (default: 4)")
+    parser.add_argument('-n', '--requests', type=int, dest='requests',
+      metavar='requests', default=100,
+      help="number of API-calls per client (default: 100)")
+    parser.add_argument('-a', '--api', dest='api',
+      metavar='api', default='radio_get_channels',
+      help="API used for round-trips (default: radio_get_channels)")
+    parser.add_argument('-m', '--consumers', type=int, dest='consumers',
+      metavar='consumers', default=10,
+      help="number of SSE-consumers (default: 10)")
+    parser.add_argument('-e', '--events', type=int, dest='events',
+      metavar='events', default=500,
+      help="number of events for the SSE-benchmark (default: 500)")
+    parser.add_argument('-r', '--rate', type=int, dest='rate',
+      metavar='rate', default=200,
+      help="events per second for the SSE-benchmark (default: 200)")
+    parser.add_argument('-D', '--dirs', type=int, dest='dirs',
+      metavar='dirs', default=10,
+      help="number of directories of the synthetic library (default: 10)")
+    parser.add_argument('-F', '--files', type=int, dest='files',
+      metavar='files', default=20,
+      help="number of files per directory (default: 20)")
+    parser.add_argument('-R', '--rec-size', type=int, dest='rec_size',
+      metavar='MB', default=32,
+      help="size of the recording in MB (default: 32)")
+    parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+      metavar='timeout', default=60,
+      help="timeout for a single benchmark in seconds (default: 60)")
+    parser.add_argument('-o', '--output', dest='output',
+      metavar='file', default=None,
+      help="write results to file (default: stdout)")
+    parser.add_argument('-k', '--keep', action='store_true',
+      dest='keep', default=False,
+      help="keep the temporary directory")
+    parser.add_argument('-h', '--help', action='help',
+      help='print this help')
+
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+      default=BENCHMARKS, help="benchmarks to run (default: all of %s)" %
+      ", ".join(BENCHMARKS))
+    return parser
+
+  # --- print message   ------------------------------------------------------
+
+  def msg(self,text):
+    """ print progress-message """
+
+    sys.stderr.write("%s\n" % text)
+    sys.stderr.flush()
+
+  # --- statistics of latencies   --------------------------------------------
+
+  def _stats(self,values):
+    """ return statistics of values (seconds) in milliseconds """
+
+    if not values:
+      return {'n': 0}
+    values = sorted(1000*v for v in values)
+    def pct(p):
+      return round(values[min(len(values)-1,int(p*len(values)))],2)
+    return {'n':    len(values),
+            'min':  round(values[0],2),
+            'mean': round(statistics.mean(values),2),
+            'p50':  pct(0.50),
+            'p95':  pct(0.95),
+            'p99':  pct(0.99),
+            'max':  round(values[-1],2)}
+
+  # --- find free port   -----------------------------------------------------
+
+  def _free_port(self):
+    """ return a free local port """
+
+    with socket.socket() as s:
+      s.bind(('127.0.0.1',0))
+      return s.getsockname()[1]
+
+  # --- create temporary environment   ---------------------------------------
+
+  def _setup(self):
+    """ create config, channels, library and fake mpg123 """
+
+    self._dir = tempfile.mkdtemp(prefix="webradio-bench-")
+    for d in ['bin','home','music','rec']:
+      os.mkdir(os.path.join(self._dir,d))
+
+    mpg123 = os.path.join(self._dir,"bin","mpg123")
+    with open(mpg123,"w") as f:
+      f.write(FAKE_MPG123)
+    os.chmod(mpg123,0o755)
+
+    self._stream = StreamServer(('127.0.0.1',0),StreamHandler)
+    threading.Thread(target=self._stream.serve_forever,daemon=True).start()
+    url = "http://127.0.0.1:%d" % self._stream.server_address[1]
+    channels = [{'name': "Channel %d" % i, 'url': "%s/live/%d" % (url,i),
+                 'logo': None} for i in range(1,5)]
+    channels.append({'name': "Fast", 'url': "%s/fast/%d" % (url,self.rec_size),
+                     'logo': None})
+    with open(os.path.join(self._dir,"channels.json"),"w") as f:
+      json.dump(channels,f)
+
+    self._port   = self._free_port()
+    self._config = os.path.join(self._dir,"pi-webradio.conf")
+    with open(self._config,"w") as f:
+      f.write(CONFIG.format(dir=self._dir,port=self._port))
+
+    self._create_library(os.path.join(self._dir,"music"))
+
+  # --- create synthetic library   -------------------------------------------
+
+  def _create_library(self,root):
+    """ create dirs directories with files (CBR, ID3v2-tag) each """
+
+    import eyed3
+    frames = FRAME*(10*FRAME_RATE//len(FRAME))                # 10 seconds
+    eyed3.log.setLevel("ERROR")
+    for d in range(1,self.dirs+1):
+      dir = os.path.join(root,"Artist %d - Album %d" % (d,d))
+      os.mkdir(dir)
+      for n in range(1,self.files+1):
+        fname = os.path.join(dir,"%02d - Title %d.mp3" % (n,n))
+        with open(fname,"wb") as f:
+          f.write(frames)
+        audio = eyed3.load(fname)
+        audio.initTag()
+        audio.tag.artist    = "Artist %d" % d
+        audio.tag.album     = "Album %d" % d
+        audio.tag.title     = "Title %d" % n
+        audio.tag.track_num = (n,self.files)
+        audio.tag.save()
+
+  # --- start service   ------------------------------------------------------
+
+  def _start(self):
+    """ start WebRadio in server-mode """
+
+    os.environ['HOME'] = os.path.join(self._dir,"home")
+    os.environ['PATH'] = os.path.join(self._dir,"bin") + os.pathsep + \
+                                                          os.environ['PATH']
+    sys.path.insert(0,os.path.join(self.prefix,"lib"))
+    from webradio import WebRadio
+
+    options = Options()
+    options.do_record = options.do_play = options.do_list = False
+    options.do_info   = None
+    options.debug     = options.quiet = False
+    options.target_dir = None
+    options.duration  = options.channel = 0
+    options.config    = self._config
+    options.pgm_dir   = os.path.join(self.prefix,"bin")
+    self._app = WebRadio(options)
+    self._app.run()
+
+    deadline = time.monotonic() + self.timeout
+    while time.monotonic() < deadline:
+      try:
+        socket.create_connection(('127.0.0.1',self._port),1).close()
+        return
+      except OSError:
+        time.sleep(0.1)
+    raise RuntimeError("web-server did not start")
+
+  # --- call API via http   --------------------------------------------------
+
+  def _call(self,api,**args):
+    """ call API and return duration (seconds) """
+
+    query = "&".join("%s=%s" % (k,v) for k,v in args.items())
+    path  = "/api/%s?%s" % (api,query) if query else "/api/%s" % api
+    conn  = http.client.HTTPConnection('127.0.0.1',self._port,
+                                       timeout=self.timeout)
+    start = time.monotonic()
+    conn.request("GET",path)
+    response = conn.getresponse()
+    response.read()
+    duration = time.monotonic()-start
+    conn.close()
+    if response.status != 200:
+      raise RuntimeError("/api/%s failed with status %d" % (api,response.status))
+    return duration
+
+  # --- channel-switch latency   ---------------------------------------------
+
+  def bench_switch(self):
+    """ switch between channels 1-4 """
+
+    values = [self._call("radio_play_channel",nr=i%4+1)
+              for i in range(self.switches)]
+    self._app.api.radio_off()
+    return {'latency_ms': self._stats(values)}
+
+  # --- API round-trip latency   ---------------------------------------------
+
+  def bench_api(self):
+    """ API-calls from concurrent clients """
+
+    values = []
+    errors = []
+    def client():
+      try:
+        for _ in range(self.requests):
+          values.append(self._call(self.api))
+      except Exception as ex:
+        errors.append(repr(ex))
+
+    start   = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(self.clients)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    elapsed = time.monotonic()-start
+    return {'clients':      self.clients,
+            'errors':       len(errors),
+            'requests_sec': round(len(values)/elapsed,1),
+            'latency_ms':   self._stats(values)}
+
+  # --- SSE fan-out   --------------------------------------------------------
+
+  def bench_sse(self):
+    """ publish events with fixed rate to SSE-consumers """
+
+    latencies = []
+    received  = [0]*self.consumers
+    lock      = threading.Lock()
+    ready     = threading.Barrier(self.consumers+1)
+    done      = threading.Event()
+
+    def consumer(i):
+      conn = http.client.HTTPConnection('127.0.0.1',self._port,timeout=5)
+      conn.request("GET","/api/get_events")
+      response = conn.getresponse()
+      ready.wait()
+      try:
+        while not done.is_set():
+          line = response.readline()
+          if not line:
+            break
+          if not line.startswith(b"data: "):
+            continue
+          event = json.loads(line[6:])
+          if event['type'] == 'bench':
+            n,sent = event['value']
+            with lock:
+              latencies.append(time.monotonic()-sent)
+              received[i] += 1
+            if n == self.events-1:
+              break
+      except OSError:
+        pass                           # dropped consumers time out
+      finally:
+        conn.close()
+
+    threads = [threading.Thread(target=consumer,args=(i,))
+               for i in range(self.consumers)]
+    for t in threads:
+      t.start()
+    ready.wait()
+    time.sleep(0.5)                    # consume the initial events
+
+    drops = self._app.metrics.get_metrics().get(
+      'webradio_event_consumer_drops_total',0)
+    start = time.monotonic()
+    for n in range(self.events):
+      delay = start + n/self.rate - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      self._app.api._push_event({'type': 'bench',
+                                 'value': [n,time.monotonic()]})
+    for t in threads:
+      t.join(self.timeout)
+    done.set()
+    elapsed = time.monotonic()-start
+    drops   = self._app.metrics.get_metrics().get(
+      'webradio_event_consumer_drops_total',0) - drops
+    return {'consumers':      self.consumers,
+            'events':         self.events,
+            'rate':           self.rate,
+            'delivered':      sum(received),
+            'delivered_sec':  round(sum(received)/elapsed,1),
+            'dropped_consumers': drops,
+            'latency_ms':     self._stats(latencies)}
+
+  # --- get_dirinfo on synthetic library   -----------------------------------
+
+  def bench_dirinfo(self):
+    """ create dir-info of all directories (cold) and read it again (warm) """
+
+    from webradio import MP3Info
+    mp3info = MP3Info(self._app)
+    root    = os.path.join(self._dir,"music")
+    dirs    = [os.path.join(root,d) for d in sorted(os.listdir(root))
+               if os.path.isdir(os.path.join(root,d))]
+    result  = {'dirs': len(dirs), 'files': len(dirs)*self.files}
+    for run in ['cold','warm']:
+      values = []
+      for dir in dirs:
+        start = time.monotonic()
+        mp3info.get_dirinfo(dir,True)
+        values.append(time.monotonic()-start)
+      result[run] = {'files_sec':  round(result['files']/sum(values),1),
+                     'latency_ms': self._stats(values)}
+    return result
+
+  # --- recorder throughput   ------------------------------------------------
+
+  def bench_recorder(self):
+    """ record the fast channel until rec_size MB are written """
+
+    nr    = len(self._app.api.radio_get_channels())
+    size  = self.rec_size*1024*1024
+    start = time.monotonic()
+    id    = self._app.api.rec_start(nr=nr,duration=1)
+    bytes = 0
+    while time.monotonic()-start < self.timeout:
+      status = [r for r in self._app.api.rec_list() if r['id'] == id]
+      if not status:
+        break
+      bytes = status[0]['bytes']
+      if bytes >= size:
+        break
+      time.sleep(0.01)
+    elapsed = time.monotonic()-start
+    self._app.api.rec_stop(id)
+    return {'bytes':   bytes,
+            'seconds': round(elapsed,3),
+            'mb_sec':  round(bytes/elapsed/1024/1024,1)}
+
+  # --- run all benchmarks   -------------------------------------------------
+
+  def run(self):
+    """ run selected benchmarks """
+
+    self._setup()
+    try:
+      self._start()
+      for name in self.benchmarks:
+        if name not in BENCHMARKS:
+          self.msg("unknown benchmark %s" % name)
+          continue
+        self.msg("running benchmark %s ..." % name)
+        try:
+          self.results[name] = getattr(self,"bench_"+name)()
+        except Exception as ex:
+          self.results[name] = {'error': repr(ex)}
+        self.msg(json.dumps(self.results[name]))
+      self.results['metrics'] = self._app.metrics.get_metrics()
+    finally:
+      if hasattr(self,'_app'):
+        self._app.cleanup()
+      self._stream.shutdown()
+      if self.keep:
+        self.msg("temporary directory: %s" % self._dir)
+      else:
+        shutil.rmtree(self._dir,ignore_errors=True)
+
+    if self.output:
+      with open(self.output,"w") as f:
+        json.dump(self.results,f,indent=2)
+    else:
+      print(json.dumps(self.results,indent=2))
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == '__main__':
+
+  # set local to default from environment
+  locale.setlocale(locale.LC_ALL, '')
+
+  # don't wait for threads of the service or open SSE-connections
+  app = App()
+  try:
+    app.run()
+  except:
+    traceback.print_exc()
+    os._exit(3)
+  os._exit(0)
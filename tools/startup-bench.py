@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Measure import-times of the webradio-package and startup-times of
+# pi-webradio.py (list-mode and time to first audio in play-mode or in
+# server-mode with play_on_boot).
+#
+# Every measurement runs in a fresh interpreter, results are the median
+# of all runs (in milliseconds).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-webradio
+#
+# ----------------------------------------------------------------------------
+
+import locale, os, sys, time, json, subprocess, statistics
+from   argparse import ArgumentParser
+
+# classes of the webradio-package (in order of dependencies)
+CLASSES = ['Base', 'Logger', 'Metrics', 'StateStore', 'IcyStream',
+           'ChannelStore', 'Radio', 'ChannelHealth', 'MP3Info', 'Player',
+           'Search', 'StreamBuffer', 'TimeShift', 'Recorder', 'Scheduler',
+           'Mpg123', 'WebServer', 'WebRadio', 'RadioClient', 'KeyController']
+
+# script to measure the import-time of a class
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0,%r)
+start = time.perf_counter()
+import webradio
+if %r:
+  getattr(webradio,%r)
+print(1000*(time.perf_counter()-start))
+"""
+
+# --- application class   ----------------------------------------------------
+
+class App(object):
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self):
+    """ constructor """
+
+    parser = self._get_parser()
+    parser.parse_args(namespace=self)
+    self.prefix = os.path.abspath(self.prefix)
+    self._lib   = os.path.join(self.prefix,"lib")
+    self._pgm   = os.path.join(self.prefix,"bin","pi-webradio.py")
+    self.results = {}
+
+  # --- cmdline-parser   -----------------------------------------------------
+
+  def _get_parser(self):
+    """ configure cmdline-parser """
+
+    parser = ArgumentParser(add_help=False,description='Startup-Benchmark')
+
+    parser.add_argument('-n', '--runs', type=int, dest='runs',
+      metavar='runs', default=5,
+      help="number of runs per measurement (default: 5)")
+    parser.add_argument('-P', '--prefix', dest='prefix',
+      metavar='prefix', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),"..","files","usr","local"),
+      help="install-prefix of pi-webradio (default: files/usr/local of repo)")
+    parser.add_argument('-p', '--play', dest='channel',
+      metavar='channel', default=None,
+      help="also measure time to first audio of the given channel")
+    parser.add_argument('-b', '--boot', action='store_true',
+      dest='boot', default=False,
+      help="also measure time to first audio in server-mode (play_on_boot: 1)")
+    parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+      metavar='timeout', default=30,
+      help="timeout for a single run in seconds (default: 30)")
+    parser.add_argument('-j', '--json', action='store_true',
+      dest='json', default=False,
+      help="print results as json")
+    parser.add_argument('-h', '--help', action='help',
+      help='print this help')
+    return parser
+
+  # --- print message   ------------------------------------------------------
+
+  def msg(self,text):
+    """ print progress-message """
+
+    if not self.json:
+      sys.stderr.write("%s\n" % text)
+      sys.stderr.flush()
+
+  # --- run measurement several times   --------------------------------------
+
+  def _median(self,name,func):
+    """ run func (returns ms) runs-times and record the median """
+
+    values = []
+    for _ in range(self.runs):
+      value = func()
+      if value is None:
+        self.msg("%-24s failed" % name)
+        return
+      values.append(value)
+    self.results[name] = round(statistics.median(values),1)
+    self.msg("%-24s %8.1f ms" % (name,self.results[name]))
+
+  # --- import-time of a class   ---------------------------------------------
+
+  def _import_time(self,cls):
+    """ import webradio (and cls) in a fresh interpreter """
+
+    script = IMPORT_SCRIPT % (self._lib,cls,cls)
+    try:
+      out = subprocess.run([sys.executable,"-c",script],capture_output=True,
+                           text=True,timeout=self.timeout,check=True).stdout
+      return float(out)
+    except (subprocess.SubprocessError,ValueError):
+      return None
+
+  # --- runtime of list-mode   -----------------------------------------------
+
+  def _list_time(self):
+    """ run pi-webradio.py -l -q """
+
+    start = time.perf_counter()
+    try:
+      subprocess.run([sys.executable,self._pgm,"-l","-q"],
+                     stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,
+                     timeout=self.timeout,check=True)
+    except subprocess.SubprocessError:
+      return None
+    return 1000*(time.perf_counter()-start)
+
+  # --- time to first audio   ------------------------------------------------
+
+  def _play_time(self,args):
+    """ run pi-webradio.py -d args and wait until mpg123 plays """
+
+    start = time.perf_counter()
+    proc  = subprocess.Popen([sys.executable,self._pgm,"-d"]+args,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE,text=True)
+    result = None
+    try:
+      for line in proc.stderr:
+        if "processing line: @P 2" in line:
+          result = 1000*(time.perf_counter()-start)
+          break
+        if time.perf_counter()-start > self.timeout:
+          break
+    finally:
+      proc.terminate()
+      try:
+        proc.wait(5)
+      except subprocess.TimeoutExpired:
+        proc.kill()
+    return result
+
+  # --- run all measurements   -----------------------------------------------
+
+  def run(self):
+    """ run all measurements """
+
+    self._median("import webradio",lambda: self._import_time(""))
+    for cls in CLASSES:
+      self._median("import %s" % cls,lambda: self._import_time(cls))
+    self._median("pi-webradio.py -l",self._list_time)
+    if self.channel:
+      self._median("first audio (-p)",
+                   lambda: self._play_time(["-p",self.channel]))
+    if self.boot:
+      self._median("first audio (boot)",lambda: self._play_time([]))
+    if self.json:
+      print(json.dumps(self.results,indent=2))
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == '__main__':
+
+  # set local to default from environment
+  locale.setlocale(locale.LC_ALL, '')
+
+  app = App()
+  app.run()